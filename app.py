@@ -1,8 +1,12 @@
 import streamlit as st
 from st_pages import add_page_title, get_nav_from_toml
+from utils.prewarm import PREWARM, start_prewarm
 
 st.set_page_config(layout="wide")
 
+if PREWARM:
+    start_prewarm()
+
 # sections = st.sidebar.toggle("Sections", value=True, key="use_sections")
 
 nav = get_nav_from_toml(".streamlit/pages_sections.toml")
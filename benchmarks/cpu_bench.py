@@ -0,0 +1,263 @@
+"""
+CPU benchmark of the training and evaluation paths, without Streamlit.
+
+    python benchmarks/cpu_bench.py --output bench.json
+    python benchmarks/cpu_bench.py --archs ResNet18 alexnet --output bench.json --baseline baseline.json
+    python benchmarks/cpu_bench.py --compare bench.json baseline.json
+
+For every architecture x transform of the training engine it fine-tunes a model
+on synthetic mel spectrograms (generated with components/spectrogram.py, so
+they have the shape and colors of the dataset PNGs) and measures:
+
+- time to first batch: from listing the images to the first training batch
+- training throughput (images/s) of the head phase and of the full network
+- peak RSS of the process
+- single-clip and batched evaluation latency (p50/p95/p99), going through
+  `predict_audios` like the Evaluation page, from WAV bytes to probabilities
+
+Each case runs in its own process, so peak memory is not shared between cases.
+Models are built without pretrained weights (nothing is downloaded); this does
+not change the cost of a step. With --baseline (or --compare), metrics worse
+than the baseline by more than --tolerance are reported as regressions and the
+exit code is 1.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+LABELS = ("bonafide", "vocoder")
+# Metrics compared against the baseline; True when higher is better
+METRICS = {
+    "time_to_first_batch_s": False,
+    "head_images_per_s": True,
+    "train_images_per_s": True,
+    "peak_rss_mb": False,
+    "single_p50_ms": False,
+    "single_p95_ms": False,
+    "single_p99_ms": False,
+    "batch_p50_ms": False,
+    "batch_p95_ms": False,
+    "batch_p99_ms": False,
+}
+
+
+def synthetic_clip(rng, label, seconds=1.0, sr=22050) -> np.ndarray:
+    """A voiced-like harmonic sweep; the 'vocoder' clips get a buzzy high band on top."""
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = rng.uniform(90, 220) * (1 + 0.2 * np.sin(2 * np.pi * rng.uniform(0.5, 3) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    audio = sum(np.sin(k * phase) / k for k in range(1, 8))
+    if label == "vocoder":
+        audio += 0.3 * np.sign(np.sin(2 * np.pi * rng.uniform(3000, 5000) * t))
+    audio += 0.05 * rng.standard_normal(len(t))
+    return (audio / np.abs(audio).max()).astype(np.float32)
+
+
+def wav_bytes(audio, sr=22050) -> bytes:
+    import soundfile as sf
+
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, sr, format="WAV")
+    return buffer.getvalue()
+
+
+def make_dataset(root, images_per_label, seed=0) -> list:
+    """Writes `images_per_label` spectrogram PNGs per label under root/<label>/."""
+    from PIL import Image
+    from components.spectrogram import mel_image
+
+    rng = np.random.default_rng(seed)
+    paths = []
+    for label in LABELS:
+        os.makedirs(os.path.join(root, label), exist_ok=True)
+        for i in range(images_per_label):
+            path = os.path.join(root, label, f"{i:05d}.png")
+            Image.fromarray(mel_image(synthetic_clip(rng, label))).save(path)
+            paths.append(path)
+    return paths
+
+
+def percentiles(latencies, prefix) -> dict:
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {f"{prefix}_p50_ms": p50, f"{prefix}_p95_ms": p95, f"{prefix}_p99_ms": p99}
+
+
+def bench_case(architecture_name, transform_type, data_dir, epochs, bs, eval_runs, eval_bs, threads) -> dict:
+    """Runs one architecture x transform. Executed in a fresh process."""
+    import torch
+    from pathlib import Path
+    from fastai.vision.all import ImageDataLoaders, vision_learner, load_learner, F1Score, Callback, get_image_files
+    from components.training import ARCHITECTURES, TRANSFORMS, label_func
+    from components.profiler import ProfilerCallback, peak_rss_mb
+    from components.inference import predict_audios
+
+    if threads:
+        torch.set_num_threads(threads)
+    if "fork" in multiprocessing.get_all_start_methods():
+        # This process was spawned, and so would be the DataLoader workers, re-importing
+        # torch and fastai on every get_preds. Start them as the Streamlit server does.
+        multiprocessing.set_start_method("fork", force=True)
+
+    class FirstBatchCallback(Callback):
+        def __init__(self):
+            self.time = None
+
+        def before_batch(self):
+            if self.training and self.time is None:
+                self.time = time.perf_counter()
+
+    start = time.perf_counter()
+    dls = ImageDataLoaders.from_path_func(
+        path=data_dir,
+        fnames=get_image_files(data_dir),
+        label_func=label_func,
+        bs=bs,
+        valid_pct=0.3,
+        seed=42,
+        item_tfms=TRANSFORMS[transform_type],
+    )
+    learn = vision_learner(dls, ARCHITECTURES[architecture_name], pretrained=False, metrics=F1Score(average='macro'), path=data_dir)
+    profiler, first_batch = ProfilerCallback(), FirstBatchCallback()
+    with learn.no_bar(), learn.no_logging():
+        learn.fine_tune(epochs, cbs=[profiler, first_batch])
+
+    def throughput(fit):
+        # The first batch of each epoch also pays for starting the DataLoader: left out
+        rows = [r for r in profiler.rows if r["fit"] == fit and r["split"] == "train" and r["batch"] > 0]
+        return sum(r["images"] for r in rows) / sum(r["total"] for r in rows) if rows else None
+
+    result = {
+        "time_to_first_batch_s": first_batch.time - start,
+        "head_images_per_s": throughput(0),
+        "train_images_per_s": throughput(1),
+    }
+
+    # Evaluation: same path as the Evaluation page, from the exported model.pkl
+    learn.export("model.pkl")
+    learner = load_learner(Path(data_dir) / "model.pkl")
+    rng = np.random.default_rng(1)
+    clips = [wav_bytes(synthetic_clip(rng, LABELS[i % 2])) for i in range(eval_bs)]
+    with learner.no_bar():
+        single, batch = [], []
+        for i in range(eval_runs + 2):  # the first 2 runs are warm-up
+            t = time.perf_counter()
+            predict_audios(learner, None, [clips[i % len(clips)]], bs=eval_bs)
+            single.append(time.perf_counter() - t)
+        for i in range(max(3, eval_runs // 4) + 2):
+            t = time.perf_counter()
+            predict_audios(learner, None, clips, bs=eval_bs)
+            batch.append(time.perf_counter() - t)
+    result |= percentiles(single[2:], "single") | percentiles(batch[2:], "batch")
+    result["batch_per_clip_ms"] = result["batch_p50_ms"] / eval_bs
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run(args) -> dict:
+    import torch
+    import fastai
+    from components.training import ARCHITECTURES, TRANSFORMS
+
+    architectures = args.archs or list(ARCHITECTURES)
+    transforms = args.transforms or list(TRANSFORMS)
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "fastai": fastai.__version__,
+            "threads": args.threads or torch.get_num_threads(),
+            "params": {key: getattr(args, key) for key in ("images", "epochs", "bs", "eval_runs", "eval_bs")},
+        },
+        "results": {},
+    }
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as root:
+        make_dataset(root, args.images // len(LABELS))
+        for architecture_name in architectures:
+            for transform_type in transforms:
+                case = f"{architecture_name}/{transform_type}"
+                print(f"⏳ {case}", flush=True)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    try:
+                        result = pool.submit(bench_case, architecture_name, transform_type, root, args.epochs, args.bs, args.eval_runs, args.eval_bs, args.threads).result()
+                    except Exception as e:
+                        print(f"❌ {case}: {str(e)}", flush=True)
+                        result = {"error": str(e)}
+                report["results"][case] = result
+                if "error" not in result:
+                    print(f"✅ {case}: {result['train_images_per_s']:.1f} images/s, single clip p50 {result['single_p50_ms']:.1f} ms", flush=True)
+    return report
+
+
+def compare(current, baseline, tolerance) -> list:
+    """Prints the relative change of every metric and returns the regressions."""
+    regressions = []
+    for case, result in current["results"].items():
+        reference = baseline["results"].get(case)
+        if reference is None or "error" in result or "error" in reference:
+            continue
+        print(case)
+        for metric, higher_is_better in METRICS.items():
+            new, old = result.get(metric), reference.get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "❌" if worse > tolerance else "  "
+            print(f"  {flag} {metric:24s} {old:10.2f} -> {new:10.2f} ({change:+.1%})")
+            if worse > tolerance:
+                regressions.append((case, metric, old, new))
+    print(f"{len(regressions)} regression(s) above {tolerance:.0%}.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--archs", nargs="+", help="Architectures to run (default: all)")
+    parser.add_argument("--transforms", nargs="+", help="Transforms to run (default: all)")
+    parser.add_argument("--images", type=int, default=128, help="Synthetic spectrograms, split between the labels")
+    parser.add_argument("--epochs", type=int, default=1, help="Epochs of the full network, after the head epoch")
+    parser.add_argument("--bs", type=int, default=16, help="Training batch size")
+    parser.add_argument("--eval-runs", type=int, default=20, help="Single-clip evaluations per case")
+    parser.add_argument("--eval-bs", type=int, default=16, help="Clips per batched evaluation")
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads in every case")
+    parser.add_argument("--output", default="benchmarks/results.json")
+    parser.add_argument("--baseline", help="Previous JSON output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change reported as a regression")
+    parser.add_argument("--compare", nargs=2, metavar=("CURRENT", "BASELINE"), help="Only compare two JSON outputs")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            current, baseline = json.load(f), json.load(g)
+    else:
+        current = run(args)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results saved in {args.output}")
+        if not args.baseline:
+            return
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    sys.exit(1 if compare(current, baseline, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Import time of the pages and modules of the app, each in a fresh interpreter.
+
+    python benchmarks/import_time.py --output benchmarks/imports.json
+    python benchmarks/import_time.py --output imports.json --baseline benchmarks/imports.json
+
+For every page, the imports at the top of the file are run (not the page
+itself, which needs a Streamlit session); every module of components/, utils/
+and context/ is imported on its own. Each target is measured with
+`python -X importtime` and the report gives its total import time and the
+packages that take the most of it. With --baseline (or --compare), targets
+slower than the baseline by more than --tolerance (and --min-ms) are reported
+as regressions and the exit code is 1.
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKER = "-- import_time start --"
+
+
+def page_imports(path) -> str:
+    """The top-level import statements of a page."""
+    with open(path) as f:
+        source = f.read()
+    return "\n".join(ast.get_source_segment(source, node) for node in ast.parse(source).body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def targets() -> dict:
+    """Target name -> code to import it."""
+    found = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "pages", "*.py"))):
+        found[os.path.relpath(path, ROOT)] = page_imports(path)
+    for package in ("components", "utils", "context"):
+        for path in sorted(glob.glob(os.path.join(ROOT, package, "*.py"))):
+            module = f"{package}.{os.path.basename(path)[:-3]}"
+            found[module] = f"import {module}"
+    return found
+
+
+def parse_importtime(stderr) -> list:
+    """(package, self seconds, cumulative seconds, depth) for every import after the marker."""
+    rows = []
+    lines = stderr.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return rows
+
+
+def measure(code, top=5) -> dict:
+    """Imports `code` in a fresh interpreter."""
+    script = f"import sys\nsys.stderr.write({MARKER!r} + '\\n')\n{code}\n"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"}
+
+    rows = parse_importtime(proc.stderr)
+    depth = min((row[3] for row in rows), default=0)
+    packages = {}
+    for name, self_s, _, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + self_s
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total_ms": sum(row[2] for row in rows if row[3] == depth) * 1000,
+        "modules": len(rows),
+        "heaviest": {package: seconds * 1000 for package, seconds in heaviest},
+    }
+
+
+def run(args) -> dict:
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for name, code in targets().items():
+        if args.only and not any(pattern in name for pattern in args.only):
+            continue
+        # The median run, to leave out a cold disk cache
+        runs = [measure(code) for _ in range(args.repeat)]
+        if any("error" in result for result in runs):
+            result = next(result for result in runs if "error" in result)
+            print(f"❌ {name}: {result['error']}", flush=True)
+        else:
+            result = sorted(runs, key=lambda result: result["total_ms"])[len(runs) // 2]
+            heaviest = ", ".join(f"{package} {ms:.0f}" for package, ms in result["heaviest"].items())
+            print(f"{result['total_ms']:9.0f} ms  {name:32s} ({result['modules']} modules; {heaviest})", flush=True)
+        report["results"][name] = result
+    return report
+
+
+def compare(current, baseline, tolerance, min_ms) -> list:
+    """Prints the change of every target and returns the regressions."""
+    regressions = []
+    for name, result in current["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None or "error" in result or "error" in reference:
+            continue
+        new, old = result["total_ms"], reference["total_ms"]
+        worse = new - old > max(min_ms, tolerance * old)
+        print(f"{'❌' if worse else '  '} {name:32s} {old:9.0f} -> {new:9.0f} ms ({(new - old) / max(old, 1e-9):+.1%})")
+        if worse:
+            regressions.append((name, old, new))
+    print(f"{len(regressions)} regression(s) above {tolerance:.0%} and {min_ms:g} ms.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", nargs="+", help="Only targets containing one of these strings, e.g. pages/ components.model")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per target; the median is kept")
+    parser.add_argument("--output", default="benchmarks/imports.json")
+    parser.add_argument("--baseline", help="Previous JSON output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="Relative slowdown reported as a regression")
+    parser.add_argument("--min-ms", type=float, default=100, help="Slowdowns smaller than this are never regressions")
+    parser.add_argument("--compare", nargs=2, metavar=("CURRENT", "BASELINE"), help="Only compare two JSON outputs")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            current, baseline = json.load(f), json.load(g)
+    else:
+        current = run(args)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results saved in {args.output}")
+        if not args.baseline:
+            return
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    sys.exit(1 if compare(current, baseline, args.tolerance, args.min_ms) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Training throughput with the per-batch UI callbacks vs. the ring buffer telemetry.
+
+The callbacks talk to a live page, so this benchmark is a Streamlit script:
+
+    streamlit run benchmarks/telemetry_bench.py
+
+It trains a small CNN on random 128x128 "spectrograms" with each callback set and
+reports the batches per second. Small batches make the UI overhead visible.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import streamlit as st
+import torch
+from torch import nn
+from fastai.vision.all import DataLoader, DataLoaders, Learner, CrossEntropyLossFlat
+
+from components.page_callbacks import TrainingLogCallback, GraphCallback
+from components.telemetry import MetricsRing, TelemetryCallback, TelemetryRenderer
+
+
+def synthetic_dls(n_items, bs, n_classes=2, size=128):
+    x = torch.rand(n_items, 3, size, size)
+    y = torch.randint(0, n_classes, (n_items,))
+    items = list(zip(x, y))
+    return DataLoaders(DataLoader(items, bs=bs, shuffle=True, drop_last=True), DataLoader(items[: n_items // 4], bs=bs))
+
+
+def small_cnn(n_classes=2):
+    return nn.Sequential(
+        nn.Conv2d(3, 8, 3, stride=2, padding=1), nn.ReLU(),
+        nn.Conv2d(8, 16, 3, stride=2, padding=1), nn.ReLU(),
+        nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(16, n_classes),
+    )
+
+
+def run(name, n_items, bs, epochs):
+    st.subheader(name)
+    st.session_state.dataset_info = st.empty()
+    st.session_state.training_out = st.empty()
+    st.session_state.progress = st.progress(0.0)
+    st.session_state.graph = st.empty()
+
+    learn = Learner(synthetic_dls(n_items, bs), small_cnn(), loss_func=CrossEntropyLossFlat())
+    renderer = None
+    if name == "Per-batch callbacks":
+        cbs = [TrainingLogCallback(), GraphCallback()]
+    else:
+        ring = MetricsRing()
+        cbs = [TelemetryCallback(ring)]
+        renderer = TelemetryRenderer(ring, st.session_state.training_out, st.session_state.progress, st.session_state.graph)
+        renderer.start()
+
+    start = time.perf_counter()
+    with learn.no_bar():
+        learn.fit(epochs, 1e-3, cbs=cbs)
+    elapsed = time.perf_counter() - start
+    if renderer is not None:
+        renderer.stop()
+
+    n_batches = epochs * len(learn.dls.train)
+    return {"Callbacks": name, "Batches": n_batches, "Seconds": elapsed, "Batches/s": n_batches / elapsed}
+
+
+st.title("Training telemetry benchmark")
+n_items = st.number_input("Images", min_value=64, value=1024, step=64)
+bs = st.number_input("Batch size", min_value=1, value=4)
+epochs = st.number_input("Epochs", min_value=1, value=2)
+
+if st.button("Run"):
+    results = pd.DataFrame([run(name, n_items, bs, epochs) for name in ("Per-batch callbacks", "Ring buffer telemetry")])
+    st.header("Results")
+    st.dataframe(results, hide_index=True)
+    speedup = results["Batches/s"].iloc[1] / results["Batches/s"].iloc[0]
+    st.metric("Speedup", f"{speedup:.2f}x")
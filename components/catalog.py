@@ -0,0 +1,196 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+CATALOG_PATH = "database/.cache/catalog.sqlite"
+RUN_FILE = "run.json" # settings of a run, written by components/training.py
+REFRESH_SECONDS = 5.0 # a user's folder is scanned again at most this often
+THUMBNAIL_SIZE = (480, 480)
+SCHEMA_VERSION = 2 # the catalog is rebuilt from the runs when it changes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    path         TEXT PRIMARY KEY,
+    user         TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    architecture TEXT,
+    transform    TEXT,
+    size         INTEGER NOT NULL,
+    epochs       INTEGER,
+    train_loss   REAL,
+    valid_loss   REAL,
+    f1_score     REAL,
+    profile      TEXT,
+    images_per_second REAL,
+    created      REAL NOT NULL,
+    signature    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_user ON runs (user, created);
+"""
+COLUMNS = ["name", "architecture", "transform", "size", "epochs", "train_loss", "valid_loss", "f1_score", "profile", "images_per_second", "created"]
+
+
+class RunCatalog:
+    """
+    On-disk index of the trained models of every user (database/<user>/<run>/model.pkl).
+
+    A refresh lists the user's folder and stats each run's model.pkl; only runs
+    whose folder or model.pkl changed are read again (run.json, history.csv).
+    The Profile page then lists runs with an indexed, paginated query instead of
+    walking the folders and reading their files on every rerun.
+    """
+    def __init__(self, database_path="database", catalog_path=CATALOG_PATH) -> None:
+        self.database_path = database_path
+        self.catalog_path = catalog_path
+        self._lock = threading.Lock()
+        self._refreshed = {}  # user -> (time, mtime of the user's folder) of the last refresh
+        os.makedirs(os.path.dirname(catalog_path), exist_ok=True)
+        with self.__connect() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS runs")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.executescript(_SCHEMA)
+
+    def refresh(self, user, force=False) -> int:
+        """Brings the user's runs up to date. Returns the number of runs read again."""
+        user_path = os.path.join(self.database_path, user)
+        user_mtime = os.stat(user_path).st_mtime_ns if os.path.isdir(user_path) else None
+        last, last_mtime = self._refreshed.get(user, (float("-inf"), None))
+        # A new or deleted run changes the mtime of the user's folder: no need to wait then
+        if not force and user_mtime == last_mtime and time.monotonic() - last < REFRESH_SECONDS:
+            return 0
+        with self._lock, self.__connect() as conn:
+            known = dict(conn.execute("SELECT path, signature FROM runs WHERE user = ?", (user,)))
+            seen = set()
+            reread = 0
+            for run_path, signature in self.__runs(user_path):
+                seen.add(run_path)
+                if known.get(run_path) == signature:
+                    continue
+                conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (run_path, user, *self.__read_run(run_path), signature))
+                reread += 1
+            for run_path in set(known) - seen:
+                conn.execute("DELETE FROM runs WHERE path = ?", (run_path,))
+            self._refreshed[user] = (time.monotonic(), user_mtime)
+            return reread
+
+    def count(self, user) -> int:
+        with self.__connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM runs WHERE user = ?", (user,)).fetchone()[0]
+
+    def runs(self, user, limit=None, offset=0) -> pd.DataFrame:
+        """The user's runs, newest first."""
+        query = f"SELECT {', '.join(COLUMNS)} FROM runs WHERE user = ? ORDER BY created DESC, name"
+        params = [user]
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self.__connect() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    @staticmethod
+    def __runs(user_path):
+        """(run folder, signature) of every folder with a model.pkl."""
+        if not os.path.isdir(user_path):
+            return
+        with os.scandir(user_path) as entries:
+            for entry in entries:
+                if not entry.is_dir() or entry.name.startswith("."):
+                    continue
+                try:
+                    model = os.stat(os.path.join(entry.path, "model.pkl"))
+                except FileNotFoundError:
+                    continue
+                yield entry.path, f"{entry.stat().st_mtime_ns}:{model.st_mtime_ns}:{model.st_size}"
+
+    @staticmethod
+    def __read_run(run_path):
+        name = os.path.basename(run_path)
+        model = os.stat(os.path.join(run_path, "model.pkl"))
+        info = read_run_info(run_path)
+        if not info:
+            # Runs trained before run.json: the default name is model_<architecture>_<transform>
+            match = re.fullmatch(r"model_([^_]+)_(.+)", name)
+            info = {"architecture": match.group(1), "transform": match.group(2)} if match else {}
+
+        last = {}
+        try:
+            history = pd.read_csv(os.path.join(run_path, "history.csv")).dropna(subset=["epoch"])
+            if len(history):
+                last = history.iloc[-1].to_dict()
+                last["epochs"] = len(history)
+        except (FileNotFoundError, pd.errors.EmptyDataError, KeyError):
+            pass
+
+        def metric(key):
+            value = last.get(key)
+            return None if value is None or pd.isna(value) else float(value)
+
+        performance = info.get("performance", {})
+        return (name, info.get("architecture"), info.get("transform"), model.st_size, last.get("epochs"),
+                metric("train_loss"), metric("valid_loss"), metric("f1_score"),
+                performance.get("profile"), performance.get("images_per_second"), info.get("created", model.st_mtime))
+
+    @contextmanager
+    def __connect(self):
+        conn = sqlite3.connect(self.catalog_path, timeout=30)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+
+def read_run_info(run_path) -> dict:
+    """run.json of a run; empty for runs trained before it existed."""
+    try:
+        with open(os.path.join(run_path, RUN_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog(user) -> RunCatalog:
+    """Catalog of the server, with `user`'s runs up to date."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = RunCatalog()
+    _catalog.refresh(user)
+    return _catalog
+
+
+def thumbnail(image_path, size=THUMBNAIL_SIZE) -> str | None:
+    """
+    Path of a downscaled copy of a plot (<name>.thumb.png), generated the first
+    time it's asked for and again only when the plot changes. Plots already
+    within `size` are shown as they are. None when there is no plot, e.g. a
+    resumed run that didn't record its losses has no results.png.
+    """
+    from PIL import Image
+
+    if not os.path.exists(image_path):
+        return None
+    root, ext = os.path.splitext(image_path)
+    thumb_path = f"{root}.thumb{ext}"
+    if os.path.exists(thumb_path) and os.path.getmtime(thumb_path) >= os.path.getmtime(image_path):
+        return thumb_path
+    with Image.open(image_path) as image:
+        if image.width <= size[0] and image.height <= size[1]:
+            return image_path  # already small enough
+        image.thumbnail(size)
+        tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, format="PNG", optimize=True)
+    os.replace(tmp_path, thumb_path)
+    return thumb_path
+
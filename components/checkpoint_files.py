@@ -0,0 +1,45 @@
+"""
+Files of the checkpoints of a run (components/checkpoints.py), without torch or
+fastai, so the pages can list the runs to resume without importing them.
+"""
+import glob
+import json
+import os
+
+CHECKPOINT_DIR = "checkpoints"
+LATEST_FILE = "latest.json"
+CHECKPOINT_EVERY = 1 # epochs
+CHECKPOINT_KEEP = 2
+
+
+def checkpoint_files(model_path) -> list:
+    """Checkpoints of a run, oldest first."""
+    return sorted(glob.glob(os.path.join(model_path, CHECKPOINT_DIR, "fit*_epoch*.pth")))
+
+
+def latest_checkpoint(model_path):
+    files = checkpoint_files(model_path)
+    return files[-1] if files else None
+
+
+def remove_checkpoints(model_path) -> None:
+    for path in checkpoint_files(model_path) + [os.path.join(model_path, CHECKPOINT_DIR, LATEST_FILE)]:
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.isdir(os.path.join(model_path, CHECKPOINT_DIR)) and not os.listdir(os.path.join(model_path, CHECKPOINT_DIR)):
+        os.rmdir(os.path.join(model_path, CHECKPOINT_DIR))
+
+
+def resumable_runs(save_path) -> list:
+    """latest.json of every run of `save_path` with a checkpoint, with its "run" name, newest first."""
+    runs = []
+    for info_path in glob.glob(os.path.join(save_path, "*", CHECKPOINT_DIR, LATEST_FILE)):
+        run_path = os.path.dirname(os.path.dirname(info_path))
+        if not checkpoint_files(run_path):
+            continue
+        try:
+            with open(info_path) as f:
+                runs.append(dict(json.load(f), run=os.path.basename(run_path)))
+        except (OSError, json.JSONDecodeError):
+            continue
+    return sorted(runs, key=lambda info: info["created"], reverse=True)
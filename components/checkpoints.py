@@ -0,0 +1,108 @@
+"""
+Checkpoints of a training, to resume it after a crash, a server restart or a
+stop instead of starting over.
+
+Every `every` epochs, `CheckpointCallback` writes checkpoints/fit<f>_epoch<nnn>.pth
+in the run folder: the weights, the optimizer state, the position in the
+one-cycle schedule (fit and epoch), the history of the completed epochs, and
+the settings, seed and train/validation split of the run. Only the last `keep`
+are kept, and checkpoints/latest.json describes the newest one. They are
+deleted once the run completes. Listing and deleting them doesn't need torch
+(components/checkpoint_files.py).
+"""
+import json
+import os
+import time
+import numpy as np
+import torch
+from torch.nn.parallel import DistributedDataParallel
+from fastai.vision.all import Callback, ParamScheduler, L, combined_cos
+from components.checkpoint_files import CHECKPOINT_DIR, LATEST_FILE, CHECKPOINT_EVERY, CHECKPOINT_KEEP, checkpoint_files
+
+
+class CheckpointCallback(Callback):
+    """
+    Pass an instance (not the class) to both fits of fine_tune. A resumed run
+    starts counting at `first_fit`/`first_epoch`, after the checkpointed `history`.
+    `cancelled` is set when a fit was stopped in the middle of an epoch (not by
+    EarlyStoppingCallback, which stops once an epoch is complete).
+    """
+    order = 65  # after the Recorder has logged the epoch
+
+    def __init__(self, model_path, state, every=CHECKPOINT_EVERY, keep=CHECKPOINT_KEEP, first_fit=0, first_epoch=0, history=()) -> None:
+        self.checkpoint_path = os.path.join(model_path, CHECKPOINT_DIR)
+        self.state = state  # params, seed and split of the run
+        self.every = every
+        self.keep = keep
+        self.first_fit = first_fit
+        self.fit_idx = first_fit - 1
+        self.first_epoch = first_epoch
+        self.history = list(history)
+        self.cancelled = False
+
+    def before_fit(self):
+        self.fit_idx += 1
+        self.epoch_offset = self.first_epoch if self.fit_idx == self.first_fit else 0
+        if self.fit_idx != self.first_fit:
+            self.history = []  # like history.csv, only the last fit is kept
+
+    def before_epoch(self):
+        self.validated = False
+
+    def after_validate(self):
+        self.validated = True
+
+    def after_epoch(self):
+        epoch = self.epoch_offset + self.epoch
+        row = dict(zip(self.recorder.metric_names, self.recorder.log))
+        row["epoch"] = epoch
+        self.history.append({k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()})
+        if self.every and ((epoch + 1) % self.every == 0 or epoch + 1 == self.epoch_offset + self.n_epoch):
+            self.save(epoch + 1)
+
+    def after_cancel_fit(self):
+        self.cancelled = self.cancelled or not getattr(self, "validated", True)
+
+    def save(self, completed_epochs) -> None:
+        os.makedirs(self.checkpoint_path, exist_ok=True)
+        name = f"fit{self.fit_idx}_epoch{completed_epochs:03d}.pth"
+        path = os.path.join(self.checkpoint_path, name)
+        info = {
+            "file": name,
+            "fit": self.fit_idx,
+            "epoch": completed_epochs,
+            "n_epoch": self.epoch_offset + self.n_epoch,
+            "params": self.state["params"],
+            "created": time.time(),
+        }
+        model = getattr(self.learn.model, "_orig_mod", self.learn.model)  # torch.compile'd by the 'Compiled' profile
+        model = model.module if isinstance(model, DistributedDataParallel) else model  # wrapped by DistributedTrainer during the fit
+        torch.save(dict(info, **self.state, history=self.history, model=model.state_dict(), opt=self.learn.opt.state_dict()), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        with open(os.path.join(self.checkpoint_path, LATEST_FILE + ".tmp"), "w") as f:
+            json.dump(info, f, indent=2)
+        os.replace(os.path.join(self.checkpoint_path, LATEST_FILE + ".tmp"), os.path.join(self.checkpoint_path, LATEST_FILE))
+        for old in checkpoint_files(os.path.dirname(self.checkpoint_path))[:-self.keep or None]:
+            os.remove(old)
+
+
+def load_checkpoint(path) -> dict:
+    return torch.load(path, map_location="cpu", weights_only=False)
+
+
+def fit_one_cycle_from(learn, n_epoch, start_epoch, lr_max, div=25., div_final=1e5, pct_start=0.25, cbs=None) -> None:
+    """
+    `learn.fit_one_cycle(n_epoch, ...)` resumed after `start_epoch` epochs: trains
+    the remaining epochs on the end of the same schedule. With start_epoch=0 it
+    is fit_one_cycle.
+    """
+    learn.opt.set_hyper('lr', lr_max)
+    lr_max = np.array([h['lr'] for h in learn.opt.hypers])
+    offset, scale = start_epoch / n_epoch, (n_epoch - start_epoch) / n_epoch
+
+    def resumed(sched):
+        return lambda pct: sched(offset + pct * scale)
+
+    scheds = {'lr': resumed(combined_cos(pct_start, lr_max / div, lr_max, lr_max / div_final)),
+              'mom': resumed(combined_cos(pct_start, *learn.moms))}
+    learn.fit(n_epoch - start_epoch, cbs=ParamScheduler(scheds) + L(cbs))
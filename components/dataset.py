@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+import pandas as pd
+
+DATASET_PATH = "/dataset" # /dataset/{noise}/{speaker}/{label}/image.png
+MANIFEST_PATH = "database/.cache/manifest.sqlite"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path    TEXT PRIMARY KEY,
+    label   TEXT NOT NULL,
+    speaker TEXT NOT NULL,
+    noise   TEXT NOT NULL,
+    size    INTEGER NOT NULL,
+    mtime   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_selection ON files (noise, speaker);
+CREATE TABLE IF NOT EXISTS dirs (
+    path  TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+
+def label_func(f):
+    """Label of an image: the name of its folder (/dataset/{noise}/{speaker}/{label}/image.png)."""
+    return f.parent.name
+
+
+class DatasetManifest:
+    """
+    On-disk index of the spectrograms under `dataset_path`.
+
+    The first refresh walks the whole tree; later ones only stat the
+    noise/speaker/label directories and rescan those whose mtime changed
+    (a file was added, removed or renamed). Selections then become an indexed
+    query instead of a directory walk.
+    """
+    def __init__(self, dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH) -> None:
+        self.dataset_path = dataset_path
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with self.__connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def refresh(self) -> int:
+        """Brings the manifest up to date. Returns the number of rescanned label directories."""
+        with self._lock, self.__connect() as conn:
+            known = dict(conn.execute("SELECT path, mtime FROM dirs"))
+            seen = set()
+            rescanned = 0
+
+            for noise, speaker, label, label_dir in self.__label_dirs():
+                seen.add(label_dir)
+                mtime = os.stat(label_dir).st_mtime
+                if known.get(label_dir) == mtime:
+                    continue
+
+                rows = []
+                with os.scandir(label_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                            stat = entry.stat()
+                            rows.append((entry.path, label, speaker, noise, stat.st_size, stat.st_mtime))
+
+                conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (label_dir + os.sep, label_dir + chr(ord(os.sep) + 1)))
+                conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (label_dir, mtime))
+                rescanned += 1
+
+            for label_dir in set(known) - seen:
+                conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (label_dir + os.sep, label_dir + chr(ord(os.sep) + 1)))
+                conn.execute("DELETE FROM dirs WHERE path = ?", (label_dir,))
+
+            return rescanned
+
+    def files(self, speakers, noises) -> list:
+        """Paths of every image of the selected speakers and noise levels, in a stable order."""
+        query, params = self.__selection("SELECT path FROM files", speakers, noises)
+        with self.__connect() as conn:
+            return [Path(path) for (path,) in conn.execute(query + " ORDER BY path", params)]
+
+    def entries(self, speakers, noises) -> pd.DataFrame:
+        """Manifest rows (path, label, speaker, noise, size, mtime) of the selection."""
+        query, params = self.__selection("SELECT * FROM files", speakers, noises)
+        with self.__connect() as conn:
+            return pd.read_sql_query(query + " ORDER BY path", conn, params=params)
+
+    def counts(self, speakers, noises) -> pd.DataFrame:
+        """Number of images per noise level, speaker and label of the selection."""
+        query, params = self.__selection("SELECT noise, speaker, label, COUNT(*) AS images FROM files", speakers, noises)
+        with self.__connect() as conn:
+            return pd.read_sql_query(query + " GROUP BY noise, speaker, label ORDER BY noise, speaker, label", conn, params=params)
+
+    def __selection(self, select, speakers, noises):
+        speakers = [str(s) for s in speakers]
+        noises = [str(n) for n in noises]
+        query = f"{select} WHERE speaker IN ({','.join('?' * len(speakers))}) AND noise IN ({','.join('?' * len(noises))})"
+        return query, speakers + noises
+
+    def __label_dirs(self):
+        for noise in self.__subdirs(self.dataset_path):
+            for speaker in self.__subdirs(os.path.join(self.dataset_path, noise)):
+                for label in self.__subdirs(os.path.join(self.dataset_path, noise, speaker)):
+                    yield noise, speaker, label, os.path.join(self.dataset_path, noise, speaker, label)
+
+    @staticmethod
+    def __subdirs(path):
+        if not os.path.isdir(path):
+            return []
+        with os.scandir(path) as entries:
+            return sorted(e.name for e in entries if e.is_dir() and not e.name.startswith("."))
+
+    @contextmanager
+    def __connect(self):
+        conn = sqlite3.connect(self.manifest_path, timeout=30)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+
+def get_manifest() -> DatasetManifest:
+    """Refreshed manifest of the training dataset."""
+    manifest = DatasetManifest()
+    manifest.refresh()
+    return manifest
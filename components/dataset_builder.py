@@ -0,0 +1,268 @@
+"""
+Builds the spectrogram dataset (/dataset/{noise}/{speaker}/{label}/{clip}.png)
+from the audios of every speaker, without the submodule's serial setup.sh.
+
+Audios are read from `{source}/{speaker}/{label}/*.wav` (the resampled bonafide
+clips and the vocoder outputs) and each one is turned into one PNG per noise
+level by `mel_image` (components/spectrogram.py, checked against
+`generate_single_spec` by tests/test_spectrogram.py), in a process pool.
+`database/.cache/dataset_build.sqlite` remembers, for every PNG, a hash of the
+audio content, the noise level and the spectrogram settings it was made from: a
+later build only generates the PNGs whose recipe changed or that are missing,
+so adding a speaker or a noise level leaves existing outputs untouched. PNGs
+already in the dataset the first time the builder sees them (written by the
+submodule's setup.sh) are adopted as they are, not generated again. The noise is
+seeded by the recipe, so rebuilding a PNG gives the same image.
+
+    python -m components.dataset_builder --source /audio            # SPEAKERS and NOISE_LEVEL_LIST of env.sh
+    python -m components.dataset_builder --source /audio --speakers rms --workers 4
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from components.dataset import DATASET_PATH, get_manifest
+from components.spectrogram import SPEC_CONFIG, PREPROCESSING_VERSION
+
+SOURCE_PATH = os.environ.get("DATASET_SOURCE_PATH", "/audio") # {source}/{speaker}/{label}/clip.wav
+BUILD_STATE_PATH = "database/.cache/dataset_build.sqlite"
+AUDIO_EXTENSIONS = {".wav"}
+PROGRESS_EVERY = 2.0 # seconds
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path    TEXT PRIMARY KEY,
+    size    INTEGER NOT NULL,
+    mtime   INTEGER NOT NULL,
+    sha256  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    path    TEXT PRIMARY KEY,
+    recipe  TEXT NOT NULL,
+    size    INTEGER,
+    mtime   INTEGER
+);
+"""
+
+
+@contextmanager
+def _connect(state_path):
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(state_path, timeout=30)
+    try:
+        with conn:  # commits on success, rolls back on error
+            conn.executescript(_SCHEMA)
+            yield conn
+    finally:
+        conn.close()
+
+
+def noise_folder(noise) -> str:
+    """Name of the /dataset folder of a noise level, as in NOISE_LEVEL_LIST (0, 0.1...)."""
+    noise = float(noise)
+    return str(int(noise)) if noise.is_integer() else str(noise)
+
+
+def source_audios(source_path, speakers) -> list:
+    """(speaker, label, wav path) of every audio of the selected speakers, in a stable order."""
+    audios = []
+    for speaker in speakers:
+        speaker_dir = os.path.join(source_path, speaker)
+        if not os.path.isdir(speaker_dir):
+            raise FileNotFoundError(f"No audios for speaker '{speaker}' in {speaker_dir}")
+        for label in sorted(os.listdir(speaker_dir)):
+            label_dir = os.path.join(speaker_dir, label)
+            if not os.path.isdir(label_dir) or label.startswith("."):
+                continue
+            for name in sorted(os.listdir(label_dir)):
+                if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                    audios.append((speaker, label, os.path.join(label_dir, name)))
+    return audios
+
+
+def _file_hash(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_hashes(conn, paths) -> dict:
+    """Content hash of every audio. Audios whose size and mtime didn't change aren't read again."""
+    known = {path: (size, mtime, sha) for path, size, mtime, sha in conn.execute("SELECT * FROM sources")}
+    hashes = {}
+    for path in paths:
+        stat = os.stat(path)
+        size, mtime, sha = known.get(path, (None, None, None))
+        if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+            sha = _file_hash(path)
+            conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns, sha))
+        hashes[path] = sha
+    return hashes
+
+
+def recipe(audio_sha, noise, config=SPEC_CONFIG) -> str:
+    """Identifies what a PNG was generated from: the audio, the noise level and the spectrogram settings."""
+    settings = json.dumps({"config": config, "version": PREPROCESSING_VERSION, "noise": float(noise)}, sort_keys=True)
+    return hashlib.sha256(f"{audio_sha}|{settings}".encode()).hexdigest()
+
+
+def _up_to_date(row, out_path) -> bool:
+    """The recorded PNG is still on disk as written, or the audio was discarded as too short."""
+    if row is None:
+        return False
+    _, size, mtime = row
+    if size is None:
+        return not os.path.exists(out_path)
+    try:
+        stat = os.stat(out_path)
+    except FileNotFoundError:
+        return False
+    return (stat.st_size, stat.st_mtime_ns) == (size, mtime)
+
+
+def plan(source_path, speakers, noises, dataset_path=DATASET_PATH, state_path=BUILD_STATE_PATH):
+    """
+    Splits the expected PNGs into those that are up to date and those to generate.
+    PNGs the state doesn't know yet are adopted with the current recipe.
+    Returns (tasks, skipped, adopted): one task per audio with at least one PNG
+    to generate, as (wav path, [(noise, PNG path, recipe), ...]).
+    """
+    audios = source_audios(source_path, speakers)
+    with _connect(state_path) as conn:
+        hashes = source_hashes(conn, [wav_path for _, _, wav_path in audios])
+        outputs = {path: (rcp, size, mtime) for path, rcp, size, mtime in conn.execute("SELECT * FROM outputs")}
+
+        tasks, skipped, adopted = [], 0, []
+        for speaker, label, wav_path in audios:
+            name = os.path.splitext(os.path.basename(wav_path))[0] + ".png"
+            pending = []
+            for noise in noises:
+                out_path = os.path.join(dataset_path, noise_folder(noise), speaker, label, name)
+                rcp = recipe(hashes[wav_path], noise)
+                row = outputs.get(out_path)
+                if row is None and os.path.exists(out_path):
+                    stat = os.stat(out_path)
+                    adopted.append((out_path, rcp, stat.st_size, stat.st_mtime_ns))
+                elif row is not None and row[0] == rcp and _up_to_date(row, out_path):
+                    skipped += 1
+                else:
+                    pending.append((float(noise), out_path, rcp))
+            if pending:
+                tasks.append((wav_path, pending))
+        conn.executemany("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)", adopted)
+    return tasks, skipped, len(adopted)
+
+
+def build_audio(wav_path, pending) -> list:
+    """
+    Generates the PNGs of one audio (run in the pool). Returns (PNG path, recipe,
+    size, mtime) for each of them, size and mtime being None for audios too short
+    for a crop.
+    """
+    import numpy as np
+    from PIL import Image
+    from components.spectrogram import load_audio, mel_image
+
+    with open(wav_path, "rb") as f:
+        audio = load_audio(f.read())
+    results = []
+    for noise, out_path, rcp in pending:
+        image = mel_image(audio, noise, np.random.default_rng(int(rcp[:16], 16)))
+        if image is None:
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            results.append((out_path, rcp, None, None))
+            continue
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        tmp_path = f"{out_path}.{os.getpid()}.tmp"
+        Image.fromarray(image).save(tmp_path, format="PNG")
+        os.replace(tmp_path, out_path)
+        stat = os.stat(out_path)
+        results.append((out_path, rcp, stat.st_size, stat.st_mtime_ns))
+    return results
+
+
+def build_dataset(source_path=SOURCE_PATH, speakers=None, noises=None, dataset_path=DATASET_PATH, state_path=BUILD_STATE_PATH,
+                  workers=None, log=print) -> dict:
+    """
+    Generates the missing or outdated PNGs of `speakers` x `noises` (SPEAKERS and
+    NOISE_LEVEL_LIST of env.sh by default) with `workers` processes, and logs the
+    progress. Returns the counts and the throughput of the build.
+    """
+    if speakers is None or noises is None:
+        from utils.config import load_env_from_sh
+        env_speakers, env_noises = load_env_from_sh()
+        speakers = env_speakers if speakers is None else speakers
+        noises = env_noises if noises is None else noises
+    if not speakers or not noises:
+        raise ValueError("No speakers or noise levels to build (see SPEAKERS and NOISE_LEVEL_LIST in env.sh).")
+
+    start = time.perf_counter()
+    tasks, skipped, adopted = plan(source_path, speakers, noises, dataset_path, state_path)
+    total = sum(len(pending) for _, pending in tasks)
+    log(f"⏳ {total} spectrograms to generate, {skipped} up to date, {adopted} existing ones adopted "
+        f"({len(speakers)} speakers x {len(noises)} noise levels).")
+
+    built = discarded = 0
+    if tasks:
+        workers = workers or os.cpu_count() or 1
+        build_start = last_log = time.perf_counter()
+        # Spawned: a fork of a process whose threads hold locks (torch, gloo) can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, _connect(state_path) as conn:
+            futures = [pool.submit(build_audio, wav_path, pending) for wav_path, pending in tasks]
+            for future in as_completed(futures):
+                results = future.result()
+                conn.executemany("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)", results)
+                conn.commit()  # an interrupted build keeps what it already generated
+                built += sum(size is not None for _, _, size, _ in results)
+                discarded += sum(size is None for _, _, size, _ in results)
+                now = time.perf_counter()
+                if now - last_log >= PROGRESS_EVERY or built + discarded == total:
+                    done = built + discarded
+                    log(f"{done}/{total} ({done / total:.0%}), {done / (now - build_start):.1f} spectrograms/s")
+                    last_log = now
+        if dataset_path == DATASET_PATH:
+            get_manifest()  # index the new images before the Training page reads them
+
+    seconds = time.perf_counter() - start
+    report = {
+        "built": built,
+        "discarded": discarded,
+        "skipped": skipped,
+        "adopted": adopted,
+        "seconds": seconds,
+        "spectrograms_per_second": (built + discarded) / seconds if seconds else 0.0,
+    }
+    log(f"✅ {built} generated, {discarded} discarded as too short, {skipped + adopted} up to date in {seconds:.1f}s "
+        f"({report['spectrograms_per_second']:.1f} spectrograms/s).")
+    return report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generates the spectrograms of /dataset from the audios, in parallel and incrementally.")
+    parser.add_argument("--source", default=SOURCE_PATH, help="Audios as <source>/<speaker>/<label>/*.wav")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="Spectrograms are written to <dataset>/<noise>/<speaker>/<label>/")
+    parser.add_argument("--speakers", nargs="+", default=None, help="Default: SPEAKERS of env.sh")
+    parser.add_argument("--noises", nargs="+", type=float, default=None, help="Default: NOISE_LEVEL_LIST of env.sh")
+    parser.add_argument("--workers", type=int, default=None, help="Processes generating spectrograms (default: one per CPU)")
+    args = parser.parse_args()
+
+    try:
+        build_dataset(args.source, args.speakers, args.noises, args.dataset, workers=args.workers)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
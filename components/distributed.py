@@ -0,0 +1,269 @@
+"""
+Distributed data-parallel training on CPU: N processes, on one or several
+hosts, train the same run, each on its share of every batch of images, and
+average their gradients with the gloo backend (DistributedDataParallel).
+
+On one host:
+
+    python -m components.distributed --user alice --nproc 4 --speakers awb,bdl --noises 0 --epochs 5 --bs 32
+
+On several hosts, run the same command on each one, with the same /dataset:
+
+    python -m components.distributed ... --nnodes 2 --node-rank 0 --master-addr host0   # on host0
+    python -m components.distributed ... --nnodes 2 --node-rank 1 --master-addr host0   # on host1
+
+`--bs` is the batch size of every process. Rank 0 (the first process of
+--node-rank 0) gathers the metrics, writes history.csv and exports the model.
+Every run started here adds a row to the user's scaling.csv (images per second
+for the number of processes), shown in the Training page.
+"""
+import math
+import multiprocessing
+import os
+import socket
+import sys
+import time
+import pandas as pd
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from fastai.vision.all import Callback, find_bs, noop, to_detach
+from components.reports import SCALING_FILE, SCALING_COLUMNS, read_scaling, scaling_counts
+
+DDP_BACKEND = "gloo"
+DDP_PORT = 29500
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+
+def rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def broadcast_seed(seed) -> int:
+    """The seed of rank 0, so that every process builds the same train/validation split."""
+    seed = torch.tensor([seed], dtype=torch.int64)
+    dist.broadcast(seed, 0)
+    return int(seed.item())
+
+
+def total_images(images) -> int:
+    """Training images of all the processes."""
+    images = torch.tensor([images], dtype=torch.int64)
+    dist.all_reduce(images)
+    return int(images.item())
+
+
+class _Shard:
+    """
+    `get_idxs` and `to_detach` of a DataLoader whose epochs are shared between
+    the processes. A module-level class, so that spawned DataLoader workers can
+    unpickle the DataLoader.
+    """
+    def __init__(self, dl, rank, world_size) -> None:
+        self.dl, self.rank, self.world_size = dl, rank, world_size
+        self.n = dl.n
+        self.share = math.ceil(self.n / world_size)
+        self.start = self.bs = 0  # position of the current batch in this rank's share
+
+    def get_idxs(self):
+        idxs = list(range(self.n))
+        if self.dl.shuffle:
+            idxs = self.dl.shuffle_fn(idxs)
+        idxs = torch.tensor(idxs, dtype=torch.int64)
+        dist.broadcast(idxs, 0)  # rank 0's shuffle
+        idxs = idxs.repeat(math.ceil(self.share * self.world_size / self.n))[:self.share * self.world_size]
+        return idxs[self.rank * self.share:(self.rank + 1) * self.share].tolist()
+
+    def to_detach(self, b, cpu=True, gather=True):
+        b = to_detach(b, cpu, gather)
+        if not gather:
+            return b
+        # The gathered batch is the batch of every rank in turn: drop the padded positions
+        keep = torch.tensor([r * self.share + self.start + i < self.n for r in range(self.world_size) for i in range(self.bs)])
+
+        def unpad(x):
+            return x[keep] if isinstance(x, torch.Tensor) and x.ndim and len(x) == len(keep) else x
+
+        return type(b)(unpad(x) for x in b) if isinstance(b, (list, tuple)) else unpad(b)
+
+
+class DistributedTrainer(Callback):
+    """
+    Wraps the network in DistributedDataParallel for each fit and gives every
+    process its share of the epoch: rank 0 shuffles, the indices are broadcast
+    and padded to a multiple of the world size, like fastai's DistributedDL
+    (which needs the `accelerate` package). During the fit, WORLD_SIZE is set so
+    that fastai's `to_detach` gathers the losses and predictions of all the
+    processes; the padding is dropped, so every process computes the metrics
+    of the whole validation set. After the fit, rank 0 works alone.
+    """
+    order = -4  # before PersistentWorkers reads the indices and ChannelsLastCPU converts the network
+
+    def before_fit(self):
+        rank, world_size = dist.get_rank(), dist.get_world_size()
+        os.environ["WORLD_SIZE"] = str(world_size)  # read by fastai's num_distrib
+        self.learn.model = DistributedDataParallel(self.model)
+        self.shards = []
+        for dl in self.dls.loaders:
+            shard = _Shard(dl, rank, world_size)
+            dl.n, dl.get_idxs, dl.to_detach = shard.share, shard.get_idxs, shard.to_detach
+            self.shards.append(shard)
+        if rank:
+            self.learn.logger = noop
+
+    def before_validate(self):
+        self.shards[1].start = self.shards[1].bs = 0
+
+    def before_batch(self):
+        if not self.training:
+            valid = self.shards[1]
+            valid.start, valid.bs = valid.start + valid.bs, find_bs(self.yb)
+
+    def after_fit(self):
+        os.environ.pop("WORLD_SIZE", None)
+        self.learn.model = self.learn.model.module
+        for dl, shard in zip(self.dls.loaders, self.shards):
+            dl.n = shard.n
+            del dl.get_idxs, dl.to_detach
+
+
+def _worker(username, params, rank, world_size, master_addr, master_port, threads, log_path) -> None:
+    if log_path is not None:  # the log of the background job
+        sys.stdout = sys.stderr = open(log_path, "a", buffering=1)
+    os.environ.update(MASTER_ADDR=master_addr, MASTER_PORT=str(master_port))
+    torch.set_num_threads(threads)
+    if "fork" in multiprocessing.get_all_start_methods():
+        # A spawned process spawns its DataLoader workers too, which import torch again every epoch
+        multiprocessing.set_start_method("fork", force=True)
+    from components.training import user_engine
+    from components.sinks import ConsoleSink
+
+    dist.init_process_group(DDP_BACKEND, init_method="env://", rank=rank, world_size=world_size)
+    try:
+        sink = ConsoleSink()
+        if rank:
+            sink.info = sink.warning = noop  # rank 0 reports; errors are printed by every rank
+        ok = user_engine(username).train(**params, sink=sink)
+    finally:
+        dist.destroy_process_group()
+    sys.exit(0 if ok else 1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def launch(username, params, nproc, nnodes=1, node_rank=0, master_addr="127.0.0.1", master_port=None) -> bool:
+    """
+    Trains the run described by `params` (arguments of `TrainingEngine.train`,
+    callbacks as strings) with `nproc` processes on this host, as node
+    `node_rank` of `nnodes`. The cores are shared between the processes. On a
+    single host, a free port is used unless `master_port` is given, so that
+    several distributed jobs can run at the same time.
+    """
+    from components.training import user_engine, run_folder
+
+    if master_port is None:
+        master_port = _free_port() if nnodes == 1 else DDP_PORT
+    world_size = nproc * nnodes
+    threads = max(1, (os.cpu_count() or 1) // nproc)
+    log_path = sys.stdout.name if os.path.isfile(str(getattr(sys.stdout, "name", ""))) else None
+    context = multiprocessing.get_context("spawn")
+    procs = [context.Process(target=_worker, args=(username, params, node_rank * nproc + i, world_size, master_addr, master_port, threads, log_path))
+             for i in range(nproc)]
+    for proc in procs:
+        proc.start()
+    while any(proc.is_alive() for proc in procs):
+        if any(proc.exitcode not in (None, 0) for proc in procs):
+            for proc in procs:
+                proc.terminate()  # the others would wait for the failed process in their next collective
+        time.sleep(1)
+    ok = all(proc.exitcode == 0 for proc in procs)
+
+    if ok and node_rank == 0:
+        engine = user_engine(username)
+        record_scaling(engine.save_path, f"{engine.save_path}/{run_folder(params['user_model_name'], params['architecture_name'], params['transform_type'])}",
+                       world_size, nnodes, threads)
+    return ok
+
+
+def record_scaling(save_path, model_path, world_size, nnodes, threads) -> None:
+    """Adds the throughput of a finished run to `save_path`/scaling.csv."""
+    from components.catalog import read_run_info
+
+    info = read_run_info(model_path)
+    performance = info.get("performance", {})
+    row = {
+        "created": time.time(),
+        "run": os.path.basename(model_path),
+        "architecture": info.get("architecture"),
+        "transform": info.get("transform"),
+        "batch_size": info.get("batch_size"),
+        "world_size": world_size,
+        "nnodes": nnodes,
+        "threads": threads,
+        "images_per_second": performance.get("images_per_second"),
+        "train_seconds": performance.get("train_seconds"),
+    }
+    path = os.path.join(save_path, SCALING_FILE)
+    pd.DataFrame([row], columns=SCALING_COLUMNS).to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+
+def main():
+    import argparse
+    from components.training import ARCHITECTURES, TRANSFORMS, eval_callbacks
+    from components.settings import DEFAULT_PROFILE
+
+    parser = argparse.ArgumentParser(description="Trains a model with several processes (DistributedDataParallel, gloo).")
+    parser.add_argument("--user", required=True, help="The model is saved in database/<user>/")
+    parser.add_argument("--name", default="", help="Run name")
+    parser.add_argument("--arch", default="ResNet18", choices=list(ARCHITECTURES))
+    parser.add_argument("--transform", default="Resize", choices=list(TRANSFORMS))
+    parser.add_argument("--speakers", required=True, help="e.g. awb,bdl")
+    parser.add_argument("--noises", default="0", help="e.g. 0,0.1")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--bs", type=int, default=32, help="Batch size of every process")
+    parser.add_argument("--callbacks", nargs="*", default=[], help='e.g. "EarlyStoppingCallback(monitor=\'f1_score\', patience=3)"')
+    parser.add_argument("--use-shards", action="store_true", help="Train on the pre-decoded tensor cache")
+    parser.add_argument("--progressive", action="store_true", help="Train the first epochs on downscaled images")
+    parser.add_argument("--noise-on-the-fly", action="store_true", help="Generate the noise levels from the clean audios instead of reading /dataset")
+    parser.add_argument("--performance", default=DEFAULT_PROFILE, help="Performance profile of components/performance.py")
+    parser.add_argument("--nproc", type=int, default=2, help="Processes on this host")
+    parser.add_argument("--nnodes", type=int, default=1, help="Hosts")
+    parser.add_argument("--node-rank", type=int, default=0, help="Index of this host, 0 on the host of --master-addr")
+    parser.add_argument("--master-addr", default="127.0.0.1")
+    parser.add_argument("--master-port", type=int, default=None, help=f"Default: {DDP_PORT} on several hosts, a free port on one")
+    parser.add_argument("--scaling", action="store_true", help="Train with 1, 2, 4... up to --nproc processes and print the scaling report")
+    args = parser.parse_args()
+    eval_callbacks(args.callbacks)  # fail now rather than in every process
+
+    params = dict(
+        user_model_name=args.name, architecture_name=args.arch, transform_type=args.transform,
+        selected_speakers=args.speakers.split(","), selected_noises=args.noises.split(","), num_epochs=args.epochs, num_batches=args.bs,
+        callbacks=args.callbacks, use_shards=args.use_shards, progressive=args.progressive, performance=args.performance,
+        noise_on_the_fly=args.noise_on_the_fly,
+    )
+    counts = scaling_counts(args.nproc) if args.scaling else [args.nproc]
+    failed = False
+    for nproc in counts:
+        print(f"⏳ {nproc * args.nnodes} processes ({nproc} on this host).", flush=True)
+        failed |= not launch(args.user, params, nproc, args.nnodes, args.node_rank, args.master_addr, args.master_port)
+    if args.node_rank == 0:
+        from components.training import user_engine
+
+        report = read_scaling(user_engine(args.user).save_path)
+        print(report.tail(len(counts))[["run", "world_size", "images_per_second", "speedup", "efficiency"]].to_string(index=False))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
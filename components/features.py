@@ -0,0 +1,138 @@
+"""
+Feature cache of the frozen phase of `fine_tune`.
+
+While the pretrained body is frozen, only the head learns, so the body's output
+for an image doesn't change between epochs or between runs. `build_features`
+computes it once per (architecture, transform, noise, speaker) subset, pooled as
+the head's first layer does (AdaptiveConcatPool2d), and stores it in float16
+next to the tensor cache. `fit_head` then trains the rest of the head on these
+vectors instead of running the whole network on every spectrogram.
+
+Unlike `fine_tune`, the body's BatchNorm layers are not trained in the frozen
+phase, and the features are computed on the validation-style images (center
+crop for 'Random Crop'). The unfrozen phase is unchanged.
+"""
+import json
+import os
+import time
+import numpy as np
+import torch
+from fastai.vision.all import DataLoader, DataLoaders, Learner, F1Score, default_device
+from components.shards import subset_fingerprint
+from components.runtime import normalization_of, preprocess_image, preprocessing_of
+
+FEATURE_DIR = "database/.cache/features"
+FEATURE_BS = 64
+# fine_tune's defaults for the frozen phase
+FREEZE_EPOCHS = 1
+BASE_LR = 2e-3
+
+
+def _features(learn, images, preprocessing, size, mean, std) -> np.ndarray:
+    """Output of the body + pooling + flatten of `learn.model` for a list of PNGs."""
+    body, head = learn.model[0], learn.model[1]
+    mean, std = torch.tensor(mean).view(1, 3, 1, 1), torch.tensor(std).view(1, 3, 1, 1)
+    device = next(learn.model.parameters()).device
+    out = []
+    with torch.inference_mode():
+        for i in range(0, len(images), FEATURE_BS):
+            x = torch.from_numpy(np.stack([preprocess_image(p, preprocessing, size) for p in images[i:i + FEATURE_BS]]))
+            x = ((x.permute(0, 3, 1, 2).float() / 255 - mean) / std).to(device)
+            out.append(head[1](head[0](body(x))).float().cpu().numpy().astype(np.float16))
+    return np.concatenate(out) if out else np.zeros((0, 0), dtype=np.float16)
+
+
+def build_features(manifest, learn, architecture_name, transform_type, item_tfm, noise, speaker, feature_dir=FEATURE_DIR) -> tuple:
+    """
+    Features of every image of a (noise, speaker) subset, computed with the
+    pretrained body of `learn`. Reused while the manifest fingerprint of the
+    subset stays the same. Returns (features, paths, built), `features` being
+    opened read-only with mmap.
+    """
+    subset_dir = os.path.join(feature_dir, f"{architecture_name}_{transform_type.replace(' ', '')}")
+    os.makedirs(subset_dir, exist_ok=True)
+    entries = manifest.entries([speaker], [noise])
+    fingerprint = subset_fingerprint(entries)
+    base = os.path.join(subset_dir, f"{noise}_{speaker}")
+
+    if os.path.exists(base + ".json") and os.path.exists(base + ".npy"):
+        with open(base + ".json") as f:
+            meta = json.load(f)
+        if meta["fingerprint"] == fingerprint:
+            return np.load(base + ".npy", mmap_mode="r"), meta["paths"], False
+
+    paths = list(entries["path"])
+    preprocessing, size = preprocessing_of(item_tfm)
+    mean, std = normalization_of(learn.dls)
+    training = learn.model.training
+    learn.model.eval()
+    try:
+        features = _features(learn, paths, preprocessing, size, mean, std)
+    finally:
+        learn.model.train(training)
+
+    tmp_path = f"{base}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, features)
+    os.replace(tmp_path, base + ".npy")
+    with open(base + ".json.tmp", "w") as f:
+        json.dump({"fingerprint": fingerprint, "paths": paths, "dim": int(features.shape[1]) if len(features) else 0}, f)
+    os.replace(base + ".json.tmp", base + ".json")
+    return np.load(base + ".npy", mmap_mode="r"), paths, True
+
+
+def feature_dls(learn, features, bs) -> DataLoaders:
+    """
+    DataLoaders of (feature vector, label) with the train/validation split of
+    `learn.dls`. `features` maps each image path to its vector.
+    """
+    o2i = {label: i for i, label in enumerate(learn.dls.vocab)}
+
+    def items(paths):
+        return [(torch.from_numpy(np.asarray(features[str(p)], dtype=np.float32)), torch.tensor(o2i[os.path.basename(os.path.dirname(str(p)))]))
+                for p in paths]
+
+    train, valid = split_paths(learn.dls)
+    return DataLoaders(
+        DataLoader(items(train), bs=bs, shuffle=True, drop_last=len(train) > bs),
+        DataLoader(items(valid), bs=bs),
+        device=default_device(),
+    )
+
+
+def split_paths(dls) -> tuple:
+    """Train and validation image paths of image or tensor cache DataLoaders."""
+    if hasattr(dls.train, "items"):
+        return list(dls.train.items), list(dls.valid.items)
+    paths = dls.train.dataset.dataset.paths
+    return [paths[i] for i in dls.train.dataset.idxs], [paths[i] for i in dls.valid.dataset.idxs]
+
+
+def fit_head(learn, manifest, architecture_name, transform_type, item_tfm, speakers, noises, bs, epochs=FREEZE_EPOCHS, lr=BASE_LR) -> dict:
+    """
+    Frozen phase of `fine_tune` on cached features: trains the layers of the
+    head after the pooling for `epochs`, with the same one-cycle schedule.
+    Returns what was done (subsets built/reused, seconds, last losses and F1).
+    """
+    start = time.perf_counter()
+    features, built = {}, 0
+    for noise in noises:
+        for speaker in speakers:
+            vectors, paths, new = build_features(manifest, learn, architecture_name, transform_type, item_tfm, noise, speaker)
+            built += new
+            features.update(zip(paths, vectors))
+    extracted = time.perf_counter()
+
+    head = learn.model[1][2:]  # the modules are shared with learn.model
+    head_learn = Learner(feature_dls(learn, features, bs), head, loss_func=learn.loss_func, metrics=F1Score(average='macro'))
+    with head_learn.no_bar(), head_learn.no_logging():
+        head_learn.fit_one_cycle(epochs, lr, pct_start=0.99)
+    train_loss, valid_loss, f1 = head_learn.recorder.values[-1]
+    return {
+        "subsets": len(noises) * len(speakers),
+        "built": built,
+        "extract_seconds": extracted - start,
+        "head_seconds": time.perf_counter() - extracted,
+        "train_loss": float(train_loss),
+        "valid_loss": float(valid_loss),
+        "f1_score": float(f1),
+    }
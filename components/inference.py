@@ -0,0 +1,241 @@
+import math
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+from components.spectrogram import SPEC_CONFIG, PREPROCESSING_VERSION, image_from_bytes, mel_image
+
+CONFIDENCE_THRESHOLD = 0.6 # TODO: Talvez seja interessante deixar o usuário escolher esse valor ou colocar a soma dos demais classes
+
+_pool = None  # process pool of build_images, shared by every session
+_pool_lock = threading.Lock()
+
+
+def read_uploaded_audios(uploaded_files, persist_dir=None) -> list:
+    """
+    Returns (name, bytes) for every uploaded WAV file. ZIP archives are expanded
+    and only their .wav members are kept, without macOS metadata and dot-files.
+    Names are unique, so results and saved copies don't overwrite each other.
+    Audios are only written to disk when `persist_dir` is given.
+    """
+    audios, names = [], set()
+    for uploaded in uploaded_files:
+        if uploaded.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(uploaded) as archive:
+                for member in archive.infolist():
+                    parts = member.filename.replace("\\", "/").split("/")
+                    if member.is_dir() or not member.filename.lower().endswith(".wav") or _hidden(parts):
+                        continue
+                    # Flatten folders, numbering the names that are still taken
+                    name = _unique_name("_".join(parts), names)
+                    audios.append((name, archive.read(member)))
+        else:
+            audios.append((_unique_name(uploaded.name, names), uploaded.getvalue()))
+
+    if persist_dir is not None:
+        for name, data in audios:
+            with open(os.path.join(persist_dir, name), "wb") as f:
+                f.write(data)
+    return audios
+
+
+def _hidden(parts) -> bool:
+    """macOS resource forks (__MACOSX/, ._clip.wav) and other dot-files of an archive."""
+    return any(part == "__MACOSX" or part.startswith(".") for part in parts)
+
+
+def _unique_name(name, taken) -> str:
+    """`name`, or `name` with a counter (clip_2.wav, clip_3.wav...) when it's already in `taken`."""
+    stem, ext = os.path.splitext(name)
+    unique, counter = name, 1
+    while unique in taken:
+        counter += 1
+        unique = f"{stem}_{counter}{ext}"
+    taken.add(unique)
+    return unique
+
+
+def _image_pool() -> ProcessPoolExecutor:
+    """
+    Started once per server process. Its workers are spawned: forking the
+    Streamlit server, which runs many threads and has torch loaded, can deadlock.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def build_images(datas) -> list:
+    """
+    Generates the mel spectrogram image of every audio in parallel, in memory.
+    Audios too short to produce a crop map to None.
+    """
+    global _pool
+    pool = _image_pool()
+    try:
+        return list(pool.map(image_from_bytes, datas))
+    except BrokenProcessPool:  # a worker was killed: the next call starts a new pool
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+
+def model_vocab(learner) -> list:
+    """Class labels of a fastai learner or of an InferenceModel."""
+    from components.runtime import InferenceModel
+
+    return learner.vocab if isinstance(learner, InferenceModel) else learner.dls.vocab
+
+
+def predict_images(learner, images, bs=64):
+    """
+    Classifies spectrograms in batches. `images` may be RGB arrays or paths to PNGs,
+    `learner` a fastai learner or an InferenceModel.
+    Returns an (n_items, n_classes) tensor of probabilities.
+    """
+    from components.runtime import InferenceModel
+
+    if isinstance(learner, InferenceModel):
+        return learner.predict(images, bs=bs)
+    dl = learner.dls.test_dl(images, bs=bs)
+    probs, _ = learner.get_preds(dl=dl)
+    return probs
+
+
+def predict_audios(learner, model_key, datas, bs=64, cache=None, lock=None):
+    """
+    Spectrogram + prediction for a list of audio bytes, going through `cache`
+    (a PredictionCache) when given: only the misses are converted and classified.
+    `lock` guards the forward pass on a learner shared between sessions.
+    Returns (images, probs, hits), probs being an (n_items, n_classes) array
+    with NaN rows for audios too short to be analyzed.
+    """
+    n_classes = len(model_vocab(learner))
+    images, probs, hits = [None] * len(datas), np.full((len(datas), n_classes), np.nan, dtype=np.float32), [False] * len(datas)
+
+    keys = [cache.key(data, model_key, PREPROCESSING_VERSION) if cache is not None else None for data in datas]
+    misses = []
+    for i, key in enumerate(keys):
+        entry = cache.get(key) if cache is not None else None
+        if entry is None:
+            misses.append(i)
+        else:
+            images[i], probs[i] = entry
+            hits[i] = True
+
+    if misses:
+        new_images = build_images([datas[i] for i in misses]) if len(misses) > 1 else [image_from_bytes(datas[misses[0]])]
+        valid = [(i, image) for i, image in zip(misses, new_images) if image is not None]
+        if valid:
+            with lock if lock is not None else nullcontext():
+                new_probs = predict_images(learner, [image for _, image in valid], bs=bs).numpy()
+            for (i, image), p in zip(valid, new_probs):
+                images[i], probs[i] = image, p
+        if cache is not None:
+            for i, image in zip(misses, new_images):
+                cache.put(keys[i], image, probs[i])
+
+    return images, probs, hits
+
+
+def results_table(names, probs, vocab, threshold=CONFIDENCE_THRESHOLD) -> pd.DataFrame:
+    """One row per file with the predicted class, its confidence and the inconclusive flag."""
+    probs = np.asarray(probs)
+    df = pd.DataFrame({
+        "File": names,
+        "Class": [vocab[i] for i in probs.argmax(axis=1)],
+        "Confidence": probs.max(axis=1),
+    })
+    df["Inconclusive"] = df["Confidence"] < threshold
+    for i, label in enumerate(vocab):
+        df[f"P({label})"] = probs[:, i]
+    return df
+
+
+def window_seconds(config=SPEC_CONFIG) -> float:
+    """
+    Audio covered by one `crop_width` spectrogram crop, the only part of an
+    audio the model sees: the length of the windows of `iter_windows`.
+    """
+    return (config["crop_width"] - 1) * config["hop_length"] / config["sr"]
+
+
+def iter_windows(source, hop_s, config=SPEC_CONFIG):
+    """
+    Lazily yields (start_s, end_s, image) for windows of an audio, one every
+    `hop_s` seconds. Each window is exactly one spectrogram crop long, so the
+    image covers the whole window; with `hop_s` up to the window length, no part
+    of the recording is left out. `source` is a path or a file-like object; only
+    one window is decoded at a time, so memory does not grow with the length of
+    the recording. Windows too short to produce a crop (the tail of the file)
+    are skipped.
+    """
+    import soundfile as sf
+    import librosa
+
+    with sf.SoundFile(source) as f:
+        native_sr = f.samplerate
+        window = math.ceil(window_seconds(config) * native_sr)  # rounded up, so the crop is never a frame short
+        hop = max(1, round(hop_s * native_sr))
+        for i, block in enumerate(f.blocks(blocksize=window, overlap=max(0, window - hop), always_2d=True, dtype="float32")):
+            audio = block.mean(axis=1)
+            if native_sr != config["sr"]:
+                audio = librosa.resample(audio, orig_sr=native_sr, target_sr=config["sr"])
+            image = mel_image(audio, config=config)
+            if image is None:
+                continue
+            start = i * hop / native_sr
+            yield start, start + len(block) / native_sr, image
+
+
+def classify_timeline(learner, windows, vocab, bs=64, threshold=CONFIDENCE_THRESHOLD):
+    """
+    Classifies the windows yielded by `iter_windows` in batches of `bs`.
+    Returns the per-window timeline and the file-level verdict: the class with
+    the highest mean probability, plus the windows where a synthetic class wins
+    with enough confidence (partially spliced fakes).
+    """
+    rows, batch, prob_sum = [], [], None
+
+    def flush():
+        nonlocal prob_sum
+        probs = predict_images(learner, [image for _, _, image in batch], bs=bs)
+        prob_sum = probs.sum(dim=0) if prob_sum is None else prob_sum + probs.sum(dim=0)
+        for (start, end, _), p in zip(batch, probs.tolist()):
+            rows.append([start, end] + p)
+        batch.clear()
+
+    for window in windows:
+        batch.append(window)
+        if len(batch) == bs:
+            flush()
+    if batch:
+        flush()
+
+    timeline = pd.DataFrame(rows, columns=["Start (s)", "End (s)"] + [f"P({label})" for label in vocab])
+    if timeline.empty:
+        return timeline, None
+
+    probs = timeline[[f"P({label})" for label in vocab]].to_numpy()
+    timeline.insert(2, "Class", [vocab[i] for i in probs.argmax(axis=1)])
+    timeline.insert(3, "Confidence", probs.max(axis=1))
+
+    mean_probs = (prob_sum / len(timeline)).tolist()
+    verdict_idx = max(range(len(vocab)), key=lambda i: mean_probs[i])
+    suspicious = timeline[(timeline["Class"] != "bonafide") & (timeline["Confidence"] >= threshold)]
+    verdict = {
+        "Class": vocab[verdict_idx],
+        "Confidence": mean_probs[verdict_idx],
+        "Inconclusive": mean_probs[verdict_idx] < threshold,
+        "Probabilities": dict(zip(vocab, mean_probs)),
+        "Suspicious windows": len(suspicious),
+    }
+    return timeline, verdict
@@ -0,0 +1,338 @@
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+
+JOBS_DIR = "database/.jobs"
+# Number of trainings running at the same time on the server, and per user
+TRAINING_WORKERS = int(os.environ.get("TRAINING_WORKERS", 2))
+TRAINING_JOBS_PER_USER = int(os.environ.get("TRAINING_JOBS_PER_USER", 1))
+MAX_ATTEMPTS = 3 # a job interrupted by a server restart is queued again at most this many times
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+TRAINING, SEARCH, RESUME, DISTRIBUTED = "training", "search", "resume", "distributed"
+# Imported once by the fork server of the workers when the queue is pre-warmed
+JOB_PRELOAD = ["components.training", "components.search"]
+
+
+def run_job(job_path) -> None:
+    """Entry point of the worker process: trains the model described by the job file."""
+    if hasattr(os, "setsid"):
+        os.setsid()  # own process group, so a cancel also stops the processes the job starts (distributed ranks, DataLoader workers)
+    with open(job_path) as f:
+        job = json.load(f)
+
+    log = open(job_path[:-len(".json")] + ".log", "a", buffering=1)
+    sys.stdout = sys.stderr = log
+
+    if job.get("kind") == SEARCH:
+        from components.search import run_search
+
+        ok = run_search(job["username"], **job["params"]) is not None
+    elif job.get("kind") == DISTRIBUTED:
+        from components.distributed import launch
+        from components.reports import scaling_counts
+
+        params = dict(job["params"])
+        nproc, scaling = params.pop("nproc"), params.pop("scaling", False)
+        ok = all([launch(job["username"], params, n) for n in (scaling_counts(nproc) if scaling else [nproc])])
+    else:
+        from components.training import user_engine, run_folder
+        from components.sinks import ConsoleSink
+        from components.checkpoint_files import latest_checkpoint
+
+        engine = user_engine(job["username"])
+        params = job["params"]
+        if job.get("kind") == RESUME:
+            ok = engine.resume(params["run_name"], sink=ConsoleSink())
+        else:
+            run = run_folder(params["user_model_name"], params["architecture_name"], params["transform_type"])
+            if job["attempts"] > 1 and latest_checkpoint(f"{engine.save_path}/{run}") is not None:
+                # Interrupted by a server restart: continue from its last checkpoint
+                ok = engine.resume(run, sink=ConsoleSink())
+            else:
+                ok = engine.train(**params, sink=ConsoleSink())
+    log.close()
+    # Read by a server restarted while the job was running, which can't get the exit code
+    with open(job_path[:-len(".json")] + ".exit", "w") as f:
+        f.write("0" if ok else "1")
+    sys.exit(0 if ok else 1)
+
+
+def _terminate(pid) -> None:
+    """SIGTERM to the process group of a job: its worker and every process the worker started."""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(pid, signal.SIGTERM)
+            return
+        except (ProcessLookupError, PermissionError):  # the worker hasn't called setsid yet
+            pass
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+def _alive(pid) -> bool:
+    """Whether the worker `pid` of a job is still running."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+        # A pid reused by another program: job workers lead their own process group (run_job)
+        return not hasattr(os, "getpgid") or os.getpgid(pid) == pid
+    except OSError:
+        return False
+
+
+class JobQueue:
+    """
+    Persistent queue of training jobs.
+
+    Every job is a JSON file in `jobs_dir`, so the queue survives reruns, closed
+    tabs and server restarts. A dispatcher thread starts queued jobs in their own
+    process while respecting the global and per-user concurrency limits, and
+    records their outcome.
+    """
+    def __init__(self, jobs_dir=JOBS_DIR, max_workers=TRAINING_WORKERS, max_per_user=TRAINING_JOBS_PER_USER) -> None:
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.max_per_user = max_per_user
+        self._lock = threading.RLock()
+        self._procs = {}  # job id -> Process
+        self._orphans = {}  # job id -> pid of a worker started by a previous server process
+        self._context = multiprocessing.get_context("spawn")  # never fork the Streamlit server
+        self._thread = None
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def start(self) -> None:
+        """Starts the dispatcher thread once per process."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.__recover()
+            self._thread = threading.Thread(target=self.__dispatch_forever, name="training-jobs", daemon=True)
+            self._thread.start()
+
+    def prewarm(self, modules=JOB_PRELOAD) -> None:
+        """
+        Starts the next jobs from a fork server that imported `modules` once, instead
+        of spawning a fresh interpreter that imports torch and fastai for every job.
+        The fork server is a separate process, so the Streamlit server is still never forked.
+        """
+        if "forkserver" not in multiprocessing.get_all_start_methods():
+            return
+        from multiprocessing import forkserver
+
+        with self._lock:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(modules)
+            forkserver.ensure_running()
+            self._context = context
+
+    def submit(self, username, params: dict, kind=TRAINING) -> str:
+        """
+        Queues a training. `params` are the arguments of `TrainingEngine.train`, with
+        callbacks as strings, of `HyperparameterSearch` for a SEARCH job, or
+        {"run_name": ...} for a RESUME job. A DISTRIBUTED job has the arguments of
+        `train` with "nproc" processes and "scaling" (1, 2, 4... nproc processes).
+        """
+        job = {
+            "id": time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6],
+            "username": username,
+            "kind": kind,
+            "state": QUEUED,
+            "params": params,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "attempts": 0,
+            "error": None,
+            "cancel_requested": False,
+        }
+        with self._lock:
+            self.__write(job)
+        return job["id"]
+
+    def cancel(self, job_id) -> None:
+        with self._lock:
+            job = self.get(job_id)
+            if job is None or job["state"] in FINISHED_STATES:
+                return
+            if job["state"] == QUEUED:
+                job.update(state=CANCELLED, finished=time.time())
+            else:
+                job["cancel_requested"] = True
+                proc = self._procs.get(job_id)
+                if proc is not None:
+                    _terminate(proc.pid)
+                elif job_id in self._orphans:
+                    _terminate(self._orphans[job_id])
+            self.__write(job)
+
+    def get(self, job_id):
+        try:
+            with open(self.__path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def jobs(self, username=None) -> list:
+        """Jobs of `username` (or everyone's), newest first."""
+        jobs = []
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith(".json"):
+                job = self.get(name[:-len(".json")])
+                if job is not None and (username is None or job["username"] == username):
+                    jobs.append(job)
+        return sorted(jobs, key=lambda job: job["created"], reverse=True)
+
+    def log(self, job_id) -> str:
+        try:
+            with open(os.path.join(self.jobs_dir, f"{job_id}.log")) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def __dispatch_forever(self) -> None:
+        while True:
+            try:
+                self.__dispatch()
+            except Exception as e:
+                print(f"❌ Training job dispatcher: {str(e)}")
+            time.sleep(1)
+
+    def __dispatch(self) -> None:
+        with self._lock:
+            # Reap finished processes
+            for job_id, proc in list(self._procs.items()):
+                if proc.is_alive():
+                    continue
+                del self._procs[job_id]
+                job = self.get(job_id)
+                if job is not None:  # None: the job file was deleted or can't be read
+                    self.__finish(job, proc.exitcode)
+            for job_id, pid in list(self._orphans.items()):
+                if not _alive(pid):
+                    del self._orphans[job_id]
+                    job = self.get(job_id)
+                    if job is not None:
+                        self.__interrupted(job)
+
+            # Start queued jobs, oldest first
+            running = {}
+            for job_id in list(self._procs) + list(self._orphans):
+                job = self.get(job_id)
+                if job is not None:
+                    running[job["username"]] = running.get(job["username"], 0) + 1
+            for job in sorted((j for j in self.jobs() if j["state"] == QUEUED), key=lambda j: j["created"]):
+                if len(self._procs) + len(self._orphans) >= self.max_workers:
+                    break
+                if running.get(job["username"], 0) >= self.max_per_user:
+                    continue
+                proc = self._context.Process(target=run_job, args=(self.__path(job["id"]),), daemon=False)
+                proc.start()
+                self._procs[job["id"]] = proc
+                running[job["username"]] = running.get(job["username"], 0) + 1
+                job.update(state=RUNNING, started=time.time(), pid=proc.pid, attempts=job["attempts"] + 1)
+                self.__write(job)
+
+    def __recover(self) -> None:
+        # Jobs left running by a previous server process: watch the workers that are
+        # still training, queue the others again
+        for job in self.jobs():
+            if job["state"] != RUNNING:
+                continue
+            if _alive(job.get("pid")):
+                self._orphans[job["id"]] = job["pid"]
+            else:
+                self.__interrupted(job)
+
+    def __finish(self, job, exitcode) -> None:
+        if job["cancel_requested"]:
+            job["state"] = CANCELLED
+        elif exitcode == 0:
+            job["state"] = DONE
+        else:
+            job.update(state=FAILED, error=f"Worker exited with code {exitcode}. See the job log for details.")
+        job["finished"] = time.time()
+        self.__write(job)
+
+    def __interrupted(self, job) -> None:
+        """A job whose worker exited while no server process was waiting for it."""
+        try:
+            with open(self.__path(job["id"])[:-len(".json")] + ".exit") as f:
+                exitcode = int(f.read())
+        except (FileNotFoundError, ValueError):
+            exitcode = None
+        if exitcode is not None:
+            self.__finish(job, exitcode)
+            return
+        if job["cancel_requested"]:
+            job.update(state=CANCELLED, finished=time.time())
+        elif job["attempts"] >= MAX_ATTEMPTS:
+            job.update(state=FAILED, finished=time.time(), error="Interrupted too many times by server restarts.")
+        else:
+            job["state"] = QUEUED
+        self.__write(job)
+
+    def __path(self, job_id) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def __write(self, job) -> None:
+        tmp_path = self.__path(job["id"]) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp_path, self.__path(job["id"]))
+
+
+job_queue = JobQueue()
+
+
+def _run_name(job) -> str:
+    params = job["params"]
+    if job.get("kind") == SEARCH:
+        return f"🔎 {params['search_name']}"
+    if job.get("kind") == RESUME:
+        return f"♻️ {params['run_name']}"
+    if job.get("kind") == DISTRIBUTED:
+        return f"🖧 {params['user_model_name'] or 'model_' + params['architecture_name'] + '_' + params['transform_type']} ({params['nproc']} processes)"
+    return params["user_model_name"] or f"model_{params['architecture_name']}_{params['transform_type']}"
+
+
+def render_jobs(username) -> None:
+    """Table of the user's training jobs, refreshed every few seconds, with cancel buttons."""
+    import streamlit as st
+    import pandas as pd
+
+    @st.fragment(run_every=5)
+    def jobs_fragment():
+        jobs = job_queue.jobs(username)
+        if not jobs:
+            st.write("No training jobs yet.")
+            return
+
+        st.dataframe(pd.DataFrame([{
+            "Job": job["id"],
+            "Run": _run_name(job),
+            "State": job["state"],
+            "Created": time.strftime("%Y-%m-%d %H:%M", time.localtime(job["created"])),
+            "Duration": f"{((job['finished'] or time.time()) - job['started']) / 60:.1f} min" if job["started"] else "",
+        } for job in jobs]), hide_index=True, use_container_width=True)
+
+        active = [job["id"] for job in jobs if job["state"] not in FINISHED_STATES]
+        if active:
+            col1, col2 = st.columns([3, 1])
+            job_id = col1.selectbox("Active job", active, label_visibility="collapsed")
+            col2.button("🛑 Cancel job", key=f"cancel_{job_id}", on_click=lambda: job_queue.cancel(job_id))
+
+        with st.expander("📜 Job logs"):
+            job_id = st.selectbox("Job", [job["id"] for job in jobs], key="log_job")
+            st.code(job_queue.log(job_id)[-5000:] or "(empty)")
+
+    jobs_fragment()
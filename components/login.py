@@ -1,12 +1,15 @@
 import streamlit as st
 import streamlit_authenticator as stauth
 from streamlit_authenticator.utilities import (LoginError, RegisterError, ResetError, CredentialsError)
+from utils.config import credentials_store
 
 
 class Login():
     def __init__(self, permission:bool=True) -> None:
 
-        self.authenticator = stauth.Authenticate("config.yaml")
+        # Built from the cached config.yaml; what the widgets change is saved with credentials_store
+        self.credentials = credentials_store.credentials()
+        self.authenticator = stauth.Authenticate(self.credentials, **credentials_store.settings())
 
         if "view" not in st.session_state:
             st.session_state.view = "Login"  # Default to Login view
@@ -28,12 +31,16 @@ class Login():
 
         elif st.session_state.view == "Register":
             try:
-                email_of_registered_user, username_of_registered_user, name_of_registered_user = self.authenticator.register_user()
+                email_of_registered_user, username_of_registered_user, name_of_registered_user = self.authenticator.register_user(
+                    pre_authorized=credentials_store.pre_authorized()
+                )
                 if email_of_registered_user:
+                    credentials_store.remove_pre_authorized(email_of_registered_user)
                     st.success('User registered successfully')
             except RegisterError as e:
                 st.error(e)
 
+        credentials_store.save_credentials(self.credentials)
 
         if not st.session_state.get("authentication_status"):
             st.write("---")
@@ -60,6 +67,7 @@ class Login():
                     st.error(e)
                 except CredentialsError as e:
                     st.error(e)
+                credentials_store.save_credentials(self.credentials)
                 st.info('If you reset the password, revert it once done.')
 
                 st.button("Hide", key="hide", on_click=lambda: self.__reset_pswd(False))
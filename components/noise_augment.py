@@ -0,0 +1,139 @@
+"""
+Noise levels injected on the fly, instead of reading one physical copy of the
+dataset per noise level (/dataset/<noise>/<speaker>).
+
+Only the clean audios are kept (`{source}/{speaker}/{label}/*.wav`, the input of
+components/dataset_builder.py). Each item of the DataLoaders stands for the PNG
+the builder would write, /dataset/<noise>/<speaker>/<label>/<clip>.png, and the
+DataLoader workers generate it when it's loaded: noise added to the audio, then
+the mel steps of components/spectrogram.py (the rendering of generate_single_spec,
+see tests/test_spectrogram.py). The noise is seeded by the builder's recipe
+(audio content, noise level and spectrogram settings), so an item is the same
+image in every epoch, every worker and every run, and the same as the PNG the
+builder writes (tests/test_noise_augment.py); with the same seed, a run gets the
+same split as one on the built dataset. Noisy PNGs written by the submodule's
+setup.sh are rendered the same way but with another draw of the noise, so they
+match the items of noise level 0 only.
+"""
+import hashlib
+import math
+import os
+from pathlib import Path
+import numpy as np
+from components.dataset import DATASET_PATH
+from components.dataset_builder import SOURCE_PATH, noise_folder, recipe, source_audios
+from components.spectrogram import SPEC_CONFIG
+
+
+def long_enough(wav_path, config=SPEC_CONFIG) -> bool:
+    """Whether the audio gives a full crop, read from its header (mel_image discards the others)."""
+    import soundfile
+
+    info = soundfile.info(wav_path)
+    samples = math.ceil(info.frames * config["sr"] / info.samplerate)
+    return not config["discard_if_too_narrow"] or 1 + samples // config["hop_length"] >= config["crop_width"]
+
+
+def noisy_items(speakers, noises, source_path=SOURCE_PATH, dataset_path=DATASET_PATH) -> list:
+    """
+    The PNG paths the selection would have in /dataset, in the order of the
+    dataset manifest, for the audios long enough to give one.
+    """
+    audios = [(speaker, label, wav_path) for speaker, label, wav_path in source_audios(source_path, speakers) if long_enough(wav_path)]
+    items = []
+    for noise in noises:
+        for speaker, label, wav_path in audios:
+            name = os.path.splitext(os.path.basename(wav_path))[0] + ".png"
+            items.append(os.path.join(dataset_path, noise_folder(noise), speaker, label, name))
+    return [Path(item) for item in sorted(items)]
+
+
+class NoisySpectrogram:
+    """get_x of the DataLoaders: /dataset/<noise>/<speaker>/<label>/<clip>.png -> image generated from the clean audio."""
+    def __init__(self, source_path=SOURCE_PATH) -> None:
+        self.source_path = source_path
+
+    def __call__(self, item):
+        from components.spectrogram import load_audio, mel_image
+
+        item = Path(item)
+        noise, speaker, label = item.parts[-4:-1]
+        with open(os.path.join(self.source_path, speaker, label, item.stem + ".wav"), "rb") as f:
+            data = f.read()
+        rcp = recipe(hashlib.sha256(data).hexdigest(), noise)
+        return mel_image(load_audio(data), float(noise), np.random.default_rng(int(rcp[:16], 16)))
+
+
+def noisy_dataloaders(speakers, noises, label_func, bs, valid_pct=0.3, seed=None, item_tfms=None, source_path=SOURCE_PATH, **kwargs):
+    """Same DataLoaders as `ImageDataLoaders.from_path_func` on /dataset, with the images generated on the fly."""
+    from fastai.vision.all import DataBlock, ImageBlock, CategoryBlock, RandomSplitter
+
+    items = noisy_items(speakers, noises, source_path)
+    if not items:
+        raise FileNotFoundError(f"No audio of the selected speakers in {source_path}.")
+    dblock = DataBlock(
+        blocks=(ImageBlock, CategoryBlock),
+        get_x=NoisySpectrogram(source_path),
+        get_y=label_func,
+        splitter=RandomSplitter(valid_pct, seed=seed),
+        item_tfms=item_tfms,
+    )
+    return dblock.dataloaders(items, path=".", bs=bs, **kwargs)
+
+
+def noisy_inference_dls(dls, item_tfms, label_func, tmp_dir, source_path=SOURCE_PATH):
+    """
+    Image DataLoaders to export the learner with, so `load_learner(...).predict`
+    works on PNGs and arrays: one generated image per label is written in `tmp_dir`.
+    """
+    from PIL import Image
+    from components.shards import image_dls
+
+    get_x, fnames = NoisySpectrogram(source_path), {}
+    for item in dls.valid.items:
+        label = label_func(Path(item))
+        if label not in fnames:
+            os.makedirs(os.path.join(tmp_dir, label), exist_ok=True)
+            fnames[label] = Path(tmp_dir, label, "0.png")
+            Image.fromarray(get_x(item)).save(fnames[label])
+    return image_dls(dls, list(fnames.values()), dls.vocab, item_tfms, label_func)
+
+
+def storage_report(speakers, noises, manifest=None, source_path=SOURCE_PATH) -> dict:
+    """
+    Disk and I/O of the selection with the noise injected on the fly, compared
+    to the physical copies of /dataset. The copies are measured with the dataset
+    manifest; noise levels that were never built are estimated from the size of
+    the other PNGs.
+    """
+    items = noisy_items(speakers, noises, source_path)
+    audios = {os.path.join(source_path, item.parts[-3], item.parts[-2], item.stem + ".wav") for item in items}
+    audio_bytes = sum(os.path.getsize(path) for path in audios)
+    report = {
+        "noise_levels": len(noises),
+        "audios": len(audios),
+        "images": len(items),
+        "audio_bytes": audio_bytes,  # on disk, and read once into the page cache for every noise level
+        "audio_read_bytes_per_epoch": audio_bytes * len(noises),
+        "materialized_bytes": None,
+        "estimated": False,
+    }
+    entries = manifest.entries(speakers, noises) if manifest is not None else None
+    if entries is not None and len(entries):
+        built = entries.groupby("noise")["size"].sum()
+        missing = [noise for noise in noises if noise_folder(noise) not in built.index and str(noise) not in built.index]
+        report["materialized_bytes"] = int(built.sum() + len(missing) * len(audios) * entries["size"].mean())
+        report["estimated"] = bool(missing)
+        report["saved_bytes"] = report["materialized_bytes"] - audio_bytes
+    return report
+
+
+def describe_report(report) -> str:
+    mb = 1024 * 1024
+    text = f"{report['images']} images from {report['audios']} clean audios ({report['audio_bytes'] / mb:.1f} MB, " \
+           f"{report['audio_read_bytes_per_epoch'] / mb:.1f} MB read per epoch)"
+    if report["materialized_bytes"] is None:
+        return text + "."
+    copies = f"{report['noise_levels']} {'copy' if report['noise_levels'] == 1 else 'copies'}"
+    return text + f" instead of {copies} of the dataset ({'~' if report['estimated'] else ''}" \
+                  f"{report['materialized_bytes'] / mb:.1f} MB on disk and read per epoch): {report['saved_bytes'] / mb:+.1f} MB saved."
@@ -0,0 +1,192 @@
+"""
+Post-training optimization of a model for CPU inference.
+
+    python -m components.optimize database/alice/model_ResNet18_Resize
+
+Next to the model.pt exported by the training engine, writes the variants that
+components/runtime.py can load instead of the fp32 network:
+
+- channels_last: the same fp32 network, run on NHWC tensors
+- int8_dynamic: Linear weights stored in int8, activations quantized on the fly
+- int8_static: convolutions and Linear layers in int8, with activation ranges
+  calibrated on training images
+
+and optimization.json, which compares every variant to the fp32 network on the
+validation split of the run (split.json): file size, forward latency, F1
+(macro) and confusion matrix.
+"""
+import copy
+import json
+import os
+import random
+import time
+from pathlib import Path
+import numpy as np
+import torch
+from torch import nn
+from components.runtime import SCRIPT_FILE, META_FILE, InferenceModel, read_meta
+from components.reports import REPORT_FILE, report_table
+
+VARIANTS = ["channels_last", "int8_dynamic", "int8_static"]
+CALIBRATION_IMAGES = 64
+LATENCY_RUNS = 20
+LATENCY_BS = 32
+
+
+def _channels_last(net, example, calibration):
+    return net.to(memory_format=torch.channels_last), example.contiguous(memory_format=torch.channels_last), {"channels_last": True}
+
+
+def _int8_dynamic(net, example, calibration):
+    net = torch.ao.quantization.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+    return net, example, {"quantized_engine": torch.backends.quantized.engine}
+
+
+def _int8_static(net, example, calibration):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    engine = torch.backends.quantized.engine
+    prepared = prepare_fx(net, get_default_qconfig_mapping(engine), example_inputs=(example,))
+    with torch.no_grad():
+        for x in calibration:
+            prepared(x)
+    return convert_fx(prepared), example, {"quantized_engine": engine}
+
+
+BUILDERS = {
+    "channels_last": _channels_last,
+    "int8_dynamic": _int8_dynamic,
+    "int8_static": _int8_static,
+}
+
+
+def latency_ms(model, x, runs=LATENCY_RUNS) -> float:
+    """Median forward time of `model` on `x`, after 3 warm-up runs."""
+    times = []
+    with torch.inference_mode():
+        for i in range(runs + 3):
+            start = time.perf_counter()
+            model(x)
+            times.append(time.perf_counter() - start)
+    return float(np.median(times[3:]) * 1000)
+
+
+def evaluate(runtime, x, targets, bs=LATENCY_BS) -> dict:
+    """F1 (macro), confusion matrix and predictions of an InferenceModel on the preprocessed batch `x`."""
+    from sklearn.metrics import confusion_matrix, f1_score
+
+    preds = []
+    with torch.inference_mode():
+        for i in range(0, len(x), bs):
+            preds.append(runtime.model(x[i:i + bs].contiguous(memory_format=runtime.memory_format)).argmax(dim=1))
+    preds = [runtime.vocab[i] for i in torch.cat(preds).tolist()]
+    return {
+        "f1_score": float(f1_score(targets, preds, labels=runtime.vocab, average="macro", zero_division=0)),
+        "confusion_matrix": confusion_matrix(targets, preds, labels=runtime.vocab).tolist(),
+        "preds": preds,
+    }
+
+
+def optimize_model(model_path, network=None, variants=VARIANTS) -> dict:
+    """
+    Builds `variants` of the model in `model_path` and writes optimization.json.
+    `network` is the eager PyTorch model of the learner; when None it is loaded from model.pkl.
+    Returns the report.
+    """
+    from components.training import SPLIT_FILE
+
+    if network is None:
+        from fastai.vision.all import load_learner
+        network = load_learner(os.path.join(model_path, "model.pkl")).model
+    network = copy.deepcopy(network).cpu().eval()
+
+    with open(os.path.join(model_path, SPLIT_FILE)) as f:
+        split = json.load(f)
+    valid = [p for p in split["valid"] if os.path.exists(p)]
+    train = [p for p in split["train"] if os.path.exists(p)]
+    if not valid:
+        raise ValueError("None of the validation images of split.json were found.")
+    targets = [Path(p).parent.name for p in valid]
+
+    base = InferenceModel(model_path)
+    x_valid = base.inputs(valid)
+    calibration_paths = random.Random(0).sample(train, min(CALIBRATION_IMAGES, len(train)))
+    calibration = [base.inputs(calibration_paths[i:i + LATENCY_BS]) for i in range(0, len(calibration_paths), LATENCY_BS)]
+    example = x_valid[:1]
+    batch = x_valid[:LATENCY_BS]
+
+    fp32 = {
+        "file": SCRIPT_FILE,
+        "size_mb": os.path.getsize(os.path.join(model_path, SCRIPT_FILE)) / 2**20,
+        "latency_bs1_ms": latency_ms(base.model, example),
+        "latency_batch_ms": latency_ms(base.model, batch),
+        **evaluate(base, x_valid, targets),
+    }
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "threads": torch.get_num_threads(),
+        "quantized_engine": torch.backends.quantized.engine,
+        "valid_images": len(valid),
+        "calibration_images": len(calibration_paths),
+        "batch_size": len(batch),
+        "variants": {"fp32": fp32},
+    }
+
+    meta = read_meta(model_path)
+    meta["variants"] = {}
+    for name in variants:
+        file = f"model_{name}.pt"
+        try:
+            net, x, spec = BUILDERS[name](copy.deepcopy(network), example, calibration)
+            with torch.no_grad():
+                torch.jit.freeze(torch.jit.trace(net, x)).save(os.path.join(model_path, file))
+            meta["variants"][name] = dict(spec, file=file)
+        except Exception as e:
+            report["variants"][name] = {"error": str(e)}
+            continue
+
+        # Measured through the runtime, as the Evaluation page loads it
+        with open(os.path.join(model_path, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+        runtime = InferenceModel(model_path, name)
+        result = {
+            "file": file,
+            "size_mb": runtime.nbytes / 2**20,
+            "latency_bs1_ms": latency_ms(runtime.model, example.contiguous(memory_format=runtime.memory_format)),
+            "latency_batch_ms": latency_ms(runtime.model, batch.contiguous(memory_format=runtime.memory_format)),
+            **evaluate(runtime, x_valid, targets),
+        }
+        result["size_reduction"] = 1 - result["size_mb"] / fp32["size_mb"]
+        result["speedup_bs1"] = fp32["latency_bs1_ms"] / result["latency_bs1_ms"]
+        result["speedup_batch"] = fp32["latency_batch_ms"] / result["latency_batch_ms"]
+        result["f1_diff"] = result["f1_score"] - fp32["f1_score"]
+        result["confusion_diff"] = (np.array(result["confusion_matrix"]) - np.array(fp32["confusion_matrix"])).tolist()
+        result["agreement"] = float(np.mean([a == b for a, b in zip(result["preds"], fp32["preds"])]))
+        report["variants"][name] = result
+
+    with open(os.path.join(model_path, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    for result in report["variants"].values():
+        result.pop("preds", None)
+    report["vocab"] = base.vocab
+    with open(os.path.join(model_path, REPORT_FILE), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Builds int8 and channels-last variants of a trained model and compares them.")
+    parser.add_argument("model_path", help="Folder of the model, e.g. database/<user>/<model>")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, choices=VARIANTS)
+    args = parser.parse_args()
+
+    report = optimize_model(args.model_path, variants=args.variants)
+    print(report_table(report).to_string(index=False))
+    print(f"Report saved in {os.path.join(args.model_path, REPORT_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
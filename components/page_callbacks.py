@@ -0,0 +1,52 @@
+"""
+fastai callbacks of the Training page, which talk to the placeholders that
+StreamlitSink (components/model.py) keeps in st.session_state.
+"""
+import matplotlib.pyplot as plt
+import streamlit as st
+from fastai.vision.all import Callback, CancelFitException
+
+
+class StopTrainingCallback(Callback):
+    def before_batch(self):
+        if st.session_state.get("stop_training", True):
+            st.session_state.training_out.code("Training stopped.")
+            raise CancelFitException()
+
+
+# Per-batch UI callbacks used before components/telemetry.py. Kept as the
+# reference for benchmarks/telemetry_bench.py.
+class TrainingLogCallback(Callback):
+    def after_batch(self):
+        if self.training:
+            batch = self.iter
+            loss = self.loss.item()
+            st.session_state.dataset_info.empty()
+            st.session_state.training_out.code(f"Epoch {self.epoch}: \nBatch {batch}: Loss {loss:.4f}")
+            st.session_state.progress.progress(batch/ self.n_iter)
+
+    def after_epoch(self):
+        st.session_state.progress.progress(1.0)
+        st.session_state.training_out.code(f"Epoch {self.epoch} complete!")
+
+class GraphCallback(Callback):
+    update_frequency = .2
+
+    def before_epoch(self):
+        self._update_graph()
+        self.total_batches = len(self.dls.train)
+        self.next_update = int(self.update_frequency * self.total_batches)
+
+    def after_batch(self):
+        current_batch = self.iter
+        if current_batch >= self.next_update:
+            self._update_graph()
+            self.next_update += int(self.update_frequency * self.total_batches)
+
+    def _update_graph(self):
+        fig, ax = plt.subplots(figsize=(4, 4))
+        self.recorder.plot_loss(ax=ax, show_epochs=True)
+        ax.set_ylim(0, max(1, ax.get_ylim()[1]))
+        plt.tight_layout()
+        st.session_state.graph.pyplot(fig, use_container_width=False)
+        plt.close(fig)
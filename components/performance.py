@@ -0,0 +1,206 @@
+"""
+Performance profiles of a training: how the DataLoaders feed the network and in
+which precision/memory format it runs.
+
+- num_workers, persistent_workers, prefetch_factor: worker processes decoding
+  the batches, kept alive between epochs, and how many batches each one
+  prepares in advance (None workers is fastai's default, one per core up to 16)
+- bf16: forward pass and loss under CPU autocast in bfloat16
+- channels_last: NHWC weights and inputs, faster for convolutions on CPU
+- compile: `torch.compile` of the network for each fit
+
+`ThroughputCallback` measures the training images per second, which the
+training engine saves in run.json with the profile, so runs can be compared.
+The profiles themselves are in components/settings.py.
+"""
+import multiprocessing
+import time
+import torch
+from torch.utils.data.dataloader import _MultiProcessingDataLoaderIter
+from fastai.vision.all import Callback, to_device, to_float
+
+def loader_kwargs(settings) -> dict:
+    """Keyword arguments of the fastai DataLoaders."""
+    kwargs = {"pin_memory": torch.cuda.is_available()}
+    if settings["num_workers"] is not None:
+        kwargs["num_workers"] = settings["num_workers"]
+    if settings["persistent_workers"] and settings["num_workers"] != 0:
+        kwargs["persistent_workers"] = True
+    return kwargs
+
+
+def set_prefetch(dls, prefetch_factor) -> None:
+    """fastai's DataLoader has no prefetch_factor argument; PyTorch reads it from the inner loader."""
+    for dl in dls.loaders:
+        dl.fake_l.prefetch_factor = prefetch_factor
+
+
+_compile_ok = None
+
+
+def compile_available() -> bool:
+    """Whether torch.compile works here (it needs a C++ compiler on CPU). Checked once per process."""
+    global _compile_ok
+    if _compile_ok is None:
+        try:
+            torch.compile(torch.nn.Linear(2, 2))(torch.zeros(1, 2))
+            _compile_ok = True
+        except Exception:
+            _compile_ok = False
+    return _compile_ok
+
+
+class _PersistentWorkersDL:
+    """
+    Mixin of a fastai DataLoader whose worker processes live as long as the
+    DataLoader. fastai starts new workers every epoch, even with
+    persistent_workers=True, and each worker samples from its own copy of the
+    epoch's shuffled indices; here the workers read them from shared memory.
+    This drives PyTorch's private multiprocessing iterator: torch is pinned in
+    requirements.txt, and tests/test_performance.py fails if that iterator changes.
+    """
+    def __iter__(self):
+        self.randomize()
+        self.before_iter()
+        idxs = torch.as_tensor(self.get_idxs(), dtype=torch.int64)
+        if self._workers is not None and len(idxs) != len(self._idxs):
+            self.shutdown_workers()
+        if self._workers is None:
+            self._idxs = idxs.share_memory_()  # set before the workers fork
+            self._workers = _MultiProcessingDataLoaderIter(self.fake_l)
+        else:
+            self._idxs.copy_(idxs)
+            self._workers._reset(self.fake_l)
+        for b in self._workers:
+            if self.pin_memory and type(b) == list: b = tuple(b)
+            if self.device is not None: b = to_device(b, self.device)
+            yield self.after_batch(b)
+        self.after_iter()
+        if hasattr(self, 'it'): del(self.it)
+
+    def sample(self):
+        return (int(b) for i, b in enumerate(self._idxs) if i // (self.bs or 1) % self.num_workers == self.offs)
+
+    def shutdown_workers(self) -> None:
+        if self._workers is not None:
+            self._workers._shutdown_workers()
+        self._workers = None
+
+
+_persistent_classes = {}
+
+
+class PersistentWorkers(Callback):
+    """Keeps the DataLoader workers alive for a whole fit (see _PersistentWorkersDL)."""
+    order = -2
+
+    def before_fit(self):
+        # The workers get the DataLoader by fork, as the class is created here
+        if (multiprocessing.get_start_method(allow_none=True) or multiprocessing.get_all_start_methods()[0]) != "fork":
+            return
+        for dl in self.dls.loaders:
+            if dl.fake_l.num_workers > 0 and dl.indexed:
+                cls = type(dl)
+                if cls not in _persistent_classes:
+                    _persistent_classes[cls] = type(f"Persistent{cls.__name__}", (_PersistentWorkersDL, cls), {})
+                dl.fake_l.persistent_workers = True  # read by PyTorch's iterator
+                dl._workers = None
+                dl.__class__ = _persistent_classes[cls]
+
+    def after_fit(self):
+        for dl in self.dls.loaders:
+            if isinstance(dl, _PersistentWorkersDL):
+                dl.shutdown_workers()
+                dl.__class__ = type(dl).__bases__[1]  # back to a picklable class, for the export
+                del dl._workers, dl._idxs
+
+
+class BF16Autocast(Callback):
+    """
+    fastai's MixedPrecision only autocasts on CUDA: the network's forward pass
+    runs under bfloat16 autocast on CPU. bf16 needs no loss scaling.
+    """
+    order = 10
+
+    def before_fit(self):
+        self.model = self.learn.model
+        self.own_forward = self.model.__dict__.get("forward")  # set by torch.compile
+        forward = self.model.forward
+
+        def autocast_forward(*args, **kwargs):
+            # Left even when the batch is cancelled or fails, unlike callbacks around it
+            with torch.autocast("cpu", dtype=torch.bfloat16):
+                return forward(*args, **kwargs)
+        self.model.forward = autocast_forward
+
+    def after_pred(self):
+        self.learn.pred = to_float(self.pred)
+
+    def after_fit(self):
+        if self.own_forward is None:
+            del self.model.forward
+        else:
+            self.model.forward = self.own_forward
+
+
+class ChannelsLastCPU(Callback):
+    """Like fastai's ChannelsLast, converting the inputs too."""
+    order = -1
+
+    def before_fit(self):
+        self.learn.model.to(memory_format=torch.channels_last)
+
+    def before_batch(self):
+        self.learn.xb = tuple(x.contiguous(memory_format=torch.channels_last) if x.dim() == 4 else x for x in self.xb)
+
+    def after_fit(self):
+        self.learn.model.to(memory_format=torch.contiguous_format)  # exported as a regular model
+
+
+class CompileModel(Callback):
+    """Trains a `torch.compile`d network; the learner keeps the original module for export."""
+    order = 0
+
+    def before_fit(self):
+        self.original = self.learn.model
+        self.learn.model = torch.compile(self.original)
+
+    def after_fit(self):
+        self.learn.model = self.original
+
+
+class ThroughputCallback(Callback):
+    """Training images per second over all the fits, data loading included."""
+    order = 100
+
+    def __init__(self) -> None:
+        self.images = 0
+        self.seconds = 0.0
+
+    def before_train(self):
+        self.start = time.perf_counter()
+
+    def after_batch(self):
+        if self.training:
+            self.images += len(self.yb[0])
+
+    def after_train(self):
+        self.seconds += time.perf_counter() - self.start
+
+    @property
+    def images_per_second(self) -> float:
+        return self.images / self.seconds if self.seconds else 0.0
+
+
+def profile_callbacks(settings) -> list:
+    """Callbacks applying the settings that aren't DataLoader arguments."""
+    callbacks = []
+    if settings["persistent_workers"] and settings["num_workers"] != 0:
+        callbacks.append(PersistentWorkers())
+    if settings["channels_last"]:
+        callbacks.append(ChannelsLastCPU())
+    if settings["bf16"]:
+        callbacks.append(BF16Autocast())
+    if settings["compile"]:
+        callbacks.append(CompileModel())
+    return callbacks
@@ -0,0 +1,116 @@
+import sys
+import time
+import pandas as pd
+import torch
+from fastai.callback.core import Callback
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+from components.reports import PROFILE_FILE
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, in MB (None where `resource` is unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+
+class ProfilerCallback(Callback):
+    """
+    Records the wall time of each phase of every batch and writes it to
+    `profile.csv`, next to the `history.csv` of CSVLogger:
+
+    - data: waiting for the DataLoader (decoding, augmentation, collation)
+    - forward / loss / backward / step: the model and the optimizer
+    - callbacks: zero_grad and the after_batch callbacks (UI, telemetry, loggers)
+
+    It runs after every other callback, so each phase also includes the
+    callbacks of the event that starts it. Pass an instance (not the class) to
+    `fine_tune` to keep the frozen and unfrozen fits in the same file. Each row
+    records whether its fit trained the frozen or the unfrozen network: a run
+    with the feature cache, or resumed, doesn't profile the frozen fit first.
+    """
+    order = 1000
+
+    def __init__(self, fname=PROFILE_FILE) -> None:
+        self.fname = fname
+        self.rows = []
+        self.fit_idx = -1
+
+    def before_fit(self):
+        self.fit_idx += 1
+        self.phase = "frozen" if getattr(self.opt, "frozen_idx", 0) else "unfrozen"
+        self.sync = torch.cuda.is_available()  # kernels are asynchronous on GPU
+
+    def before_train(self):
+        self.__start_split("train")
+
+    def before_validate(self):
+        self.__start_split("valid")
+
+    def before_batch(self):
+        self.marks = {"before_batch": self.__now()}
+
+    def after_pred(self):
+        self.marks["after_pred"] = self.__now()
+
+    def after_loss(self):
+        self.marks["after_loss"] = self.__now()
+
+    def after_backward(self):
+        self.marks["after_backward"] = self.__now()
+
+    def after_step(self):
+        self.marks["after_step"] = self.__now()
+
+    def after_batch(self):
+        end = self.__now()
+        m = self.marks
+        last_model_mark = m.get("after_step", m.get("after_loss", m["before_batch"]))
+        row = {
+            "fit": self.fit_idx,
+            "phase": self.phase,
+            "epoch": self.epoch,
+            "split": self.split,
+            "batch": self.iter,
+            "images": self.__batch_size(),
+            "data": m["before_batch"] - self.batch_end,
+            "forward": m.get("after_pred", m["before_batch"]) - m["before_batch"],
+            "loss": m.get("after_loss", m.get("after_pred", m["before_batch"])) - m.get("after_pred", m["before_batch"]),
+            "backward": m["after_backward"] - m["after_loss"] if "after_backward" in m else 0.0,
+            "step": m["after_step"] - m["after_backward"] if "after_step" in m else 0.0,
+            "callbacks": end - last_model_mark,
+            "total": end - self.batch_end,
+        }
+        row["images_per_s"] = row["images"] / row["total"] if row["total"] > 0 else None
+        row["peak_rss_mb"] = peak_rss_mb()
+        self.rows.append(row)
+        self.batch_end = end
+
+    def after_epoch(self):
+        self.__write()
+
+    def after_fit(self):
+        self.__write()
+
+    def __start_split(self, split):
+        self.split = split
+        self.batch_end = self.__now()  # the first "data" phase includes starting the DataLoader iterator
+
+    def __batch_size(self):
+        x = self.xb[0] if len(self.xb) else None
+        return int(x.shape[0]) if hasattr(x, "shape") else 0
+
+    def __now(self):
+        if self.sync:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def __write(self):
+        if self.rows:
+            pd.DataFrame(self.rows).to_csv(self.learn.path / self.fname, index=False)
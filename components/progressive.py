@@ -0,0 +1,69 @@
+"""
+Progressive resizing: the first epochs of a training see downscaled
+spectrograms, the last ones the full 128x128 images.
+
+The DataLoaders keep producing full-resolution batches and `ProgressiveResize`
+downscales them before the forward pass, so switching resolution needs no new
+DataLoaders (nor new shards of the tensor cache) and keeps the same split and
+workers. Convolutions cost ~4x less at 64x64 than at 128x128.
+"""
+import math
+import time
+import torch.nn.functional as F
+from fastai.callback.core import Callback
+
+# (side in pixels, share of the epochs); the last phase is the full resolution
+PROGRESSIVE_SCHEDULE = [(64, 0.5), (96, 0.25), (None, 0.25)]
+
+
+def epoch_sizes(n_epochs, full_size, schedule=PROGRESSIVE_SCHEDULE) -> list:
+    """Side of the images of each epoch. The last epoch is always at `full_size`."""
+    sizes = []
+    done = 0.0
+    for size, share in schedule:
+        done += share
+        sizes += [size or full_size] * (math.floor(done * n_epochs + 0.5) - len(sizes))
+    sizes = sizes[:n_epochs - 1] + [full_size]
+    return sizes + [full_size] * (n_epochs - len(sizes))
+
+
+class ProgressiveResize(Callback):
+    """
+    Downscales the batches (training and validation) of every epoch to the size
+    given by `epoch_sizes`, counting the epochs of all the fits (the frozen and
+    unfrozen phases of `fine_tune`) from `done`, the epochs trained before a
+    resume. `self.rows` has the resolution and the time of every epoch.
+    """
+    order = -5  # before ChannelsLastCPU changes the memory format
+
+    def __init__(self, n_epochs, full_size, schedule=PROGRESSIVE_SCHEDULE, done=0) -> None:
+        self.sizes = epoch_sizes(n_epochs, full_size, schedule)
+        self.done = done
+        self.full_size = full_size
+        self.rows = []
+        self.fit_idx = -1
+
+    def before_fit(self):
+        self.fit_idx += 1
+
+    def before_epoch(self):
+        self.size = self.sizes[min(self.done + len(self.rows), len(self.sizes) - 1)]
+        self.start = time.perf_counter()
+
+    def before_batch(self):
+        if self.size == self.full_size:
+            return
+        x = self.xb[0]
+        if x.shape[-2:] != (self.size, self.size):
+            x = F.interpolate(x, size=(self.size, self.size), mode="bilinear", antialias=True, align_corners=False)
+        self.learn.xb = (x,) + tuple(self.xb[1:])
+
+    def after_epoch(self):
+        self.rows.append({"fit": self.fit_idx, "epoch": self.epoch, "resolution": f"{self.size}x{self.size}",
+                          "seconds": time.perf_counter() - self.start})
+
+    def seconds_per_resolution(self) -> dict:
+        seconds = {}
+        for row in self.rows:
+            seconds[row["resolution"]] = seconds.get(row["resolution"], 0.0) + row["seconds"]
+        return seconds
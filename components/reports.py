@@ -0,0 +1,89 @@
+"""
+Readers of the files that trainings save next to a model (profile.csv,
+leaderboard.csv, optimization.json, scaling.csv). They only need pandas, so the pages
+showing them don't import torch or fastai.
+"""
+import json
+import math
+import os
+import pandas as pd
+
+PROFILE_FILE = "profile.csv"  # components/profiler.py
+PHASES = ["data", "forward", "loss", "backward", "step", "callbacks"]
+LEADERBOARD_FILE = "leaderboard.csv"  # components/search.py
+REPORT_FILE = "optimization.json"  # components/optimize.py
+SCALING_FILE = "scaling.csv"  # components/distributed.py
+SCALING_COLUMNS = ["created", "run", "architecture", "transform", "batch_size", "world_size", "nnodes", "threads",
+                   "images_per_second", "train_seconds"]
+
+
+def profile_summary(profile: pd.DataFrame):
+    """
+    Per-epoch breakdown of a profile.csv: seconds spent in each phase, images
+    per second and peak RSS, one row per (fit, phase, epoch, split).
+    """
+    if "phase" not in profile:  # written before the phase was recorded
+        profile = profile.assign(phase="fit " + profile["fit"].astype(str))
+    grouped = profile.groupby(["fit", "phase", "epoch", "split"], sort=True)
+    summary = grouped[PHASES + ["total", "images"]].sum()
+    summary["images_per_s"] = summary["images"] / summary["total"]
+    summary["peak_rss_mb"] = grouped["peak_rss_mb"].max()
+    return summary.reset_index()
+
+
+def read_leaderboard(search_path):
+    path = os.path.join(search_path, LEADERBOARD_FILE)
+    return pd.read_csv(path) if os.path.exists(path) else None
+
+
+def read_report(model_path):
+    path = os.path.join(model_path, REPORT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def report_table(report):
+    """One row per variant: size, latency, speedup and F1 against fp32."""
+    rows = []
+    for name, result in report["variants"].items():
+        if "error" in result:
+            rows.append({"variant": name, "error": result["error"]})
+            continue
+        rows.append({
+            "variant": name,
+            "size_mb": result["size_mb"],
+            "size_reduction": result.get("size_reduction", 0.0),
+            "latency_bs1_ms": result["latency_bs1_ms"],
+            "latency_batch_ms": result["latency_batch_ms"],
+            "speedup_bs1": result.get("speedup_bs1", 1.0),
+            "speedup_batch": result.get("speedup_batch", 1.0),
+            "f1_score": result["f1_score"],
+            "f1_diff": result.get("f1_diff", 0.0),
+            "agreement": result.get("agreement", 1.0),
+        })
+    return pd.DataFrame(rows)
+
+
+def read_scaling(save_path) -> pd.DataFrame:
+    """
+    Runs of scaling.csv, with the speedup and efficiency of each one relative to
+    the single-process runs of the same architecture, transform and batch size.
+    """
+    path = os.path.join(save_path, SCALING_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=SCALING_COLUMNS + ["speedup", "efficiency"])
+    runs = pd.read_csv(path)
+    config = ["architecture", "transform", "batch_size"]
+    single = runs[runs["world_size"] == 1].groupby(config)["images_per_second"].mean().rename("single")
+    runs = runs.join(single, on=config)
+    runs["speedup"] = runs["images_per_second"] / runs["single"]
+    runs["efficiency"] = runs["speedup"] / runs["world_size"]
+    return runs.drop(columns=["single"])
+
+
+def scaling_counts(max_processes) -> list:
+    """1, 2, 4... up to `max_processes` processes."""
+    counts = [2 ** i for i in range(int(math.log2(max_processes)) + 1)]
+    return counts if counts[-1] == max_processes else counts + [max_processes]
@@ -0,0 +1,160 @@
+"""
+Inference without fastai.
+
+`export_runtime` writes, next to a model.pkl, the network as TorchScript
+(model.pt) and what is needed to feed it (model.json): the vocabulary, the
+item transform and the normalization statistics. `InferenceModel` loads them
+with torch only, which starts faster and uses less memory than `load_learner`.
+"""
+import copy
+import json
+import os
+import threading
+import numpy as np
+import torch
+from PIL import Image
+
+SCRIPT_FILE = "model.pt"
+META_FILE = "model.json"
+
+_engine_lock = threading.Lock()
+_engine_set = False  # whether an int8 network already chose the quantized engine of the process
+
+
+def preprocessing_of(item_tfm) -> tuple:
+    """("resize" or "center_crop", (width, height)) of a Resize/RandomCrop, as applied to validation images."""
+    from fastai.vision.all import Resize, RandomCrop
+
+    if isinstance(item_tfm, Resize):
+        preprocessing = "resize"  # center crop to the aspect ratio, then bilinear resize
+    elif isinstance(item_tfm, RandomCrop):
+        preprocessing = "center_crop"  # what RandomCrop does on the validation set, zero padded
+    else:
+        raise ValueError(f"Unsupported item transform: {item_tfm}")
+    return preprocessing, tuple(item_tfm.size)
+
+
+def normalization_of(dls) -> tuple:
+    """(mean, std) lists of the Normalize transform of fastai DataLoaders."""
+    from fastai.vision.all import Normalize
+
+    norms = [tfm for tfm in dls.after_batch.fs if isinstance(tfm, Normalize)]
+    mean = norms[0].mean.flatten().tolist() if norms else [0.0, 0.0, 0.0]
+    std = norms[0].std.flatten().tolist() if norms else [1.0, 1.0, 1.0]
+    return mean, std
+
+
+def preprocess_image(image, preprocessing, size) -> np.ndarray:
+    """RGB uint8 array (or path to a PNG) -> HWC uint8 array of `size` (width, height)."""
+    image = Image.open(image).convert("RGB") if isinstance(image, (str, os.PathLike)) else Image.fromarray(image).convert("RGB")
+    w, h = image.size
+    width, height = size
+    if preprocessing == "resize":
+        m = min(w / width, h / height)
+        crop_w, crop_h = int(m * width), int(m * height)
+        left, top = int(0.5 * (w - crop_w)), int(0.5 * (h - crop_h))
+        return np.asarray(image.crop((left, top, left + crop_w, top + crop_h)).resize((width, height), Image.BILINEAR))
+
+    # center crop, padding with zeros where the image is smaller than the crop
+    left, top = (w - width) // 2, (h - height) // 2
+    src = np.asarray(image)
+    out = np.zeros((height, width, 3), dtype=np.uint8)
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + width, w), min(top + height, h)
+    out[y0 - top:y1 - top, x0 - left:x1 - left] = src[y0:y1, x0:x1]
+    return out
+
+
+def export_runtime(learner, item_tfm, model_path) -> None:
+    """Exports the network of a fastai learner trained with the `item_tfm` Resize/RandomCrop."""
+    from components.spectrogram import PREPROCESSING_VERSION
+
+    preprocessing, (width, height) = preprocessing_of(item_tfm)
+    mean, std = normalization_of(learner.dls)
+
+    model = copy.deepcopy(learner.model).cpu().eval()
+    with torch.no_grad():
+        script = torch.jit.freeze(torch.jit.trace(model, torch.zeros(1, 3, height, width)))
+    script.save(os.path.join(model_path, SCRIPT_FILE))
+
+    with open(os.path.join(model_path, META_FILE), "w") as f:
+        json.dump({
+            "vocab": [str(label) for label in learner.dls.vocab],
+            "preprocessing": preprocessing,
+            "width": width,
+            "height": height,
+            "mean": mean,
+            "std": std,
+            "spectrogram_version": PREPROCESSING_VERSION,
+        }, f, indent=2)
+
+
+def has_runtime(model_path) -> bool:
+    return os.path.exists(os.path.join(model_path, SCRIPT_FILE)) and os.path.exists(os.path.join(model_path, META_FILE))
+
+
+def read_meta(model_path) -> dict:
+    with open(os.path.join(model_path, META_FILE)) as f:
+        return json.load(f)
+
+
+def use_quantized_engine(engine) -> None:
+    """
+    Selects the quantized engine of an int8 network. The setting is process-wide:
+    the first int8 network loaded sets it, and one quantized for another engine
+    is refused rather than switching it under the networks already in use.
+    """
+    global _engine_set
+    with _engine_lock:
+        current = torch.backends.quantized.engine
+        if engine == current:
+            return
+        if _engine_set:
+            raise RuntimeError(f"This network was quantized for the {engine} engine, but {current} is already in use")
+        torch.backends.quantized.engine = engine
+        _engine_set = True
+
+
+def variants(model_path) -> list:
+    """Names of the exported networks: "fp32" and the variants of components/optimize.py."""
+    return ["fp32"] + list(read_meta(model_path).get("variants", {}))
+
+
+class InferenceModel:
+    """
+    TorchScript network + preprocessing. Gives the same probabilities as
+    `learner.get_preds(dl=learner.dls.test_dl(images))` on the exported learner.
+    `variant` selects one of the optimized networks listed in model.json.
+    """
+    def __init__(self, model_path, variant="fp32") -> None:
+        meta = read_meta(model_path)
+        self.vocab = meta["vocab"]
+        self.preprocessing = meta["preprocessing"]
+        self.size = (meta["width"], meta["height"])
+        self.mean = torch.tensor(meta["mean"]).view(1, 3, 1, 1)
+        self.std = torch.tensor(meta["std"]).view(1, 3, 1, 1)
+
+        spec = {"file": SCRIPT_FILE} if variant == "fp32" else meta["variants"][variant]
+        if spec.get("quantized_engine"):
+            use_quantized_engine(spec["quantized_engine"])
+        self.memory_format = torch.channels_last if spec.get("channels_last") else torch.contiguous_format
+        self.model = torch.jit.load(os.path.join(model_path, spec["file"]), map_location="cpu").eval()
+        self.nbytes = os.path.getsize(os.path.join(model_path, spec["file"]))
+
+    def preprocess(self, image) -> np.ndarray:
+        """RGB uint8 array (or path to a PNG) -> HWC uint8 array of the network's input size."""
+        return preprocess_image(image, self.preprocessing, self.size)
+
+    def inputs(self, images) -> torch.Tensor:
+        """Normalized NCHW batch fed to the network."""
+        x = torch.from_numpy(np.stack([self.preprocess(image) for image in images]))
+        x = (x.permute(0, 3, 1, 2).float() / 255 - self.mean) / self.std
+        return x.contiguous(memory_format=self.memory_format)
+
+    def predict(self, images, bs=64) -> torch.Tensor:
+        """(n_items, n_classes) tensor of probabilities."""
+        probs = []
+        with torch.inference_mode():
+            for i in range(0, len(images), bs):
+                probs.append(torch.softmax(self.model(self.inputs(images[i:i + bs])), dim=1))
+        return torch.cat(probs) if probs else torch.zeros(0, len(self.vocab))
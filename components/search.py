@@ -0,0 +1,259 @@
+"""
+Hyperparameter search over architecture, transform, batch size, learning rate
+and epochs, with asynchronous successive halving (ASHA) and a CPU-time budget.
+
+Every trial starts with `fine_tune` for `min_epochs`. After each rung, only the
+best 1/`eta` trials of the rung (by validation F1 macro) are promoted and
+trained `eta` times longer, continuing with the unfrozen schedule of
+`fine_tune`; the others stop there. Trials, their history.csv and model.pkl,
+and leaderboard.csv are saved in database/<user>/<search_name>/.
+
+    python -m components.search --user alice --name search1 --speakers awb bdl --noises 0 \
+        --archs ResNet18 ResNet50 --batch-sizes 16 32 --lrs 1e-3 4e-3 --max-epochs 9 --budget-minutes 120
+"""
+import itertools
+import json
+import os
+import random
+import time
+import pandas as pd
+from fastai.callback.core import Callback, CancelFitException
+from components.reports import LEADERBOARD_FILE
+
+SEARCH_SEED = 42 # same validation split for every trial, so their F1 scores are comparable
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process and of its finished children (e.g. DataLoader workers)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def rung_epochs(min_epochs, max_epochs, eta) -> list:
+    """Epochs at the end of each rung, e.g. (1, 9, 3) -> [1, 3, 9]."""
+    epochs = [min_epochs]
+    while epochs[-1] * eta < max_epochs:
+        epochs.append(epochs[-1] * eta)
+    if epochs[-1] < max_epochs:
+        epochs.append(max_epochs)
+    return epochs
+
+
+def read_history(model_path):
+    """history.csv of a trial; empty when the budget ran out before its first epoch."""
+    try:
+        return pd.read_csv(f"{model_path}/history.csv").dropna(subset=["epoch"])
+    except (FileNotFoundError, pd.errors.EmptyDataError, KeyError):
+        return pd.DataFrame(columns=["epoch"])
+
+
+class HyperparameterSearch:
+    def __init__(self, username, search_name, selected_speakers, selected_noises, architectures, transforms, batch_sizes, learning_rates,
+                 min_epochs=1, max_epochs=9, eta=3, budget_minutes=60, max_trials=None, use_shards=False, seed=SEARCH_SEED) -> None:
+        from components.training import user_engine
+
+        self.username = username
+        self.search_name = search_name
+        self.search_path = f"{user_engine(username).save_path}/{search_name}"
+        self.selected_speakers = selected_speakers
+        self.selected_noises = selected_noises
+        self.use_shards = use_shards
+        self.seed = seed
+        self.eta = eta
+        self.rungs = rung_epochs(min_epochs, max_epochs, eta)
+        self.budget = budget_minutes * 60
+
+        configs = list(itertools.product(architectures, transforms, batch_sizes, learning_rates))
+        random.Random(seed).shuffle(configs)
+        self.configs = configs[:max_trials] if max_trials else configs
+        self.trials = []
+        self.results = [dict() for _ in self.rungs]  # per rung: trial id -> F1
+        self.promoted = [set() for _ in self.rungs]
+
+    def run(self):
+        """Runs trials until the search or the budget is exhausted. Returns the leaderboard."""
+        os.makedirs(self.search_path, exist_ok=True)
+        self.start = cpu_seconds()
+        self.started = time.time()
+        self.__write_state("running")
+        print(f"⏳ {len(self.configs)} configurations, rungs at {self.rungs} epochs, budget {self.budget / 60:g} CPU minutes.", flush=True)
+
+        while True:
+            if self.__spent() >= self.budget:
+                print("⏹️ CPU-time budget exhausted.", flush=True)
+                break
+            job = self.__next_job()
+            if job is None:
+                break
+            trial, rung = job
+            self.__run_rung(trial, rung)
+            self.__write_leaderboard()
+
+        for trial in self.trials:
+            if trial["state"] == "running":
+                trial["state"] = "stopped"
+        leaderboard = self.__write_leaderboard()
+        self.__write_state("done")
+        return leaderboard
+
+    def __next_job(self):
+        """ASHA: promote the best pending trial of the highest rung, otherwise start a new configuration."""
+        for rung in reversed(range(len(self.rungs) - 1)):
+            ranked = sorted(self.results[rung].items(), key=lambda item: item[1], reverse=True)
+            for trial_id, _ in ranked[:len(ranked) // self.eta]:
+                if trial_id not in self.promoted[rung]:
+                    self.promoted[rung].add(trial_id)
+                    return self.trials[trial_id], rung + 1
+        if len(self.trials) < len(self.configs):
+            architecture_name, transform_type, bs, lr = self.configs[len(self.trials)]
+            trial = {
+                "trial": len(self.trials),
+                "name": f"trial{len(self.trials):03d}_{architecture_name}_{transform_type.replace(' ', '')}_bs{bs}_lr{lr:g}",
+                "architecture": architecture_name,
+                "transform": transform_type,
+                "batch_size": bs,
+                "learning_rate": lr,
+                "epochs": 0,
+                "f1_score": None,
+                "valid_loss": None,
+                "cpu_minutes": 0.0,
+                "state": "running",
+            }
+            self.trials.append(trial)
+            return trial, 0
+        return None
+
+    def __run_rung(self, trial, rung):
+        from fastai.vision.all import CSVLogger
+        from components.training import TrainingEngine
+        from components.sinks import ConsoleSink
+
+        sink = ConsoleSink(prefix=trial["name"])
+        engine = TrainingEngine(self.search_path)
+        start = cpu_seconds()
+        if not engine.prepare(trial["name"], trial["architecture"], trial["transform"], self.selected_speakers, self.selected_noises,
+                              trial["batch_size"], self.use_shards, sink, seed=self.seed):
+            trial["state"] = "failed"
+            return
+
+        learn = engine.model
+        epochs = self.rungs[rung] - trial["epochs"]
+        budget = BudgetCallback(self.start + self.budget)
+        previous = read_history(engine.model_path) if trial["epochs"] else None
+        try:
+            with sink.fitting(learn):
+                if trial["epochs"] == 0:
+                    learn.fine_tune(epochs, base_lr=trial["learning_rate"], cbs=[CSVLogger, budget])
+                else:
+                    # Continue where the previous rung stopped, with the unfrozen phase of fine_tune
+                    learn.load("trial", with_opt=True)
+                    learn.unfreeze()
+                    base_lr = trial["learning_rate"] / 2
+                    learn.fit_one_cycle(epochs, slice(base_lr / 100, base_lr), pct_start=0.3, div=5.0, cbs=[CSVLogger, budget])
+            # read before save_plots: its get_preds overwrites the last record of the Recorder
+            values = dict(zip(learn.recorder.metric_names[1:-1], learn.recorder.values[-1])) if learn.recorder.values else {}
+            learn.save("trial", with_opt=True)
+            engine.export_model()
+            engine.save_plots()
+        except Exception as e:
+            sink.error(f"❌ Error in training: {str(e)}")
+            trial["state"] = "failed"
+            return
+        finally:
+            trial["cpu_minutes"] += (cpu_seconds() - start) / 60
+
+        history = read_history(engine.model_path)
+        if previous is not None:
+            history["epoch"] += len(previous)
+            history = pd.concat([previous, history], ignore_index=True)
+        history.to_csv(f"{engine.model_path}/history.csv", index=False)
+
+        trial["epochs"] = len(history)
+        trial["f1_score"] = values.get("f1_score")
+        trial["valid_loss"] = values.get("valid_loss")
+        if budget.exceeded:
+            trial["state"] = "budget exceeded"
+        elif rung == len(self.rungs) - 1:
+            trial["state"] = "completed"
+        else:
+            self.results[rung][trial["trial"]] = trial["f1_score"] if trial["f1_score"] is not None else -1
+        sink.info(f"Rung {rung} ({self.rungs[rung]} epochs): F1 {trial['f1_score']}, {self.__spent() / 60:.1f}/{self.budget / 60:g} CPU minutes used.")
+
+    def __spent(self) -> float:
+        return cpu_seconds() - self.start
+
+    def __write_leaderboard(self):
+        leaderboard = pd.DataFrame(self.trials)
+        if len(leaderboard):
+            leaderboard = leaderboard.sort_values(["f1_score", "epochs"], ascending=False, na_position="last")
+        leaderboard.to_csv(os.path.join(self.search_path, LEADERBOARD_FILE), index=False)
+        return leaderboard
+
+    def __write_state(self, state) -> None:
+        with open(os.path.join(self.search_path, "search.json"), "w") as f:
+            json.dump({
+                "state": state,
+                "started": self.started,
+                "speakers": self.selected_speakers,
+                "noises": self.selected_noises,
+                "rungs": self.rungs,
+                "eta": self.eta,
+                "budget_minutes": self.budget / 60,
+                "configurations": len(self.configs),
+            }, f, indent=2)
+
+
+class BudgetCallback(Callback):
+    """Cancels the fit once the CPU time reaches `deadline`."""
+    def __init__(self, deadline) -> None:
+        self.deadline = deadline
+        self.exceeded = False
+
+    def before_fit(self):
+        self.__check()
+
+    def after_batch(self):
+        self.__check()
+
+    def __check(self):
+        if cpu_seconds() >= self.deadline:
+            self.exceeded = True
+            raise CancelFitException()
+
+
+def run_search(username, **params):
+    """Entry point of the search jobs (components/jobs.py). Returns the leaderboard."""
+    return HyperparameterSearch(username, **params).run()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Hyperparameter search with successive halving and a CPU-time budget.")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--name", required=True, help="Results are saved in database/<user>/<name>/")
+    parser.add_argument("--speakers", nargs="+", required=True)
+    parser.add_argument("--noises", nargs="+", default=["0"])
+    parser.add_argument("--archs", nargs="+", default=["ResNet18"])
+    parser.add_argument("--transforms", nargs="+", default=["Resize"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[32])
+    parser.add_argument("--lrs", nargs="+", type=float, default=[2e-3])
+    parser.add_argument("--min-epochs", type=int, default=1)
+    parser.add_argument("--max-epochs", type=int, default=9)
+    parser.add_argument("--eta", type=int, default=3, help="Only the best 1/eta trials of a rung are promoted")
+    parser.add_argument("--budget-minutes", type=float, default=60, help="Total CPU time")
+    parser.add_argument("--max-trials", type=int, default=None)
+    parser.add_argument("--use-shards", action="store_true")
+    args = parser.parse_args()
+
+    leaderboard = run_search(
+        args.user, search_name=args.name, selected_speakers=args.speakers, selected_noises=args.noises,
+        architectures=args.archs, transforms=args.transforms, batch_sizes=args.batch_sizes, learning_rates=args.lrs,
+        min_epochs=args.min_epochs, max_epochs=args.max_epochs, eta=args.eta, budget_minutes=args.budget_minutes,
+        max_trials=args.max_trials, use_shards=args.use_shards,
+    )
+    print(leaderboard.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Options of a training that the pages list before anything is trained: the
+architectures, transforms and performance profiles. Only names and plain
+settings live here, so the Training page renders without importing torch or
+fastai; components/training.py and components/performance.py map them to the
+actual models, transforms and DataLoader settings.
+"""
+DATABASE_PATH = "database"
+
+ARCHITECTURE_NAMES = ["VGG16", "VGG19", "ResNet18", "ResNet34", "ResNet50", "alexnet"]  # keys of training.ARCHITECTURES
+TRANSFORM_NAMES = ["Resize", "Random Crop"]  # keys of training.TRANSFORMS
+
+# Performance profiles, see components/performance.py
+DEFAULT_PROFILE = "Default"
+DEFAULT_SETTINGS = {
+    "num_workers": None,
+    "persistent_workers": False,
+    "prefetch_factor": 2,
+    "bf16": False,
+    "channels_last": False,
+    "compile": False,
+}
+PROFILES = {
+    DEFAULT_PROFILE: {},
+    "Fast loading": {"num_workers": 4, "persistent_workers": True, "prefetch_factor": 4},
+    "bf16 + channels-last": {"num_workers": 4, "persistent_workers": True, "prefetch_factor": 4, "bf16": True, "channels_last": True},
+    "Compiled": {"num_workers": 4, "persistent_workers": True, "prefetch_factor": 4, "bf16": True, "channels_last": True, "compile": True},
+}
+
+
+def profile_settings(profile) -> dict:
+    """Settings of a profile, given by name or as a dict of the settings that differ from the defaults."""
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown performance profile: {profile}")
+        profile = PROFILES[profile]
+    unknown = set(profile) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown performance settings: {', '.join(sorted(unknown))}")
+    return dict(DEFAULT_SETTINGS, **profile)
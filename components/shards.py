@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import numpy as np
+import torch
+from fastai.vision.all import DataLoader, DataLoaders, Pipeline, TensorImage, TensorCategory, IntToFloatTensor, RandomSplitter, CategoryMap, CrossEntropyLossFlat, default_device
+from PIL import Image
+
+SHARD_DIR = "database/.cache/shards"
+SHARD_SIZE = 128 # Same resolution as the 'Resize' transform of components/training.py
+
+
+def subset_fingerprint(entries) -> str:
+    """Changes whenever a file of the subset is added, removed or modified."""
+    digest = hashlib.sha256()
+    for path, size, mtime in zip(entries["path"], entries["size"], entries["mtime"]):
+        digest.update(f"{path}|{size}|{mtime}\n".encode())
+    return digest.hexdigest()
+
+
+def _decode(path, size) -> np.ndarray:
+    """
+    Decodes a spectrogram the way `Resize((size, size))` does on the validation
+    set: center crop to a square, then bilinear resize. Returns a CHW uint8 array.
+    """
+    image = Image.open(path).convert("RGB")
+    w, h = image.size
+    side = min(w, h)
+    left, top = (w - side) // 2, (h - side) // 2
+    image = image.crop((left, top, left + side, top + side)).resize((size, size), Image.BILINEAR)
+    return np.asarray(image).transpose(2, 0, 1)
+
+
+def build_shard(manifest, noise, speaker, size=SHARD_SIZE, shard_dir=SHARD_DIR):
+    """
+    Decodes every image of a (noise, speaker) subset once into a memory-mapped
+    uint8 array of shape (n_images, 3, size, size). The shard is reused while the
+    manifest fingerprint of the subset stays the same, and rebuilt otherwise.
+    Returns (images, labels, paths), `images` being opened read-only with mmap.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    entries = manifest.entries([speaker], [noise])
+    fingerprint = subset_fingerprint(entries)
+    base = os.path.join(shard_dir, f"{noise}_{speaker}_{size}")
+
+    meta = None
+    if os.path.exists(base + ".json") and os.path.exists(base + ".npy"):
+        with open(base + ".json") as f:
+            meta = json.load(f)
+        if meta["fingerprint"] != fingerprint:
+            meta = None
+
+    if meta is None:
+        paths, labels = list(entries["path"]), list(entries["label"])
+        tmp_path = f"{base}.{os.getpid()}.tmp.npy"
+        images = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(len(paths), 3, size, size))
+        for i, path in enumerate(paths):
+            images[i] = _decode(path, size)
+        images.flush()
+        del images
+        os.replace(tmp_path, base + ".npy")
+
+        meta = {"fingerprint": fingerprint, "size": size, "paths": paths, "labels": labels}
+        with open(base + ".json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(base + ".json.tmp", base + ".json")
+
+    return np.load(base + ".npy", mmap_mode="r"), meta["labels"], meta["paths"]
+
+
+class ShardDataset:
+    """Concatenation of several shards, indexed as a single dataset."""
+    def __init__(self, shards, vocab) -> None:
+        self.shards = shards  # list of memmapped arrays
+        self.vocab = vocab
+        self.offsets = np.cumsum([0] + [len(s) for s in shards])
+        self.targets = np.zeros(0, dtype=np.int64)
+
+    def set_labels(self, labels) -> None:
+        o2i = {label: i for i, label in enumerate(self.vocab)}
+        self.targets = np.array([o2i[label] for label in labels], dtype=np.int64)
+
+    def gather(self, idxs) -> np.ndarray:
+        """Reads the rows `idxs` straight from the memory maps, shard by shard, in disk order."""
+        idxs = np.asarray(idxs)
+        out = np.empty((len(idxs),) + self.shards[0].shape[1:], dtype=np.uint8)
+        shard_ids = np.searchsorted(self.offsets, idxs, side="right") - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            rows = idxs[mask] - self.offsets[shard_id]
+            order = np.argsort(rows)
+            out[np.flatnonzero(mask)[order]] = self.shards[shard_id][rows[order]]
+        return out
+
+    def new_empty(self):
+        return ShardDataset([np.zeros((0,) + self.shards[0].shape[1:], dtype=np.uint8)], self.vocab)
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+
+class ShardSubset:
+    """View of a ShardDataset restricted to the indices of a split."""
+    def __init__(self, dataset, idxs) -> None:
+        self.dataset = dataset
+        self.idxs = np.asarray(idxs, dtype=np.int64)
+        self.vocab = dataset.vocab
+        self.loss_func = CrossEntropyLossFlat()  # what vision_learner infers for a CategoryBlock
+
+    def new_empty(self):
+        return ShardSubset(self.dataset.new_empty(), [])
+
+    def __getitem__(self, i):
+        return i  # items are only gathered per batch, in ShardDL.create_batch
+
+    def __len__(self) -> int:
+        return len(self.idxs)
+
+
+class ShardDL(DataLoader):
+    """
+    DataLoader that builds each batch with a single gather over the memory maps,
+    skipping the per-item PNG decoding and resizing.
+    """
+    def create_item(self, s):
+        return s
+
+    def create_batch(self, b):
+        idxs = self.dataset.idxs[np.asarray(b)]
+        x = torch.from_numpy(self.dataset.dataset.gather(idxs))
+        y = torch.from_numpy(self.dataset.dataset.targets[idxs])
+        return TensorImage(x), TensorCategory(y)
+
+    def retain(self, res, b):
+        return res
+
+
+def shard_dataloaders(manifest, speakers, noises, bs, valid_pct=0.3, size=SHARD_SIZE, seed=None, **kwargs) -> DataLoaders:
+    """
+    Same split and labels as `ImageDataLoaders.from_path_func(..., valid_pct=valid_pct)`
+    with a 'Resize' item transform, but reading the pre-decoded shards.
+    """
+    shards, labels, paths = [], [], []
+    for noise in noises:
+        for speaker in speakers:
+            images, shard_labels, shard_paths = build_shard(manifest, noise, speaker, size)
+            if len(images):
+                shards.append(images)
+                labels += shard_labels
+                paths += shard_paths
+
+    vocab = CategoryMap(labels)
+    dataset = ShardDataset(shards, vocab)
+    dataset.set_labels(labels)
+    dataset.paths = paths
+    train_idx, valid_idx = RandomSplitter(valid_pct, seed=seed)(paths)
+
+    train = ShardDL(ShardSubset(dataset, train_idx), bs=bs, shuffle=True, drop_last=True, after_batch=Pipeline([IntToFloatTensor()]), **kwargs)
+    valid = ShardDL(ShardSubset(dataset, valid_idx), bs=bs, shuffle=False, after_batch=Pipeline([IntToFloatTensor()]), **kwargs)
+    dls = DataLoaders(train, valid, path=".", device=default_device())
+    dls.vocab = vocab
+    dls.c = len(vocab)
+    return dls
+
+
+def inference_dls(dls, item_tfms, label_func):
+    """
+    Regular fastai DataLoaders with the same vocab and normalization as `dls`,
+    built from a handful of the original images. Learners trained on shards are
+    exported with these, so `load_learner(...).predict`/`dls.test_dl` keep
+    working on PNGs and arrays in the Evaluation page.
+    """
+    from pathlib import Path
+
+    dataset = dls.train.dataset.dataset
+    first_of_label = {}
+    for path, target in zip(dataset.paths, dataset.targets):
+        first_of_label.setdefault(target, Path(path))
+    return image_dls(dls, list(first_of_label.values()), dataset.vocab, item_tfms, label_func)
+
+
+def image_dls(dls, fnames, vocab, item_tfms, label_func):
+    """Image DataLoaders of `fnames` with the vocab and normalization of `dls` (see `inference_dls`)."""
+    from fastai.vision.all import DataBlock, ImageBlock, CategoryBlock, IndexSplitter, Normalize
+
+    dblock = DataBlock(
+        blocks=(ImageBlock, CategoryBlock(vocab=list(vocab))),
+        get_y=label_func,
+        splitter=IndexSplitter(range(len(fnames), 2 * len(fnames))),
+        item_tfms=item_tfms,
+        batch_tfms=[tfm for tfm in dls.after_batch.fs if isinstance(tfm, Normalize)],
+    )
+    return dblock.dataloaders(fnames + fnames, path=dls.path, bs=1, device=dls.device)
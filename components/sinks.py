@@ -0,0 +1,70 @@
+"""
+Where a training reports its messages and progress: the engine of
+components/training.py calls a ProgressSink, the Training page shows them with
+the StreamlitSink of components/model.py and the command line prints them.
+"""
+from contextlib import contextmanager
+
+
+class ProgressSink:
+    """
+    Receives the messages and progress of a training. The base class ignores
+    everything; subclasses override what they display.
+    """
+    def info(self, message) -> None:
+        pass
+
+    def warning(self, message) -> None:
+        pass
+
+    def error(self, message) -> None:
+        pass
+
+    def callbacks(self) -> list:
+        """Extra fastai callbacks added to the training (progress bars, stop buttons...)."""
+        return []
+
+    @contextmanager
+    def fitting(self, learn):
+        """Wraps the call to fine_tune."""
+        yield
+
+    def finished(self, engine) -> None:
+        """Called once the model and its plots are saved in `engine.model_path`."""
+        pass
+
+
+class ConsoleSink(ProgressSink):
+    """Prints everything, one line per epoch, prefixed with the run name when several runs share the output."""
+    def __init__(self, prefix="") -> None:
+        self.prefix = f"[{prefix}] " if prefix else ""
+
+    def info(self, message) -> None:
+        print(self.prefix + message, flush=True)
+
+    def warning(self, message) -> None:
+        print(self.prefix + message, flush=True)
+
+    def error(self, message) -> None:
+        print(self.prefix + message, flush=True)
+
+    @contextmanager
+    def fitting(self, learn):
+        logger = learn.logger
+        learn.logger = lambda log: self.__log(learn, log)
+        self.header = None
+        try:
+            with learn.no_bar():
+                yield
+        finally:
+            learn.logger = logger
+
+    def finished(self, engine) -> None:
+        self.info(f"✅ Training completed! Model saved in {engine.model_path}/model.pkl")
+
+    def __log(self, learn, log):
+        # The Recorder logs one row per epoch; the progress bar used to print the header
+        if self.header != learn.recorder.metric_names:
+            self.header = learn.recorder.metric_names
+            print(self.prefix + "  ".join(self.header), flush=True)
+        print(self.prefix + "  ".join(f"{v:.4f}" if isinstance(v, float) else str(v) for v in log), flush=True)
@@ -0,0 +1,148 @@
+import io
+import os
+import sys
+import tempfile
+import numpy as np
+
+# Parameters of the training spectrograms, written by generate_single_spec
+# (components/VoCoderRecognition/lib/melspectrogram_custom.py): librosa's default
+# mel settings on the 22050 Hz audios of setup.sh, rendered with `specshow`
+# (whose default colormap for dB data is 'magma') on a figure without axes and
+# saved as PNG. Every in-memory spectrogram must go through the same steps,
+# otherwise the model sees images that differ from the PNGs it was trained on;
+# tests/test_spectrogram.py compares both when the submodule is checked out.
+SPEC_CONFIG = {
+    "sr": 22050,
+    "n_fft": 2048,
+    "hop_length": 512,
+    "n_mels": 128,
+    "fmin": 0,
+    "fmax": None,  # sr / 2
+    "crop_width": 64,
+    "discard_if_too_narrow": True,
+    "cmap": None,  # chosen by specshow: 'magma'
+    "figsize": (2.56, 5.12),
+    "dpi": 100,
+}
+# Bump whenever SPEC_CONFIG or mel_image changes, so cached spectrograms are invalidated
+PREPROCESSING_VERSION = 2
+
+
+def load_audio(data: bytes, sr=SPEC_CONFIG["sr"]) -> np.ndarray:
+    """Decodes the bytes of an audio file, resampled to the training sample rate."""
+    import librosa
+
+    audio, _ = librosa.load(io.BytesIO(data), sr=sr)
+    return audio
+
+
+def add_noise(audio: np.ndarray, noise_level, rng=None) -> np.ndarray:
+    """Adds white gaussian noise scaled by `noise_level`, as done for the /dataset/<noise> folders."""
+    if not noise_level:
+        return audio
+    rng = np.random.default_rng() if rng is None else rng
+    return (audio + noise_level * rng.standard_normal(len(audio))).astype(np.float32)
+
+
+def mel_db(audio: np.ndarray, config=SPEC_CONFIG) -> np.ndarray:
+    """Mel spectrogram in dB, shape (n_mels, n_frames)."""
+    import librosa
+
+    mel = librosa.feature.melspectrogram(
+        y=audio,
+        sr=config["sr"],
+        n_fft=config["n_fft"],
+        hop_length=config["hop_length"],
+        n_mels=config["n_mels"],
+        fmin=config["fmin"],
+        fmax=config["fmax"],
+    )
+    return librosa.power_to_db(mel, ref=np.max)
+
+
+def db_to_image(db: np.ndarray, config=SPEC_CONFIG) -> np.ndarray:
+    """
+    Renders a dB spectrogram as the RGB uint8 image of the training PNGs, with the
+    steps of generate_single_spec: specshow without axes, saved tight as PNG
+    (into memory here).
+    """
+    import librosa.display
+    from matplotlib.figure import Figure
+    from PIL import Image
+
+    fig = Figure(figsize=config["figsize"], dpi=config["dpi"])  # not pyplot: pages render from several threads
+    ax = fig.subplots()
+    colormap = {"cmap": config["cmap"]} if config["cmap"] else {}  # specshow picks its own default otherwise
+    librosa.display.specshow(db, sr=config["sr"], hop_length=config["hop_length"], fmin=config["fmin"], fmax=config["fmax"], ax=ax, **colormap)
+    ax.axis("off")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight", pad_inches=0)
+    buffer.seek(0)
+    return np.asarray(Image.open(buffer).convert("RGB"))
+
+
+def mel_image(audio: np.ndarray, noise_level=0, rng=None, config=SPEC_CONFIG):
+    """
+    Spectrogram image of an audio, cropped to `crop_width` frames.
+    Returns None when the audio is too short and `discard_if_too_narrow` is set.
+    """
+    db = mel_db(add_noise(audio, noise_level, rng), config)
+    crop_width = config["crop_width"]
+    if db.shape[1] < crop_width and config["discard_if_too_narrow"]:
+        return None
+    return db_to_image(db[:, :crop_width], config)
+
+
+def image_from_bytes(data: bytes, persist_path=None):
+    """
+    Uploaded audio bytes -> spectrogram image, without touching the disk.
+    The image is only written to `persist_path` when one is given (display/auditing).
+    """
+    image = mel_image(load_audio(data))
+    if image is not None and persist_path is not None:
+        from PIL import Image
+        Image.fromarray(image).save(persist_path)
+    return image
+
+
+def spectrogram_parity(wav_path) -> float:
+    """
+    Compares the in-memory spectrogram of `wav_path` with the PNG written by
+    `generate_single_spec`. Returns the largest absolute pixel difference
+    (0 means both paths feed the model exactly the same image).
+    """
+    from PIL import Image
+    from components.VoCoderRecognition.lib.melspectrogram_custom import generate_single_spec
+
+    with open(wav_path, "rb") as f:
+        image = image_from_bytes(f.read())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        name = os.path.basename(wav_path)
+        with open(wav_path, "rb") as src, open(os.path.join(tmp_dir, name), "wb") as dst:
+            dst.write(src.read())
+        generate_single_spec(
+            "mel", tmp_dir, tmp_dir, name, 0,
+            crop_width=SPEC_CONFIG["crop_width"],
+            discard_if_too_narrow=SPEC_CONFIG["discard_if_too_narrow"]
+        )
+        png_path = os.path.join(tmp_dir, os.path.splitext(name)[0] + ".png")
+        reference = np.asarray(Image.open(png_path).convert("RGB")) if os.path.exists(png_path) else None
+
+    if image is None or reference is None:
+        if image is None and reference is None:
+            return 0.0
+        raise ValueError(f"Only one of the pipelines discarded {wav_path} as too short.")
+    if image.shape != reference.shape:
+        raise ValueError(f"Shape mismatch: in-memory {image.shape} vs PNG {reference.shape}")
+    return float(np.abs(image.astype(np.int16) - reference.astype(np.int16)).max())
+
+
+if __name__ == "__main__":
+    # python -m components.spectrogram clip1.wav clip2.wav ...
+    worst = 0.0
+    for wav_path in sys.argv[1:]:
+        diff = spectrogram_parity(wav_path)
+        worst = max(worst, diff)
+        print(f"{wav_path}: max pixel difference {diff:.0f}")
+    sys.exit(1 if worst > 0 else 0)
@@ -0,0 +1,123 @@
+import threading
+from collections import deque
+import pandas as pd
+from fastai.callback.core import Callback
+
+
+class MetricsRing:
+    """
+    Fixed-size buffer of training events shared by the training loop and the
+    renderer. `deque.append` and `popleft` are atomic, so the training loop never
+    waits on a lock; if the renderer falls behind, the oldest events are dropped.
+    """
+    def __init__(self, maxlen=4096) -> None:
+        self._events = deque(maxlen=maxlen)
+
+    def publish(self, event) -> None:
+        self._events.append(event)
+
+    def drain(self) -> list:
+        events = []
+        while True:
+            try:
+                events.append(self._events.popleft())
+            except IndexError:
+                return events
+
+
+class TelemetryCallback(Callback):
+    """
+    Publishes batch and epoch metrics into a MetricsRing. Nothing is rendered and
+    the loss is kept as a detached tensor: the conversion to a Python float (a
+    device sync on GPU) happens in the renderer, only for the events it shows.
+    """
+    order = 60 # after the Recorder, so epoch metrics are available in after_epoch
+
+    def __init__(self, ring: MetricsRing) -> None:
+        self.ring = ring
+
+    def after_batch(self):
+        if self.training:
+            self.ring.publish(("batch", self.epoch, self.iter, self.n_iter, self.loss.detach()))
+
+    def after_epoch(self):
+        names = [name for name in self.recorder.metric_names[1:-1]] # drop "epoch" and "time"
+        self.ring.publish(("epoch", self.epoch, dict(zip(names, self.recorder.log[1:-1]))))
+
+
+class TelemetryRenderer:
+    """
+    Draws the events of a MetricsRing at a fixed wall-clock rate from its own
+    thread: the status line and progress bar show the latest batch, and the loss
+    chart only receives the new points (`add_rows`) instead of being redrawn.
+    Streamlit versions without `add_rows` get the accumulated points re-sent,
+    thinned out to at most `max_points`.
+    """
+    def __init__(self, ring: MetricsRing, status, progress, chart, refresh_hz=2.0, max_points=1000) -> None:
+        self.ring = ring
+        self.status = status
+        self.progress = progress
+        self.chart_placeholder = chart
+        self.interval = 1.0 / refresh_hz
+        self.chart = None
+        self.history = None
+        self.max_points = max_points
+        self.step = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+        self._thread = threading.Thread(target=self.__run, name="telemetry-renderer", daemon=True)
+        add_script_run_ctx(self._thread, get_script_run_ctx())  # allows the thread to update the page
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the thread and renders whatever is still in the ring."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.render()
+
+    def render(self) -> None:
+        events = self.ring.drain()
+        if not events:
+            return
+
+        rows, last_batch, last_epoch = [], None, None
+        for event in events:
+            if event[0] == "batch":
+                last_batch = event
+                self.step += 1
+                rows.append({"step": self.step, "train_loss": event[4].item(), "valid_loss": None})
+            elif event[0] == "epoch":
+                last_epoch = event
+                rows.append({"step": self.step, "train_loss": None, "valid_loss": event[2].get("valid_loss")})
+
+        if last_batch is not None:
+            _, epoch, batch, n_iter, loss = last_batch
+            self.status.code(f"Epoch {epoch}: \nBatch {batch}: Loss {loss.item():.4f}")
+            self.progress.progress(min(1.0, (batch + 1) / n_iter))
+        if last_epoch is not None and (last_batch is None or last_epoch[1] >= last_batch[1]):
+            self.status.code(f"Epoch {last_epoch[1]} complete!")
+            self.progress.progress(1.0)
+
+        if rows:
+            df = pd.DataFrame(rows).set_index("step").astype(float)
+            if self.chart is None:
+                self.chart = self.chart_placeholder.line_chart(df)
+                self.history = df
+            elif callable(getattr(type(self.chart), "add_rows", None)):
+                self.chart.add_rows(df)
+            else:
+                self.history = pd.concat([self.history, df])
+                if len(self.history) > self.max_points:
+                    # keep every other point, but never drop the per-epoch validation losses
+                    keep = self.history["valid_loss"].notna() | (pd.Series(range(len(self.history)), index=self.history.index) % 2 == 0)
+                    self.history = self.history[keep]
+                self.chart = self.chart_placeholder.line_chart(self.history)
+
+    def __run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.render()
@@ -0,0 +1,512 @@
+"""
+Training engine shared by the Training page, the background jobs and the
+command line. It has no Streamlit dependency: progress and results are reported
+to a ProgressSink.
+
+Grid of trainings over a process pool:
+
+    python -m components.training --user alice --archs ResNet18 alexnet --transforms Resize \
+        --speakers awb,bdl rms --noises 0 0,0.1 --epochs 5 --bs 32 --workers 4
+
+Each speaker/noise set is a comma-separated list, and every combination of
+architecture x transform x speaker set x noise set is trained as its own run in
+database/<user>/.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import matplotlib.pyplot as plt
+import pandas as pd
+import torch
+import fastai.vision.all as fastai_vision
+from fastai.vision.all import (Callback, ClassificationInterpretation, CSVLogger, F1Score, ImageDataLoaders, RandomCrop, Resize,
+                               alexnet, resnet18, resnet34, resnet50, vgg16, vgg19, vision_learner)
+from components.dataset import get_manifest, label_func
+from components.settings import DATABASE_PATH, DEFAULT_PROFILE, profile_settings
+from components.sinks import ConsoleSink
+from components.catalog import RUN_FILE
+from components.shards import shard_dataloaders, inference_dls
+from components.noise_augment import describe_report, noisy_dataloaders, noisy_inference_dls, storage_report
+from components.profiler import ProfilerCallback
+from components.runtime import export_runtime
+from components.optimize import optimize_model
+from components.features import fit_head, split_paths, FREEZE_EPOCHS, BASE_LR
+from components.progressive import PROGRESSIVE_SCHEDULE, ProgressiveResize
+from components.checkpoints import CheckpointCallback, fit_one_cycle_from, load_checkpoint
+from components.checkpoint_files import CHECKPOINT_EVERY, CHECKPOINT_KEEP, latest_checkpoint, remove_checkpoints
+from components.distributed import DDP_BACKEND, DistributedTrainer, broadcast_seed, is_distributed, rank, total_images, world_size
+from components.performance import ThroughputCallback, compile_available, loader_kwargs, profile_callbacks, set_prefetch
+
+SPLIT_FILE = "split.json"
+
+ARCHITECTURES = {
+    'VGG16': vgg16,
+    'VGG19': vgg19,
+    'ResNet18': resnet18,
+    'ResNet34': resnet34,
+    'ResNet50': resnet50,
+    'alexnet' : alexnet,
+}
+TRANSFORMS = {
+    'Resize': Resize((128, 128)),
+    'Random Crop': RandomCrop(128),
+}
+
+
+def eval_callbacks(callbacks: list) -> list:
+    """Evaluates callbacks written as strings, e.g. "EarlyStoppingCallback(patience=3)"."""
+    safe_callbacks = []
+    for cb in callbacks:
+        cb = cb.strip()
+        if cb == "":
+            continue
+
+        cb = eval(cb, vars(fastai_vision))  # the names of `from fastai.vision.all import *`
+
+        # Verifica se é uma instância de Callback
+        if not isinstance(cb, Callback):
+            raise Exception(f"'{cb}' is not a valid fastai Callback.")
+
+        safe_callbacks.append(cb)
+
+    return safe_callbacks
+
+
+class TrainingEngine:
+    """
+    Trains, exports and plots a model in `save_path`:
+
+    - model.pkl, the exported learner, and model.pt/model.json for components/runtime.py
+    - split.json, the train/validation images, and run.json, the settings of the run
+    - history.csv (CSVLogger) and, when profiling, profile.csv
+    - results.png (losses) and confusion_matrix.png
+    - checkpoints/, while the run is not complete (components/checkpoints.py)
+    """
+    architectures = ARCHITECTURES
+    transforms = TRANSFORMS
+
+    def __init__(self, save_path) -> None:
+        self.save_path = save_path
+        os.makedirs(self.save_path, exist_ok=True)
+
+    def train(self, user_model_name, architecture_name, transform_type, selected_speakers, selected_noises, num_epochs, num_batches,
+              callbacks=(), use_shards=False, profile=False, optimize=False, performance=DEFAULT_PROFILE, progressive=False, feature_cache=False,
+              checkpoint_every=CHECKPOINT_EVERY, keep_checkpoints=CHECKPOINT_KEEP, noise_on_the_fly=False, sink=None, checkpoint=None) -> bool:
+        """
+        Returns True when the model was trained and saved. With `optimize`, the
+        int8/channels-last variants of components/optimize.py are built too.
+        `performance` is a profile of components/performance.py. With
+        `progressive`, the first epochs are trained on downscaled images
+        (components/progressive.py). With `feature_cache`, the frozen phase of
+        fine_tune trains the head on cached features (components/features.py).
+        With `noise_on_the_fly`, the noise levels are generated from the clean
+        audios while loading instead of read from /dataset (components/noise_augment.py).
+
+        A checkpoint is saved every `checkpoint_every` epochs (0 disables them)
+        and the last `keep_checkpoints` are kept until the run completes
+        (components/checkpoints.py). `callbacks` are fastai callbacks or strings;
+        only strings can be restored by `resume`. `checkpoint` is a loaded
+        checkpoint of this run to continue from.
+        """
+        sink = ConsoleSink() if sink is None else sink
+        sources = [cb for cb in callbacks if isinstance(cb, str) and cb.strip()]
+        try:
+            callbacks = eval_callbacks(sources) + [cb for cb in callbacks if not isinstance(cb, str)]
+        except Exception as e:
+            sink.error(f"❌ Error in callback: {str(e)}")
+            return False
+        seed = random.randrange(2**31) if checkpoint is None else checkpoint["seed"]  # the split is rebuilt from it on resume
+        distributed = is_distributed()  # started by components/distributed.py: only rank 0 writes the run
+        if distributed:
+            seed = broadcast_seed(seed)
+        leader = rank() == 0
+        if not self.prepare(user_model_name, architecture_name, transform_type, selected_speakers, selected_noises, num_batches, use_shards, sink,
+                            seed=seed, performance=performance, noise_on_the_fly=noise_on_the_fly):
+            return False
+        if distributed and self.performance["compile"]:
+            sink.warning("⚠️ torch.compile is not used in distributed training.")
+            self.performance["compile"] = False
+        params = dict(
+            user_model_name=user_model_name, architecture_name=architecture_name, transform_type=transform_type,
+            selected_speakers=list(selected_speakers), selected_noises=list(selected_noises), num_epochs=num_epochs, num_batches=num_batches,
+            callbacks=sources, use_shards=use_shards, profile=profile, optimize=optimize, performance=performance, progressive=progressive,
+            feature_cache=feature_cache, checkpoint_every=checkpoint_every, keep_checkpoints=keep_checkpoints, noise_on_the_fly=noise_on_the_fly,
+        )
+        if feature_cache and noise_on_the_fly:
+            sink.warning("⚠️ The feature cache is computed from the PNGs of /dataset, so it is not used with on-the-fly noise.")
+            feature_cache = False
+        train_paths, valid_paths = split_paths(self.model.dls)
+        split = {"train": [str(p) for p in train_paths], "valid": [str(p) for p in valid_paths]}
+
+        # Where to start: the frozen fit (0) or the unfrozen one (1), after `start_epoch` epochs
+        start_fit, start_epoch, history = 0, 0, []
+        if checkpoint is not None:
+            start_fit, start_epoch, history = checkpoint["fit"], checkpoint["epoch"], checkpoint["history"]
+            if start_epoch >= checkpoint["n_epoch"]:
+                start_fit, start_epoch, history = start_fit + 1, 0, []
+            if split != checkpoint["split"]:
+                sink.warning("⚠️ The selected datasets changed since the checkpoint, so the train/validation split is different.")
+            self.run_info["resumed_from"] = {"fit": checkpoint["fit"], "epoch": checkpoint["epoch"]}
+        frozen_epochs = 0 if feature_cache else FREEZE_EPOCHS
+
+        try:
+            all_callbacks = [
+                CSVLogger,
+            ] if leader else []
+            if distributed:
+                all_callbacks.append(DistributedTrainer())
+            all_callbacks.extend(sink.callbacks())
+            all_callbacks.extend(callbacks)
+            all_callbacks.extend(profile_callbacks(self.performance))
+            throughput = ThroughputCallback()
+            all_callbacks.append(throughput)
+            if progressive:
+                done = 0 if start_fit == 0 else frozen_epochs + start_epoch
+                resize = ProgressiveResize(num_epochs + frozen_epochs, self.transform.size[0], done=done)
+                all_callbacks.append(resize)
+            if profile and leader:
+                all_callbacks.append(ProfilerCallback())
+            checkpointer = CheckpointCallback(self.model_path, {"params": params, "seed": seed, "split": split}, checkpoint_every if leader else 0, keep_checkpoints,
+                                              first_fit=max(start_fit, 1 if feature_cache else 0), first_epoch=start_epoch, history=history)
+            all_callbacks.append(checkpointer)
+
+            # fine_tune, split in its two fits so that each can start from a checkpoint
+            if start_fit == 0 and feature_cache:
+                self.fit_head(selected_speakers, selected_noises, num_batches, sink)
+            with sink.fitting(self.model):
+                if start_fit == 0 and not feature_cache:
+                    self.model.freeze()
+                    if checkpoint is not None:
+                        self.restore(checkpoint, with_opt=True)
+                    fit_one_cycle_from(self.model, FREEZE_EPOCHS, start_epoch, slice(BASE_LR), pct_start=0.99, cbs=all_callbacks)
+                self.model.unfreeze()
+                if checkpoint is not None and start_fit >= 1:
+                    self.restore(checkpoint, with_opt=start_fit == checkpoint["fit"])
+                if start_fit <= 1:  # 2: the training was complete, only its export failed
+                    fit_one_cycle_from(self.model, num_epochs, start_epoch if start_fit == 1 else 0, slice(BASE_LR / 2 / 100, BASE_LR / 2),
+                                       pct_start=0.3, div=5.0, cbs=all_callbacks)
+            self.performance["images_per_second"] = throughput.images_per_second
+            self.performance["train_seconds"] = throughput.seconds
+            if distributed:
+                images = total_images(throughput.images)
+                self.performance["images_per_second"] = images / throughput.seconds if throughput.seconds else 0.0
+                self.run_info["distributed"] = {"backend": DDP_BACKEND, "world_size": world_size(), "images": images}
+                if not leader:
+                    return True
+            sink.info(f"⚡ {self.performance['images_per_second']:.1f} training images per second with the '{self.performance['profile']}' profile.")
+            if start_fit == 1 and start_epoch:
+                self.merge_history(history, start_epoch)
+            if progressive:
+                self.save_resolutions(resize, frozen_epochs)
+                sink.info("📐 Time per resolution: " + ", ".join(f"{res} {seconds:.0f} s" for res, seconds in self.run_info["progressive"]["seconds"].items()))
+
+            self.export_model()
+            self.save_plots()
+
+        except Exception as e:
+            sink.error(f"❌ Error in training: {str(e)}")
+            return False
+
+        if checkpointer.cancelled:
+            if latest_checkpoint(self.model_path) is not None:
+                sink.info("💾 Training stopped: its checkpoints are kept, to resume it later.")
+        else:
+            remove_checkpoints(self.model_path)
+        if optimize:
+            self.optimize(sink)
+        sink.finished(self)
+        return True
+
+    def resume(self, run_name, sink=None) -> bool:
+        """Continues the run `run_name` from its latest checkpoint, with the settings it was started with."""
+        sink = ConsoleSink() if sink is None else sink
+        path = latest_checkpoint(f"{self.save_path}/{run_name}")
+        if path is None:
+            sink.error("❌ This run has no checkpoint to resume from.")
+            return False
+        try:
+            checkpoint = load_checkpoint(path)
+        except Exception as e:
+            sink.error(f"❌ Error loading the checkpoint: {str(e)}")
+            return False
+        phase = "frozen" if checkpoint["fit"] == 0 else "unfrozen"
+        sink.info(f"♻️ Resuming {run_name} after epoch {checkpoint['epoch']}/{checkpoint['n_epoch']} of the {phase} phase.")
+        return self.train(**checkpoint["params"], sink=sink, checkpoint=checkpoint)
+
+    def restore(self, checkpoint, with_opt):
+        """Loads the weights, and the optimizer state, of a checkpoint. Called after freeze/unfreeze, which clear the optimizer."""
+        self.model.model.load_state_dict(checkpoint["model"])
+        if with_opt:
+            self.model.opt.load_state_dict(checkpoint["opt"])
+
+    def prepare(self, user_model_name, architecture_name, transform_type, selected_speakers, selected_noises, num_batches, use_shards, sink, seed=None,
+                performance=DEFAULT_PROFILE, noise_on_the_fly=False) -> bool:
+        """
+        Builds the DataLoaders and the learner (`self.model`) of a run in `self.model_path`.
+        A fixed `seed` gives the same train/validation split every time.
+        """
+        self.user_model_name = None if user_model_name.strip()=="" else user_model_name.strip()
+
+        if architecture_name not in self.architectures:
+            sink.error("❌ Architecture not supported.")
+            return False
+
+        if transform_type not in self.transforms:
+            sink.error("❌ Transformation not supported.")
+            return False
+
+        self.transform = self.transforms[transform_type]
+        self.use_shards = use_shards and transform_type == "Resize"
+        if use_shards and not self.use_shards:
+            sink.warning("⚠️ The tensor cache only supports the 'Resize' transformation. Training will decode the images instead.")
+        self.noise_on_the_fly = noise_on_the_fly
+        if self.use_shards and noise_on_the_fly:
+            sink.warning("⚠️ The tensor cache is decoded from the PNGs of /dataset, so it is not used with on-the-fly noise.")
+            self.use_shards = False
+
+        try:
+            self.performance = dict(profile=performance if isinstance(performance, str) else "Custom", **profile_settings(performance))
+        except ValueError as e:
+            sink.error(f"❌ {str(e)}")
+            return False
+        if self.performance["compile"] and not compile_available():
+            sink.warning("⚠️ torch.compile is not available here (it needs a C++ compiler). Training without it.")
+            self.performance["compile"] = False
+
+        try:
+            if self.use_shards:
+                sink.info("⏳ Preparing the tensor cache. Subsets already cached are reused.")
+            dls = self.dataloaders(selected_speakers, selected_noises, num_batches, seed)
+            sink.info(f"✅ Selected {len(dls.train.dataset)+len(dls.valid.dataset)} images. Training will start soon!")
+            if noise_on_the_fly:
+                noise_report = storage_report(selected_speakers, selected_noises, get_manifest())
+                sink.info(f"🌪️ Noise injected on the fly: {describe_report(noise_report)}")
+
+        except Exception as e:
+            sink.error(f"❌ Error loading data: {str(e)}")
+            return False
+
+        try:
+            self.model_path = f"{self.save_path}/{run_folder(user_model_name, architecture_name, transform_type)}"
+            os.makedirs(self.model_path, exist_ok=True)
+            self.run_info = {
+                "architecture": architecture_name,
+                "transform": transform_type,
+                "speakers": list(selected_speakers),
+                "noises": [str(n) for n in selected_noises],
+                "batch_size": num_batches,
+                "use_shards": self.use_shards,
+                "performance": self.performance,
+                "created": time.time(),
+            }
+            if noise_on_the_fly:
+                self.run_info["noise_on_the_fly"] = noise_report
+            self.model = vision_learner(dls, self.architectures[architecture_name], metrics=F1Score(average='macro'), path=self.model_path)
+
+        except Exception as e:
+            sink.error(f"❌ Error in training: {str(e)}")
+            return False
+
+        return True
+
+    def dataloaders(self, selected_speakers, selected_noises, num_batches, seed=None):
+        kwargs = loader_kwargs(self.performance)
+        if self.use_shards:
+            dls = shard_dataloaders(get_manifest(), selected_speakers, selected_noises, bs=num_batches, valid_pct=0.3, seed=seed, **kwargs)
+        elif self.noise_on_the_fly:
+            dls = noisy_dataloaders(selected_speakers, selected_noises, label_func, bs=num_batches, valid_pct=0.3, seed=seed, item_tfms=self.transform, **kwargs)
+        else:
+            dls = ImageDataLoaders.from_path_func(
+                path=".",
+                fnames=get_manifest().files(selected_speakers, selected_noises),
+                label_func=label_func,
+                bs=num_batches,
+                valid_pct=0.3,
+                seed=seed,
+                item_tfms=self.transform,
+                **kwargs
+            )
+        set_prefetch(dls, self.performance["prefetch_factor"])
+        return dls
+
+    def export_model(self):
+        """
+        Exports the learner to model.pkl. Learners trained on the tensor cache are
+        exported with regular image DataLoaders, so they can classify PNGs/arrays,
+        and so are those trained with on-the-fly noise.
+        The network is also exported for the fastai-free runtime (model.pt/model.json).
+        """
+        if not (self.use_shards or self.noise_on_the_fly):
+            self.model.export("model.pkl")
+        else:
+            dls = self.model.dls
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                if self.use_shards:
+                    self.model.dls = inference_dls(dls, self.transform, label_func)
+                else:
+                    self.model.dls = noisy_inference_dls(dls, self.transform, label_func, tmp_dir)
+                try:
+                    self.model.export("model.pkl")
+                finally:
+                    self.model.dls = dls
+        export_runtime(self.model, self.transform, self.model_path)
+        self.save_split()
+        with open(f"{self.model_path}/{RUN_FILE}", "w") as f:
+            json.dump(self.run_info, f, indent=2)
+
+    def fit_head(self, selected_speakers, selected_noises, num_batches, sink):
+        """Frozen phase of fine_tune on the cached features of the pretrained body."""
+        sink.info("⏳ Training the head on cached features. Features not cached yet are computed once.")
+        self.model.freeze()
+        result = fit_head(self.model, get_manifest(), self.run_info["architecture"], self.run_info["transform"], self.transform,
+                          selected_speakers, selected_noises, num_batches)
+        self.run_info["feature_cache"] = result
+        sink.info(f"✅ Head trained on cached features in {result['extract_seconds'] + result['head_seconds']:.1f} s " \
+                  f"({result['built']}/{result['subsets']} subsets computed): F1 {result['f1_score']:.3f}.")
+
+    def merge_history(self, history, start_epoch):
+        """Puts the epochs of the checkpoint before the ones trained since the resume in history.csv."""
+        path = f"{self.model_path}/history.csv"
+        resumed = pd.read_csv(path)
+        resumed["epoch"] += start_epoch
+        pd.concat([pd.DataFrame(history), resumed], ignore_index=True).to_csv(path, index=False)
+
+    def save_resolutions(self, resize, frozen_epochs):
+        """Adds the resolution of every epoch to history.csv (the unfrozen fit) and the time per resolution to run.json."""
+        history = pd.read_csv(f"{self.model_path}/history.csv")
+        history["resolution"] = [f"{size}x{size}" for size in (resize.sizes[min(frozen_epochs + epoch, len(resize.sizes) - 1)] for epoch in history["epoch"])]
+        history.to_csv(f"{self.model_path}/history.csv", index=False)
+        self.run_info["progressive"] = {
+            "schedule": [[size, share] for size, share in PROGRESSIVE_SCHEDULE],
+            "epochs": resize.rows,
+            "seconds": resize.seconds_per_resolution(),
+        }
+
+    def save_split(self):
+        """Writes the train/validation images to split.json, for evaluations after training (components/optimize.py)."""
+        train, valid = split_paths(self.model.dls)
+        with open(f"{self.model_path}/{SPLIT_FILE}", "w") as f:
+            json.dump({"train": [str(p) for p in train], "valid": [str(p) for p in valid]}, f)
+
+    def optimize(self, sink):
+        sink.info("⏳ Building the CPU inference variants...")
+        try:
+            report = optimize_model(self.model_path, self.model.model)
+        except Exception as e:
+            sink.warning(f"⚠️ The CPU inference variants could not be built: {str(e)}")
+            return
+        for name, result in report["variants"].items():
+            if "error" in result:
+                sink.warning(f"⚠️ {name}: {result['error']}")
+            elif name != "fp32":
+                sink.info(f"✅ {name}: {result.get('speedup_batch', 1):.2f}x faster, {result.get('size_reduction', 0):.0%} smaller, F1 {result.get('f1_diff', 0):+.3f}")
+
+    def save_plots(self):
+        if getattr(self.model.recorder, "losses", None):  # nothing was trained when resuming a complete run
+            fig, ax = plt.subplots()
+            self.model.recorder.plot_loss(ax=ax)
+            fig.savefig(f"{self.model_path}/results.png", bbox_inches="tight", format='png')
+            plt.close(fig)
+
+        with self.model.no_bar():
+            interp = ClassificationInterpretation.from_learner(self.model)
+            interp.plot_confusion_matrix(figsize=(7, 7), normalize=True)
+        plt.savefig(f"{self.model_path}/confusion_matrix.png", format='png')
+        plt.close()
+
+
+def run_folder(user_model_name, architecture_name, transform_type) -> str:
+    """Folder of a run in the user's database."""
+    return user_model_name.strip() or f"model_{architecture_name}_{transform_type}"
+
+
+def user_engine(username) -> TrainingEngine:
+    return TrainingEngine(f"{DATABASE_PATH}/{username}")
+
+
+def _init_grid_worker(threads) -> None:
+    torch.set_num_threads(threads)  # the cores are shared between the runs of the pool
+
+
+def _train_grid_run(username, run_name, params, resume=False) -> tuple:
+    start = time.time()
+    engine = user_engine(username)
+    sink = ConsoleSink(prefix=run_name)
+    if resume and latest_checkpoint(f"{engine.save_path}/{run_name}") is not None:
+        ok = engine.resume(run_name, sink=sink)
+    else:
+        ok = engine.train(run_name, **params, sink=sink)
+    return run_name, ok, time.time() - start
+
+
+def grid_runs(architectures, transforms, speaker_sets, noise_sets, **params) -> dict:
+    """Run name -> arguments of `TrainingEngine.train` for every combination."""
+    runs = {}
+    for architecture_name in architectures:
+        for transform_type in transforms:
+            for speakers in speaker_sets:
+                for noises in noise_sets:
+                    run_name = "_".join([architecture_name, transform_type.replace(" ", ""), "-".join(speakers), "noise" + "-".join(noises)])
+                    runs[run_name] = dict(params, architecture_name=architecture_name, transform_type=transform_type,
+                                          selected_speakers=speakers, selected_noises=noises)
+    return runs
+
+
+def main():
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    parser = argparse.ArgumentParser(description="Trains a grid of models without the Streamlit app.")
+    parser.add_argument("--user", required=True, help="Models are saved in database/<user>/")
+    parser.add_argument("--archs", nargs="+", default=["ResNet18"], choices=list(ARCHITECTURES))
+    parser.add_argument("--transforms", nargs="+", default=["Resize"], choices=list(TRANSFORMS))
+    parser.add_argument("--speakers", nargs="+", required=True, help="Speaker sets, e.g. awb,bdl rms")
+    parser.add_argument("--noises", nargs="+", default=["0"], help="Noise level sets, e.g. 0 0,0.1")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--bs", type=int, default=32)
+    parser.add_argument("--callbacks", nargs="*", default=[], help='e.g. "EarlyStoppingCallback(monitor=\'f1_score\', patience=3)"')
+    parser.add_argument("--use-shards", action="store_true", help="Train on the pre-decoded tensor cache")
+    parser.add_argument("--profile", action="store_true", help="Write profile.csv for every run")
+    parser.add_argument("--optimize", action="store_true", help="Build the int8/channels-last inference variants of every run")
+    parser.add_argument("--feature-cache", action="store_true", help="Train the head on cached features of the frozen body")
+    parser.add_argument("--progressive", action="store_true", help="Train the first epochs on downscaled images")
+    parser.add_argument("--noise-on-the-fly", action="store_true", help="Generate the noise levels from the clean audios instead of reading /dataset")
+    parser.add_argument("--performance", default=DEFAULT_PROFILE, help="Performance profile of components/performance.py, e.g. 'Fast loading'")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="Epochs between checkpoints, 0 to disable them")
+    parser.add_argument("--keep-checkpoints", type=int, default=CHECKPOINT_KEEP, help="Checkpoints kept per run")
+    parser.add_argument("--resume", action="store_true", help="Continue the runs that have a checkpoint instead of training them again")
+    parser.add_argument("--workers", type=int, default=1, help="Runs trained at the same time")
+    args = parser.parse_args()
+
+    runs = grid_runs(
+        args.archs, args.transforms,
+        [s.split(",") for s in args.speakers], [n.split(",") for n in args.noises],
+        num_epochs=args.epochs, num_batches=args.bs, callbacks=args.callbacks, use_shards=args.use_shards, profile=args.profile,
+        optimize=args.optimize, performance=args.performance, progressive=args.progressive,
+        feature_cache=args.feature_cache, checkpoint_every=args.checkpoint_every, keep_checkpoints=args.keep_checkpoints,
+        noise_on_the_fly=args.noise_on_the_fly,
+    )
+    eval_callbacks(args.callbacks)  # fail now rather than in every run
+    profile_settings(args.performance)
+    get_manifest()  # index /dataset once, before the runs read it concurrently
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    print(f"⏳ {len(runs)} runs, {args.workers} at a time with {threads} threads each.", flush=True)
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_grid_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(_train_grid_run, args.user, run_name, params, args.resume) for run_name, params in runs.items()]
+        for future in as_completed(futures):
+            run_name, ok, seconds = future.result()
+            print(f"{'✅' if ok else '❌'} {run_name} ({seconds / 60:.1f} min)", flush=True)
+            if not ok:
+                failed.append(run_name)
+
+    print(f"{len(runs) - len(failed)}/{len(runs)} runs trained.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import streamlit as st
 import streamlit_authenticator as stauth
+from utils.config import credentials_store
 
 def getUserContext():
-    stauth.Authenticate("config.yaml").login(location='unrendered')
\ No newline at end of file
+    credentials = credentials_store.credentials()
+    stauth.Authenticate(credentials, **credentials_store.settings()).login(location='unrendered')
+    credentials_store.save_credentials(credentials)
\ No newline at end of file
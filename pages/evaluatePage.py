@@ -1,17 +1,18 @@
 import streamlit as st
-from fastai.vision.all import load_learner
-from components.VoCoderRecognition.lib.melspectrogram_custom import generate_single_spec
 import os
 from PIL import Image
 from context.userContext import getUserContext
 import pandas as pd
+from utils.cache import learner_cache, load_learner_cached, load_model_cached, prediction_cache
+from components.reports import read_report
+from components.inference import CONFIDENCE_THRESHOLD, model_vocab, read_uploaded_audios, predict_audios, results_table, window_seconds, iter_windows, classify_timeline
 
 def uploaded_model_button():
     new_model = st.file_uploader("Upload a PKL file containing the model", type=["pkl"])
     if new_model:
-        global model
+        global model, model_key
         try:
-            model = load_learner(new_model)
+            model_key, model = load_learner_cached(new_model.getvalue())
             show_model_eval = st.checkbox("🔍 Show Model Evaluation")
             if show_model_eval:
                 st.write(model.eval())
@@ -21,6 +22,7 @@ def uploaded_model_button():
 
 getUserContext()
 model = None
+model_key = None
 SAVE_DIR = f"database/{st.session_state.username}/uploads"
 os.makedirs(SAVE_DIR, exist_ok=True)
 
@@ -32,7 +34,24 @@ if "trained_model" in st.session_state: # this case, it detected that the user j
 
     if option == "Use trained model":
         try:
-            model = load_learner(st.session_state.trained_model)
+            from components.runtime import has_runtime, variants
+
+            variant = "fp32"
+            model_dir = os.path.dirname(st.session_state.trained_model)
+            if has_runtime(model_dir) and len(variants(model_dir)) > 1:
+                variant = st.selectbox(
+                    "Inference variant", variants(model_dir),
+                    help="Versions of the model built for CPU inference after training. int8 versions are smaller and faster, " \
+                        "but their predictions may differ slightly from the original (fp32) ones."
+                )
+                report = read_report(model_dir)
+                result = report["variants"].get(variant, {}) if report else {}
+                if "f1_score" in result:
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Speedup (batch)", f"{result.get('speedup_batch', 1.0):.2f}x")
+                    col2.metric("Size", f"{result['size_mb']:.1f} MB", f"{-result.get('size_reduction', 0.0):.0%}", delta_color="inverse")
+                    col3.metric("Validation F1", f"{result['f1_score']:.3f}", f"{result.get('f1_diff', 0.0):+.3f}")
+            model_key, model = load_model_cached(st.session_state.trained_model, variant)
         except Exception as e:
             st.error(f"An unexpected error occurred while loading the model: {e}")
 
@@ -46,30 +65,163 @@ else:
 
 
 if model is not None:
+    mode = st.radio("Evaluation mode:", ["Single audio", "Batch", "Long recording"], horizontal=True)
+    persist = st.checkbox(
+        "💾 Keep a copy of the audios and spectrograms",
+        value=False,
+        help=f"Audios are analyzed in memory. Check this to also save them (and their spectrograms) in {SAVE_DIR} for auditing."
+    )
+
+if model is not None and mode == "Batch":
+    uploaded_batch = st.file_uploader(
+        "Upload audios to test (WAV files or a ZIP archive)",
+        type=["wav", "zip"],
+        accept_multiple_files=True
+    )
+    batch_size = st.number_input(
+        "🧺 Batch Size",
+        min_value=1,
+        step=1,
+        value=64,
+        help="Number of spectrograms classified at once. Larger batches are faster but require more memory."
+    )
+
+    if uploaded_batch and st.button("🚀 Evaluate batch"):
+        batch_dir = os.path.join(SAVE_DIR, "batch") if persist else None
+        if persist:
+            os.makedirs(batch_dir, exist_ok=True)
+
+        with st.spinner("Generating Mel spectrograms and classifying..."):
+            audios = read_uploaded_audios(uploaded_batch, persist_dir=batch_dir)
+            names = [name for name, _ in audios]
+            images, probs, hits = predict_audios(
+                model, model_key, [data for _, data in audios],
+                bs=batch_size, cache=prediction_cache, lock=learner_cache.lock(model_key)
+            )
+
+        kept = [i for i, image in enumerate(images) if image is not None]
+        skipped = [names[i] for i, image in enumerate(images) if image is None]
+        if persist:
+            for i in kept:
+                Image.fromarray(images[i]).save(os.path.join(batch_dir, os.path.splitext(names[i])[0] + ".png"))
+        if skipped:
+            st.warning(f"⚠️ {len(skipped)} audio(s) were too short to be analyzed: {', '.join(skipped)}")
+
+        if kept:
+            df = results_table([names[i] for i in kept], probs[kept], model_vocab(model))
+            df.insert(4, "Cached", [hits[i] for i in kept])
+            # Kept per model (and inference variant), so another model doesn't show these results
+            st.session_state.setdefault("batch_results", {})[model_key] = df
+
+    if model_key in st.session_state.get("batch_results", {}):
+        st.markdown("---")
+        st.subheader("Batch Results:")
+        df = st.session_state.batch_results[model_key]
+        col1, col2, col3 = st.columns(3)
+        col1.metric(label="🎧 **Audios analyzed**", value=len(df))
+        col2.metric(label="✅ **Classified as HUMAN**", value=int(((df["Class"] == "bonafide") & ~df["Inconclusive"]).sum()))
+        col3.metric(label="⚖️ **Inconclusive**", value=int(df["Inconclusive"].sum()))
+
+        prob_cols = [c for c in df.columns if c == "Confidence" or c.startswith("P(")]
+        st.dataframe(df.style.format({c: "{:.2%}" for c in prob_cols}), hide_index=True)
+        st.download_button(
+            label="📥 Download Results (CSV)",
+            data=df.to_csv(index=False),
+            file_name="batch_results.csv",
+            mime="text/csv"
+        )
+
+if model is not None and mode == "Long recording":
+    uploaded_long = st.file_uploader("Upload a recording to analyze over time", type=["wav"], key="long_audio")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        window_s = window_seconds()
+        st.metric("🪟 Window", f"{window_s:.2f} s", help="Length of each analyzed segment: the length of the spectrogram crops the model was trained on.")
+    with col2:
+        overlap = st.slider(
+            "🔁 Overlap",
+            min_value=0.0,
+            max_value=0.9,
+            value=0.5,
+            step=0.1,
+            help="Fraction of each window shared with the next one. More overlap gives a smoother timeline but takes longer."
+        )
+    with col3:
+        window_batch = st.number_input("🧺 Batch Size", min_value=1, step=1, value=64, key="window_batch")
+
+    if uploaded_long and st.button("🚀 Analyze recording"):
+        if persist:
+            with open(os.path.join(SAVE_DIR, uploaded_long.name), "wb") as f:
+                f.write(uploaded_long.getvalue())
+        windows = iter_windows(uploaded_long, window_s * (1 - overlap))
+        with st.spinner("Analyzing the recording window by window..."):
+            with learner_cache.lock(model_key):
+                # Kept per model (and inference variant) and recording, like the batch results
+                st.session_state.setdefault("timelines", {})[(model_key, uploaded_long.file_id)] = \
+                    classify_timeline(model, windows, model_vocab(model), bs=window_batch)
+
+    timeline_key = (model_key, uploaded_long.file_id) if uploaded_long else None
+    if timeline_key in st.session_state.get("timelines", {}):
+        timeline, verdict = st.session_state.timelines[timeline_key]
+        st.markdown("---")
+        if verdict is None:
+            st.warning("⚠️ This recording is too short to be analyzed.")
+        else:
+            st.subheader("Analysis Results:")
+            if verdict["Inconclusive"]:
+                st.warning("## ⚖️ Analysis Inconclusive!")
+            elif verdict["Class"] == "bonafide":
+                st.success("### ✅ This recording is classified as **HUMAN**!")
+            else:
+                st.error("### ❌ This recording is classified as **MACHINE-GENERATED**!")
+            if verdict["Suspicious windows"] and verdict["Class"] == "bonafide":
+                st.warning(f"⚠️ {verdict['Suspicious windows']} segment(s) look machine-generated. The recording may have been partially spliced, check the timeline below.")
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric(label="🔍 **Most Probable Prediction**", value=verdict["Class"])
+            col2.metric(label="📊 **Mean Probability**", value=f"{verdict['Confidence']:.2%}")
+            col3.metric(label="🪟 **Segments analyzed**", value=len(timeline))
+
+            st.subheader("Timeline:")
+            prob_cols = [c for c in timeline.columns if c.startswith("P(")]
+            st.line_chart(timeline.set_index("Start (s)")[prob_cols])
+            with st.expander("### 📈 Segment details:"):
+                st.dataframe(timeline.style.format({c: "{:.2%}" for c in prob_cols + ["Confidence"]}), hide_index=True)
+                st.download_button(
+                    label="📥 Download Timeline (CSV)",
+                    data=timeline.to_csv(index=False),
+                    file_name="timeline.csv",
+                    mime="text/csv"
+                )
+
+if model is not None and mode == "Single audio":
     # Upload an audio file to test the model
     uploaded_audio = st.file_uploader("Upload an audio to test", type=["wav"])
 
     if uploaded_audio:
         st.write(f"Audio uploaded: {uploaded_audio.name}")
 
-        save_path = os.path.join(SAVE_DIR, uploaded_audio.name)
+        audio_bytes = uploaded_audio.getvalue()
+        st.audio(audio_bytes, format="audio/wav")
 
-        with open(save_path, "wb") as f:
-            f.write(uploaded_audio.read())
+        spec_save_path = None
+        if persist:
+            with open(os.path.join(SAVE_DIR, uploaded_audio.name), "wb") as f:
+                f.write(audio_bytes)
+            spec_save_path = os.path.join(SAVE_DIR, os.path.splitext(uploaded_audio.name)[0]+".png")
 
-        st.audio(save_path, format="audio/wav")
-
-        generate_single_spec(
-                            "mel",
-                            SAVE_DIR,
-                            SAVE_DIR,
-                            uploaded_audio.name,
-                            0,
-                            crop_width=64,
-                            discard_if_too_narrow=True
-                        )
-        spec_name = os.path.splitext(uploaded_audio.name)[0]+".png"
-        spec_save_path= os.path.join(SAVE_DIR, spec_name)
+        images, all_probs, hits = predict_audios(
+            model, model_key, [audio_bytes],
+            cache=prediction_cache, lock=learner_cache.lock(model_key)
+        )
+        spec_image, probs = images[0], all_probs[0]
+        if spec_image is None:
+            st.warning("⚠️ This audio is too short to be analyzed. Please upload a longer recording.")
+            st.stop()
+        if spec_save_path:
+            Image.fromarray(spec_image).save(spec_save_path)
+        if hits[0]:
+            st.caption("⚡ Result loaded from the prediction cache.")
 
 
         st.markdown("---")
@@ -80,7 +232,7 @@ if model is not None:
             "The spectrogram generated from your audio is displayed below:"
         )
         st.image(
-            spec_save_path,
+            spec_image,
             use_container_width=False,
             caption=f"Mel Spectrogram of the audio: {os.path.splitext(uploaded_audio.name)[0]}"
         )
@@ -89,12 +241,10 @@ if model is not None:
         st.markdown("---")
         st.subheader("Analysis Results:")
 
-        pred, pred_idx, probs = model.predict(spec_save_path)
-        class_labels = model.dls.vocab
+        pred_idx = probs.argmax()
+        class_labels = model_vocab(model)
         predicted_class_name = class_labels[pred_idx.item()]
 
-        CONFIDENCE_THRESHOLD = 0.6 # TODO: Talvez seja interessante deixar o usuário escolher esse valor ou colocar a soma dos demais classes
-
         conf =  probs[pred_idx.item()]
         if conf < CONFIDENCE_THRESHOLD:
             st.warning("## ⚖️ Analysis Inconclusive!")
@@ -124,3 +274,11 @@ if model is not None:
             })
             st.dataframe(df.style.format({"Probability": "{:.2%}"}), hide_index=True)
             st.bar_chart(df.set_index("Class"))
+
+        stats = learner_cache.stats()
+        st.caption(
+            f"Model cache: {stats['entries']} model(s), {stats['size_mb']:.0f}/{stats['budget_mb']:.0f} MB, "
+            f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions"
+        )
+        stats = prediction_cache.stats()
+        st.caption(f"Prediction cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
@@ -1,9 +1,22 @@
 import streamlit as st
 from components.login import Login
+from components.jobs import job_queue, render_jobs, RESUME
+from components.checkpoint_files import resumable_runs
+from components.reports import PHASES, profile_summary, read_leaderboard, read_report, report_table
+from components.catalog import get_catalog, read_run_info, thumbnail
 import os 
-import io
+import math
 import pandas as pd
-from PIL import Image
+
+RUNS_PER_PAGE = 10
+
+
+def download_file(label, path, file_name, mime):
+    """Download button of a file that is only read from disk once it's clicked."""
+    if st.button(label, key=f"read-{path}"):
+        with open(path, "rb") as f:
+            st.download_button(label=f"💾 Save {file_name}", data=f.read(), file_name=file_name, mime=mime, key=f"save-{path}")
+
 
 login = Login()
 
@@ -22,35 +35,79 @@ else:
 
 st.info("Notice that this is saved temporarily, so you should download it before finishing your session.")
 
+if st.session_state.get("authentication_status"):
+    job_queue.start()
+    st.header("Background Trainings")
+    render_jobs(st.session_state.username)
+
+    unfinished = resumable_runs(f"database/{st.session_state.username}")
+    if unfinished:
+        st.header("Unfinished Runs")
+        st.write("These runs were stopped or interrupted. They continue from their last checkpoint with their original settings.")
+        resumed = st.selectbox(
+            "Run to resume:",
+            unfinished,
+            format_func=lambda info: f"{info['run']} ({'frozen' if info['fit'] == 0 else 'unfrozen'} phase, epoch {info['epoch']}/{info['n_epoch']})"
+        )
+        if st.button("♻️ Resume run"):
+            job_id = job_queue.submit(st.session_state.username, {"run_name": resumed["run"]}, kind=RESUME)
+            st.info(f"Resume job {job_id} queued. It appears in your background trainings above.")
+
 model_path = f"database/{st.session_state.username}"
 os.makedirs(model_path, exist_ok=True)
-options = st.radio("Choose a model:", [d for d in os.listdir(model_path) for m in os.listdir(f"{model_path}/{d}") if m.endswith(".pkl")])
+
+searches = [d for d in sorted(os.listdir(model_path)) if os.path.exists(f"{model_path}/{d}/leaderboard.csv")]
+if searches:
+    st.header("Hyperparameter Searches")
+    search = st.selectbox("Choose a search:", searches)
+    leaderboard = read_leaderboard(f"{model_path}/{search}")
+    st.dataframe(leaderboard.drop(columns=["trial"]), hide_index=True, use_container_width=True)
+    trained = leaderboard[leaderboard["epochs"] > 0]["name"]
+    trial = st.selectbox("Trial", list(trained), help="Trials are ranked by validation F1 (macro).")
+    if trial and os.path.exists(f"{model_path}/{search}/{trial}/model.pkl"):
+        download_file(
+            "📥 Download Trial Model",
+            f"{model_path}/{search}/{trial}/model.pkl",
+            f"{search}_{trial}.pkl",
+            "application/octet-stream"
+        )
+    st.write("---")
+catalog = get_catalog(st.session_state.username)
+n_runs = catalog.count(st.session_state.username)
+n_pages = max(1, math.ceil(n_runs / RUNS_PER_PAGE))
+page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+runs = catalog.runs(st.session_state.username, limit=RUNS_PER_PAGE, offset=(page - 1) * RUNS_PER_PAGE)
+if len(runs):
+    st.dataframe(
+        runs.assign(size=runs["size"] / 2**20, created=pd.to_datetime(runs["created"], unit="s").dt.strftime("%Y-%m-%d %H:%M")),
+        column_config={
+            "size": st.column_config.NumberColumn("size (MB)", format="%.1f"),
+            "images_per_second": st.column_config.NumberColumn("images/s", format="%.1f"),
+        },
+        hide_index=True, use_container_width=True
+    )
+options = st.radio("Choose a model:", list(runs["name"]))
 
 if options:
-    model_buffer = io.BytesIO()
-    with open(f"{model_path}/{options}/model.pkl", "rb") as file:
-        model_buffer.write(file.read())  
-    model_buffer.seek(0)
-    st.download_button(
-        label="📥 Download Model", 
-        data=model_buffer, 
-        file_name=f"{options}.pkl",
-        mime="application/octet-stream"
+    download_file(
+        "📥 Download Model",
+        f"{model_path}/{options}/model.pkl",
+        f"{options}.pkl",
+        "application/octet-stream"
     )
     
     with st.expander("Show Training Summary", expanded=False):
         history_data = pd.read_csv(f"{model_path}/{options}/history.csv")
         st.table(history_data)
-
-        csv_buffer =  io.BytesIO()
-        history_data.to_csv(csv_buffer, index=False)
-        csv_buffer.seek(0)
-
-        st.download_button(
-            label="📉 Download Training & Validation Loss", 
-            data=csv_buffer, 
-            file_name="loss_values.csv", 
-            mime="text/csv"
+        progressive = read_run_info(f"{model_path}/{options}").get("progressive")
+        if progressive:
+            st.caption("📐 Time per resolution (all epochs): " + ", ".join(f"{res} {seconds:.0f} s" for res, seconds in progressive["seconds"].items()))
+
+        download_file(
+            "📉 Download Training & Validation Loss",
+            f"{model_path}/{options}/history.csv",
+            "loss_values.csv",
+            "text/csv"
         )
 
 
@@ -58,41 +115,71 @@ if options:
 
     with col1:
         st.subheader("📊 Training & Validation Loss")
-        img_buffer = io.BytesIO()
-        with open(f"{model_path}/{options}/results.png", "rb") as img_file:
-            img_buffer.write(img_file.read())
-        img_buffer.seek(0)
-
-        image = Image.open(img_buffer)
-        st.image(image, use_container_width=False)
-
-        st.download_button(
-            label="📥 Download Training & Validation Loss", 
-            data=img_buffer, 
-            file_name="training.png", 
-            mime="image/png"
-        )
+        plot = thumbnail(f"{model_path}/{options}/results.png")
+        if plot:
+            st.image(plot, use_container_width=False)
+
+            download_file(
+                "📥 Download Training & Validation Loss",
+                f"{model_path}/{options}/results.png",
+                "training.png",
+                "image/png"
+            )
+        else:
+            st.caption("No plot was saved for this run.")
 
     with col2:
         st.subheader("🔢 Confusion Matrix")
-        img_buffer = io.BytesIO()
-        with open(f"{model_path}/{options}/confusion_matrix.png", "rb") as img_file:
-            img_buffer.write(img_file.read())
-        img_buffer.seek(0)
-
-        image = Image.open(img_buffer)
-        st.image(image, use_container_width=False)
-
-        st.download_button(
-            label="📥 Download Confusion Matrix", 
-            data=img_buffer, 
-            file_name="confusion_matrix.png", 
-            mime="image/png"
-        )
+        plot = thumbnail(f"{model_path}/{options}/confusion_matrix.png")
+        if plot:
+            st.image(plot, use_container_width=False)
+
+            download_file(
+                "📥 Download Confusion Matrix",
+                f"{model_path}/{options}/confusion_matrix.png",
+                "confusion_matrix.png",
+                "image/png"
+            )
+        else:
+            st.caption("No plot was saved for this run.")
+
+    profile_path = f"{model_path}/{options}/profile.csv"
+    if os.path.exists(profile_path):
+        st.subheader("⏱️ Training Profile")
+        profile = pd.read_csv(profile_path)
+        summary = profile_summary(profile)
+        train = summary[summary["split"] == "train"]
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Training throughput", f"{train['images'].sum() / train['total'].sum():.1f} images/s")
+        col2.metric("Total time", f"{summary['total'].sum():.1f} s")
+        col3.metric("Peak RSS", f"{summary['peak_rss_mb'].max():.0f} MB" if summary["peak_rss_mb"].notna().any() else "n/a")
+
+        summary["run"] = summary.apply(lambda r: f"{r['phase']} e{r['epoch']} {r['split']}", axis=1)
+        st.bar_chart(summary.set_index("run")[PHASES], horizontal=True, y_label="", x_label="seconds")
+
+        with st.expander("Show Profile Summary", expanded=False):
+            st.dataframe(summary.drop(columns="run"), hide_index=True, use_container_width=True)
+            st.download_button(
+                label="⏱️ Download Profile",
+                data=profile.to_csv(index=False).encode(),
+                file_name="profile.csv",
+                mime="text/csv"
+            )
+
+    report = read_report(f"{model_path}/{options}")
+    if report:
+        st.subheader("⚙️ CPU Inference Variants")
+        st.caption(f"Compared to fp32 on {report['valid_images']} validation images, {report['threads']} threads, batch of {report['batch_size']}.")
+        st.dataframe(report_table(report), hide_index=True, use_container_width=True)
+        with st.expander("Show Confusion Matrix Differences", expanded=False):
+            for name, result in report["variants"].items():
+                if "confusion_diff" in result:
+                    st.write(f"**{name}** (rows: true label, columns: predicted label)")
+                    st.table(pd.DataFrame(result["confusion_diff"], index=report["vocab"], columns=report["vocab"]))
 
     st.write("---")
 
 
 
-
     
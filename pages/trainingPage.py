@@ -1,13 +1,21 @@
 from components.model import VoiceFakeDetection
 from utils.config import load_env_from_sh
-from fastai.vision.all import *
+from components.dataset import get_manifest
+from components.noise_augment import describe_report, storage_report
+from components.jobs import job_queue, render_jobs, SEARCH, RESUME, DISTRIBUTED
+from components.reports import read_scaling, scaling_counts
+from components.settings import PROFILES, DEFAULT_PROFILE
+from components.checkpoint_files import CHECKPOINT_EVERY, CHECKPOINT_KEEP, resumable_runs
 import streamlit as st
-import multiprocessing
+import pandas as pd
+import time
+import os
 
 st.title("Computer Vision Model Training for AudioFake Detection")
 
 # Initialize the model
 model = VoiceFakeDetection()
+job_queue.start()
 
 user_model_name = st.text_input(
     "🏷️ Enter a name for this training run (optional):",
@@ -22,14 +30,14 @@ with col1:
     # Architecture selection
     architecture_name = st.selectbox(
         "🛠️ Choose the Architecture",
-        list(model.architectures.keys()),
+        list(model.architectures),
         help="Select the Convolutional Neural Network (CNN) architecture for training."
     )
 
     # Transformation selection
     transform_type = st.selectbox(
         "🔄 Choose the Spectrogram Transformation",
-        list(model.transforms.keys()),
+        list(model.transforms),
         help="Select the type of image transformation to apply to the audio data."
     )
 
@@ -54,6 +62,52 @@ with col2:
             "A larger batch size can speed up training but requires more memory."
     )
 
+    use_shards = st.checkbox(
+        "⚡ Use pre-decoded tensor cache",
+        value=False,
+        help="Decodes each selected (noise, speaker) subset once into a memory-mapped array that is reused by the next runs. " \
+            "Skips PNG decoding on every epoch. Only available with the 'Resize' transformation."
+    )
+
+    profile = st.checkbox(
+        "⏱️ Profile training",
+        value=False,
+        help="Records the time spent loading data, in the forward/backward passes, in the optimizer step and in the callbacks for every batch, " \
+            "with the peak memory and images per second. Saved as profile.csv next to history.csv and shown in your Profile Page."
+    )
+
+    optimize = st.checkbox(
+        "⚙️ Optimize for CPU inference",
+        value=False,
+        help="After training, builds int8 (dynamic and static) and channels-last versions of the model and compares their speed, " \
+            "size and F1 to the original on the validation images. The version can then be chosen in the Evaluation Page."
+    )
+
+    progressive = st.checkbox(
+        "📐 Progressive resizing",
+        value=False,
+        help="Trains the first half of the epochs on 64x64 spectrograms and the next quarter on 96x96, then switches to full resolution. " \
+            "Early epochs are much faster, so a good F1 is reached sooner. The time spent at each resolution is saved with the training history."
+    )
+
+    feature_cache = st.checkbox(
+        "🧊 Cache frozen-body features",
+        value=False,
+        help="The first epoch of fine-tuning only trains the head, with the pretrained body frozen. " \
+            "Computes the body's output once per image, architecture and transformation and trains the head on it. " \
+            "The features are kept on disk and reused by the next runs on the same datasets."
+    )
+
+    performance = st.selectbox(
+        "🏎️ Performance Profile",
+        list(PROFILES.keys()),
+        index=list(PROFILES.keys()).index(DEFAULT_PROFILE),
+        help="How the data is fed to the network and in which precision it runs: DataLoader workers kept alive between epochs and " \
+            "batches prefetched, bfloat16 autocast and channels-last memory format on CPU, and torch.compile. " \
+            "The profile and the training images per second are saved with the run, to compare them in your Profile Page."
+    )
+    st.caption(", ".join(f"{key}={value}" for key, value in PROFILES[performance].items()) or "fastai defaults, fp32")
+
 ######################################
 st.header("Dataset Configuration")
 default_speakers = {
@@ -107,6 +161,28 @@ selected_noises = [noises[spk] for spk in st.multiselect(
          "You can choose multiple noise levels to simulate different conditions."
 )]
 
+noise_on_the_fly = st.checkbox(
+    "🌀 Inject noise on the fly",
+    value=False,
+    help="Generates the selected noise levels from the clean audios while the images are loaded, " \
+        "instead of reading one copy of the dataset per noise level from /dataset. " \
+        "The noise of every image is always the same, so runs with the same seed are reproducible."
+)
+
+if selected_speakers and selected_noises and noise_on_the_fly:
+    try:
+        st.info(f"🌪️ {describe_report(storage_report(selected_speakers, selected_noises, get_manifest()))}")
+    except FileNotFoundError as e:
+        st.warning(f"⚠️ {str(e)}")
+elif selected_speakers and selected_noises:
+    counts = get_manifest().counts(selected_speakers, selected_noises)
+    st.info(f"🖼️ {counts['images'].sum()} images selected.")
+    with st.expander("Images per selection"):
+        st.dataframe(
+            counts.pivot_table(index=["noise", "speaker"], columns="label", values="images", fill_value=0),
+            use_container_width=True
+        )
+
 ######################################
 st.header("Advanced Configuration")
 # Inicializa lista de callbacks
@@ -128,12 +204,54 @@ with st.expander("🧩 Callbacks"):
     st.button("➕ Add Callback", on_click=lambda: st.session_state.callbacks.append(""))
 st.session_state.valid_callbacks = st.empty()
 
+with st.expander("💾 Checkpoints"):
+    col1, col2 = st.columns(2)
+    checkpoint_every = col1.number_input(
+        "Save a checkpoint every N epochs",
+        min_value=0,
+        step=1,
+        value=CHECKPOINT_EVERY,
+        help="The weights, optimizer state, position in the learning-rate schedule, history and data split are saved in the run folder, " \
+            "so a stopped or interrupted training can be resumed from its last checkpoint instead of starting over. 0 disables them."
+    )
+    keep_checkpoints = col2.number_input(
+        "Checkpoints kept",
+        min_value=1,
+        step=1,
+        value=CHECKPOINT_KEEP,
+        help="Older checkpoints are deleted. All of them are deleted once the training completes."
+    )
+
         
-try:
-    safe_callbacks = model.safe_eval_callback(st.session_state.callbacks)
-except Exception as e:
-    st.session_state.valid_callbacks.error(f"❌ Error in callback: {str(e)}")
-    safe_callbacks = None
+def callbacks_valid() -> bool:
+    # Evaluated when a training starts: it imports fastai, which the page doesn't need before
+    try:
+        model.safe_eval_callback(st.session_state.callbacks)
+        return True
+    except Exception as e:
+        st.session_state.valid_callbacks.error(f"❌ Error in callback: {str(e)}")
+        return False
+
+# Arguments of a training, on this page or in the background (TrainingEngine.train)
+training_params = {
+    "user_model_name": user_model_name,
+    "architecture_name": architecture_name,
+    "transform_type": transform_type,
+    "selected_speakers": selected_speakers,
+    "selected_noises": selected_noises,
+    "num_epochs": num_epochs,
+    "num_batches": num_batches,
+    "callbacks": [cb for cb in st.session_state.callbacks if cb.strip()],
+    "use_shards": use_shards,
+    "profile": profile,
+    "optimize": optimize,
+    "performance": performance,
+    "progressive": progressive,
+    "feature_cache": feature_cache,
+    "checkpoint_every": checkpoint_every,
+    "keep_checkpoints": keep_checkpoints,
+    "noise_on_the_fly": noise_on_the_fly,
+}
 
 # Flag to stopping training
 if "stop_training" not in st.session_state:
@@ -143,47 +261,118 @@ if "stop_training" not in st.session_state:
 if st.button("🚀 Train"):
     if not selected_speakers:
         st.session_state.select_speaker.warning("⚠️ Please select at least one dataset before training.")
-    elif safe_callbacks is not None:
+    elif callbacks_valid():
         if st.button("🛑 Stop"):
             st.session_state.stop_training = True
 
-        model.train_model(
-            user_model_name,
-            architecture_name,
-            transform_type,
-            selected_speakers,
-            selected_noises,
-            num_epochs,
-            num_batches,
-            safe_callbacks
+        model.train_model(**training_params)
+
+
+# Background training button
+if st.button("📥 Train in Background"):
+    if not selected_speakers:
+        st.session_state.select_speaker.warning("⚠️ Please select at least one dataset before training.")
+    elif callbacks_valid():
+        job_id = job_queue.submit(st.session_state.username, training_params)
+        st.info(f"Training job {job_id} queued. " \
+            "It keeps running if you close this page, and its results will appear in your profile page once it's done."
+        )
+
+######################################
+st.header("Distributed Training")
+with st.expander("🖧 Train with several processes"):
+    st.write("Starts several training processes on this server that each train on their share of every batch " \
+        "and average their gradients (PyTorch DistributedDataParallel, gloo backend). The cores are shared between them, " \
+        "and the batch size above is the batch size of every process. Metrics are gathered by the first process, which saves the run.")
+    nproc = st.number_input("⚙️ Processes", min_value=1, max_value=max(1, os.cpu_count() or 1), value=min(2, os.cpu_count() or 1), step=1)
+    col1, col2 = st.columns(2)
+    distributed_clicked = col1.button("🖧 Train Distributed in Background")
+    scaling_clicked = col2.button("📈 Measure Scaling in Background",
+        help=f"Trains this configuration with {', '.join(map(str, scaling_counts(nproc)))} processes, one after the other, to compare their speed.")
+    if distributed_clicked or scaling_clicked:
+        if not selected_speakers:
+            st.session_state.select_speaker.warning("⚠️ Please select at least one dataset before training.")
+        elif callbacks_valid():
+            job_id = job_queue.submit(st.session_state.username, dict(training_params, nproc=nproc, scaling=scaling_clicked), kind=DISTRIBUTED)
+            st.info(f"Distributed job {job_id} queued.")
+    st.caption("To use several servers, run `python -m components.distributed` on each one with `--nnodes`, `--node-rank` and `--master-addr` " \
+        "(see components/distributed.py).")
+
+    scaling = read_scaling(model.save_path)
+    if len(scaling):
+        st.subheader("📈 Scaling Report")
+        st.dataframe(
+            scaling.assign(created=pd.to_datetime(scaling["created"], unit="s").dt.strftime("%Y-%m-%d %H:%M"),
+                           efficiency=scaling["efficiency"] * 100).iloc[::-1],
+            column_config={
+                "images_per_second": st.column_config.NumberColumn("images/s", format="%.1f"),
+                "train_seconds": st.column_config.NumberColumn("train time (s)", format="%.0f"),
+                "speedup": st.column_config.NumberColumn(format="%.2fx"),
+                "efficiency": st.column_config.NumberColumn(format="%.0f%%"),
+            },
+            hide_index=True, use_container_width=True
         )
+        st.line_chart(scaling.groupby("world_size")["images_per_second"].mean(),
+                      x_label="processes", y_label="training images per second")
 
+######################################
+st.header("Resume a Run")
+runs = resumable_runs(model.save_path)
+if not runs:
+    st.write("No stopped or interrupted runs. Runs with a checkpoint can be continued here.")
+else:
+    resumed = st.selectbox(
+        "♻️ Run to resume",
+        runs,
+        format_func=lambda info: f"{info['run']} ({'frozen' if info['fit'] == 0 else 'unfrozen'} phase, epoch {info['epoch']}/{info['n_epoch']}, " \
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(info['created']))})",
+        help="Continues from the last checkpoint with the settings, callbacks and data split the run was started with."
+    )
+    col1, col2 = st.columns(2)
+    if col1.button("♻️ Resume run"):
+        st.session_state.stop_training = False
+        model.resume_model(resumed["run"])
+    if col2.button("📥 Resume in Background"):
+        job_id = job_queue.submit(st.session_state.username, {"run_name": resumed["run"]}, kind=RESUME)
+        st.info(f"Resume job {job_id} queued.")
 
-# Training button
-# if st.button("🚀 Save New Version (Beta)"):
-#     if not selected_speakers:
-#         st.session_state.select_speaker.warning("⚠️ Please select at least one dataset before training.")
-#     elif safe_callbacks is not None:
-#         p = multiprocessing.Process(
-#             target=model.background_training,
-#             args=(
-#                 user_model_name,
-#                 architecture_name,
-#                 transform_type,
-#                 selected_speakers,
-#                 selected_noises,
-#                 num_epochs,
-#                 num_batches,
-#                 safe_callbacks,
-#             )
-#         )
-#         p.start()
-#         st.info("Training started in the background." \
-#             "You can check the results in your profile page once it's done."
-#         )
-#         p.join()
-#         print("✅ Training completed successfully!")
-#         st.success("✅ Training completed successfully!")
+######################################
+st.header("Hyperparameter Search")
+with st.expander("🔎 Search the best configuration for the selected datasets"):
+    st.write("Trains many configurations in the background. Weak ones are stopped after a few epochs " \
+        "and only the best are trained longer, until the search ends or the CPU-time budget runs out.")
+    col1, col2 = st.columns(2)
+    with col1:
+        search_architectures = st.multiselect("🛠️ Architectures", list(model.architectures), default=["ResNet18", "ResNet50"])
+        search_transforms = st.multiselect("🔄 Transformations", list(model.transforms), default=["Resize"])
+        search_batch_sizes = st.multiselect("🧺 Batch sizes", [8, 16, 32, 64, 128], default=[16, 32])
+        search_lrs = st.multiselect("📈 Learning rates", [1e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2], default=[1e-3, 2e-3], format_func=lambda lr: f"{lr:g}")
+    with col2:
+        search_name = st.text_input("🏷️ Search name", value=time.strftime("search_%Y%m%d_%H%M"))
+        search_epochs = st.slider("⏳ Epochs of the first and last round", min_value=1, max_value=50, value=(1, 9),
+            help="Every configuration is trained for the first value; the best 1/3 of each round are trained 3 times longer, up to the second value.")
+        search_budget = st.number_input("⏱️ CPU-time budget (minutes)", min_value=1, value=60)
 
-        
+    if st.button("🔎 Start Search in Background"):
+        if not selected_speakers:
+            st.session_state.select_speaker.warning("⚠️ Please select at least one dataset before training.")
+        elif not (search_architectures and search_transforms and search_batch_sizes and search_lrs and search_name.strip()):
+            st.warning("⚠️ Please choose at least one value of each hyperparameter and a name.")
+        else:
+            job_id = job_queue.submit(st.session_state.username, {
+                "search_name": search_name.strip(),
+                "selected_speakers": selected_speakers,
+                "selected_noises": selected_noises,
+                "architectures": search_architectures,
+                "transforms": search_transforms,
+                "batch_sizes": search_batch_sizes,
+                "learning_rates": search_lrs,
+                "min_epochs": search_epochs[0],
+                "max_epochs": search_epochs[1],
+                "budget_minutes": search_budget,
+                "use_shards": use_shards,
+            }, kind=SEARCH)
+            st.info(f"Search job {job_id} queued. Its leaderboard will appear in your profile page.")
 
+st.header("Background Trainings")
+render_jobs(st.session_state.username)
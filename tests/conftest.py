@@ -0,0 +1,23 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_clip(path, seconds=2.0, sr=22050, f0=220.0, seed=0):
+    """A short voiced-like WAV: a few harmonics of `f0` with a little noise."""
+    import soundfile
+
+    t = np.arange(int(seconds * sr)) / sr
+    audio = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6)) * np.hanning(len(t)) * 0.2
+    audio += 0.002 * np.random.default_rng(seed).standard_normal(len(t))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    soundfile.write(path, audio.astype(np.float32), sr)
+    return path
+
+
+@pytest.fixture
+def clip(tmp_path):
+    return write_clip(str(tmp_path / "clip.wav"))
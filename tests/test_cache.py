@@ -0,0 +1,31 @@
+import os
+import numpy as np
+from utils.cache import LearnerCache, PredictionCache
+
+
+def _folder_bytes(cache_dir):
+    return sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith(".npz"))
+
+
+def test_overwritten_prediction_is_counted_once(tmp_path):
+    cache = PredictionCache(str(tmp_path), max_bytes=2**30, ttl_seconds=3600)
+    cache.put("a", None, [0.5, 0.5])
+    cache.put("b", None, [0.5, 0.5])
+    for _ in range(3):
+        cache.put("a", np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8), [0.1, 0.9])
+
+    assert cache._current_bytes == _folder_bytes(tmp_path)
+    assert cache.get("a")[1][1] == np.float32(0.9)
+
+
+def test_learner_locks_are_released():
+    class Model:
+        nbytes = 10
+
+    cache = LearnerCache(max_bytes=25)
+    for i in range(100):
+        cache.get(f"model-{i}", Model)
+        with cache.lock(f"model-{i}"):
+            assert len(cache._key_locks) == 1
+    assert cache.stats()["entries"] == 2
+    assert len(cache._key_locks) == 0
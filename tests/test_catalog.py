@@ -0,0 +1,16 @@
+from PIL import Image
+
+from components.catalog import thumbnail
+
+
+def test_thumbnail_of_a_missing_plot_is_none(tmp_path):
+    assert thumbnail(str(tmp_path / "results.png")) is None
+
+
+def test_thumbnail_downscales_large_plots(tmp_path):
+    Image.new("RGB", (100, 50)).save(tmp_path / "small.png")
+    Image.new("RGB", (1000, 500)).save(tmp_path / "large.png")
+
+    assert thumbnail(str(tmp_path / "small.png")) == str(tmp_path / "small.png")
+    with Image.open(thumbnail(str(tmp_path / "large.png"))) as image:
+        assert image.size == (480, 240)
@@ -0,0 +1,37 @@
+import torch
+import torch.distributed as dist
+from torch import nn
+from torch.nn.parallel import DistributedDataParallel
+from fastai.vision.all import DataLoader, DataLoaders, Learner, CrossEntropyLossFlat
+from components.checkpoints import CheckpointCallback, load_checkpoint
+from components.checkpoint_files import latest_checkpoint
+from components.training import TrainingEngine
+
+
+def _learner(tmp_path):
+    items = list(zip(torch.rand(16, 4), torch.randint(0, 2, (16,))))
+    dls = DataLoaders(DataLoader(items, bs=8), DataLoader(items[:8], bs=8))
+    learn = Learner(dls, nn.Sequential(nn.Linear(4, 8), nn.ReLU(), nn.Linear(8, 2)), loss_func=CrossEntropyLossFlat(), path=tmp_path)
+    learn.create_opt()
+    return learn
+
+
+def test_checkpoint_of_a_distributed_fit_restores(tmp_path):
+    dist.init_process_group("gloo", init_method=f"file://{tmp_path}/rendezvous", rank=0, world_size=1)
+    try:
+        learn = _learner(tmp_path)
+        weights = {k: v.clone() for k, v in learn.model.state_dict().items()}
+        learn.model = DistributedDataParallel(learn.model)  # as DistributedTrainer does for the whole fit
+        learn.n_epoch = 1
+        checkpointer = CheckpointCallback(str(tmp_path / "run"), {"params": {}, "seed": 0, "split": {}})
+        checkpointer.learn, checkpointer.fit_idx, checkpointer.epoch_offset = learn, 1, 0
+        checkpointer.save(1)
+    finally:
+        dist.destroy_process_group()
+
+    checkpoint = load_checkpoint(latest_checkpoint(str(tmp_path / "run")))
+    engine = TrainingEngine(str(tmp_path / "user"))
+    engine.model = _learner(tmp_path)
+    engine.restore(checkpoint, with_opt=True)
+    for key, value in engine.model.model.state_dict().items():
+        assert torch.equal(value, weights[key])
@@ -0,0 +1,48 @@
+import yaml
+from utils.config import CredentialsStore
+
+CONFIG = {
+    "cookie": {"name": "cookie", "key": "key", "expiry_days": 30},
+    "credentials": {"usernames": {
+        "alice": {"email": "alice@example.com", "logged_in": False, "password": "hash-a"},
+        "bob": {"email": "bob@example.com", "logged_in": False, "password": "hash-b"},
+    }},
+    "pre-authorized": {"emails": ["carol@example.com"]},
+}
+
+
+def _store(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.dump(CONFIG))
+    return CredentialsStore(str(path)), path
+
+
+def test_older_copy_does_not_undo_other_sessions(tmp_path):
+    store, path = _store(tmp_path)
+    first, second = store.credentials(), store.credentials()
+
+    first["usernames"]["alice"]["logged_in"] = True
+    assert store.save_credentials(first)
+    # The second session never touched alice: its stale copy must not log her out
+    second["usernames"]["bob"]["password"] = "hash-b2"
+    assert store.save_credentials(second)
+    assert not store.save_credentials(second)
+
+    users = yaml.safe_load(path.read_text())["credentials"]["usernames"]
+    assert users["alice"]["logged_in"] is True
+    assert users["bob"]["password"] == "hash-b2"
+
+
+def test_registration_keeps_other_sections(tmp_path):
+    store, path = _store(tmp_path)
+    credentials = store.credentials()
+    assert store.pre_authorized() == ["carol@example.com"]
+
+    credentials["usernames"]["carol"] = {"email": "carol@example.com", "logged_in": False, "password": "hash-c"}
+    assert store.save_credentials(credentials)
+    assert store.remove_pre_authorized("carol@example.com")
+
+    config = yaml.safe_load(path.read_text())
+    assert set(config["credentials"]["usernames"]) == {"alice", "bob", "carol"}
+    assert config["pre-authorized"]["emails"] == []
+    assert config["cookie"] == CONFIG["cookie"]
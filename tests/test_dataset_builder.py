@@ -0,0 +1,41 @@
+import os
+import numpy as np
+from PIL import Image
+from components.dataset_builder import build_dataset
+from conftest import write_clip
+
+
+def _dataset(tmp_path, speakers):
+    source = tmp_path / "audio"
+    for speaker in speakers:
+        for label in ("bonafide", "vocoder_a"):
+            for i in range(2):
+                write_clip(str(source / speaker / label / f"{i}.wav"), f0=150 + 40 * i, seed=i)
+    return str(source)
+
+
+def _build(tmp_path, source, speakers, noises):
+    return build_dataset(source, speakers, noises, str(tmp_path / "dataset"), str(tmp_path / "state.sqlite"), workers=1, log=lambda message: None)
+
+
+def test_existing_pngs_adopted_not_rewritten(tmp_path):
+    source = _dataset(tmp_path, ["awb"])
+    existing = tmp_path / "dataset" / "0" / "awb" / "bonafide" / "0.png"
+    existing.parent.mkdir(parents=True)
+    Image.fromarray(np.zeros((8, 8, 3), dtype=np.uint8)).save(existing)
+    before = (existing.read_bytes(), os.stat(existing).st_mtime_ns)
+
+    report = _build(tmp_path, source, ["awb"], [0])
+    assert (report["adopted"], report["built"]) == (1, 3)
+    assert (existing.read_bytes(), os.stat(existing).st_mtime_ns) == before
+
+
+def test_new_speaker_only_builds_its_outputs(tmp_path):
+    source = _dataset(tmp_path, ["awb", "bdl"])
+    assert _build(tmp_path, source, ["awb"], [0, 0.1])["built"] == 8
+    outputs = {path: os.stat(path).st_mtime_ns for path in (tmp_path / "dataset").rglob("*.png")}
+
+    report = _build(tmp_path, source, ["awb", "bdl"], [0, 0.1])
+    assert (report["built"], report["skipped"]) == (8, 8)
+    assert all(os.stat(path).st_mtime_ns == mtime for path, mtime in outputs.items())
+    assert _build(tmp_path, source, ["awb", "bdl"], [0, 0.1])["built"] == 0
@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("page", ["pages/trainingPage.py", "pages/profilePage.py"])
+def test_page_imports_without_torch(page):
+    # The modules a page imports at the top, in a fresh interpreter
+    with open(os.path.join(ROOT, page)) as f:
+        imports = "".join(line for line in f if line.startswith(("import ", "from ")))
+    code = imports + "import sys\nprint(sorted({'torch', 'fastai'} & {name.split('.')[0] for name in sys.modules}))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
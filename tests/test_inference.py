@@ -0,0 +1,59 @@
+import io
+import zipfile
+from components.inference import read_uploaded_audios
+
+
+class Upload(io.BytesIO):
+    def __init__(self, name, data) -> None:
+        super().__init__(data)
+        self.name = name
+
+
+def _zip(name, members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for member, data in members.items():
+            archive.writestr(member, data)
+    return Upload(name, buffer.getvalue())
+
+
+def test_uploaded_names_are_unique(tmp_path):
+    uploads = [
+        _zip("a.zip", {"x/y.wav": b"1", "x_y.wav": b"2", "__MACOSX/x/._y.wav": b"meta", "x/._y.wav": b"meta", ".hidden/z.wav": b"3"}),
+        _zip("b.zip", {"x/y.wav": b"4"}),
+        Upload("x_y.wav", b"5"),
+    ]
+    audios = read_uploaded_audios(uploads, persist_dir=str(tmp_path))
+
+    assert audios == [("x_y.wav", b"1"), ("x_y_2.wav", b"2"), ("x_y_3.wav", b"4"), ("x_y_4.wav", b"5")]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["x_y.wav", "x_y_2.wav", "x_y_3.wav", "x_y_4.wav"]
+
+
+def test_windows_cover_the_recording(tmp_path):
+    from components.inference import iter_windows, window_seconds
+    from conftest import write_clip
+
+    path = str(tmp_path / "long.wav")
+    write_clip(path, seconds=6.0, sr=16000)
+    window = window_seconds()
+    windows = list(iter_windows(path, hop_s=window))
+
+    assert len(windows) == int(6.0 // window)
+    for i, (start, end, image) in enumerate(windows):
+        assert abs(start - i * window) < 1e-3 and abs(end - start - window) < 1e-3
+        assert image is not None
+
+
+def test_images_are_built_in_one_spawned_pool(tmp_path):
+    from components.inference import _image_pool, build_images
+    from conftest import write_clip
+
+    datas = []
+    for i, seconds in enumerate((2.0, 2.0, 0.5)):
+        write_clip(str(tmp_path / f"{i}.wav"), seconds=seconds, seed=i)
+        datas.append((tmp_path / f"{i}.wav").read_bytes())
+
+    images = build_images(datas)
+    assert [image is None for image in images] == [False, False, True]
+    assert _image_pool() is _image_pool()
+    assert _image_pool()._mp_context.get_start_method() == "spawn"
@@ -0,0 +1,85 @@
+import json
+import multiprocessing
+import os
+import time
+from components.jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue, _terminate
+
+
+def _gone(pid) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] == "Z"  # zombie: killed, not reaped yet
+    except FileNotFoundError:
+        return True
+
+
+def _job_with_training_process(pid_path):
+    # Like run_job starting the ranks of a distributed job
+    os.setsid()
+    child = multiprocessing.get_context("spawn").Process(target=time.sleep, args=(60,))
+    child.start()
+    with open(pid_path, "w") as f:
+        f.write(str(child.pid))
+    child.join()
+
+
+def test_cancel_stops_the_processes_of_the_job(tmp_path):
+    pid_path = tmp_path / "child.pid"
+    proc = multiprocessing.get_context("spawn").Process(target=_job_with_training_process, args=(str(pid_path),))
+    proc.start()
+    for _ in range(300):
+        if pid_path.exists() and pid_path.read_text():
+            break
+        time.sleep(0.1)
+    child_pid = int(pid_path.read_text())
+
+    _terminate(proc.pid)
+    proc.join(10)
+    for _ in range(100):
+        if _gone(child_pid):
+            break
+        time.sleep(0.1)
+    assert _gone(child_pid)
+
+
+def _worker_of_a_previous_server():
+    os.setsid()
+    time.sleep(60)
+
+
+def test_restart_only_requeues_jobs_whose_worker_died(tmp_path):
+    jobs_dir = tmp_path / "jobs"
+    queue = JobQueue(str(jobs_dir), max_workers=1)
+    worker = multiprocessing.get_context("spawn").Process(target=_worker_of_a_previous_server)
+    worker.start()
+    time.sleep(1)  # setsid
+    alive, dead, done = (queue.submit("alice", {}) for _ in range(3))
+    for job_id, pid in ((alive, worker.pid), (dead, 2**22 + 1), (done, 2**22 + 1)):
+        job = json.loads((jobs_dir / f"{job_id}.json").read_text())
+        job.update(state=RUNNING, pid=pid, attempts=1)
+        (jobs_dir / f"{job_id}.json").write_text(json.dumps(job))
+    (jobs_dir / f"{done}.exit").write_text("0")
+
+    restarted = JobQueue(str(jobs_dir), max_workers=1)
+    restarted._JobQueue__recover()
+    assert [restarted.get(job_id)["state"] for job_id in (alive, dead, done)] == [RUNNING, QUEUED, DONE]
+
+    restarted.cancel(dead)  # so the dispatcher doesn't start it
+    (jobs_dir / f"{alive}.exit").write_text("1")
+    worker.terminate()
+    worker.join()
+    restarted._JobQueue__dispatch()
+    assert restarted.get(alive)["state"] == FAILED
+
+
+def test_dispatcher_skips_unreadable_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path), max_workers=1)
+    job_id = queue.submit("alice", {})
+    worker = multiprocessing.get_context("spawn").Process(target=time.sleep, args=(0,))
+    worker.start()
+    worker.join()
+    queue._procs[job_id] = worker
+    (tmp_path / f"{job_id}.json").write_text("{\"id\": ")  # half written
+
+    queue._JobQueue__dispatch()
+    assert queue._procs == {}
@@ -0,0 +1,19 @@
+import numpy as np
+from PIL import Image
+from components.dataset_builder import build_dataset
+from components.noise_augment import NoisySpectrogram, noisy_items
+from conftest import write_clip
+
+
+def test_item_equals_built_png(tmp_path):
+    source = tmp_path / "audio"
+    for label in ("bonafide", "vocoder_a"):
+        write_clip(str(source / "awb" / label / "0.wav"))
+    dataset = tmp_path / "dataset"
+    build_dataset(str(source), ["awb"], [0, 0.1], str(dataset), str(tmp_path / "state.sqlite"), workers=1, log=lambda message: None)
+
+    items = noisy_items(["awb"], [0, 0.1], str(source), str(dataset))
+    assert sorted(map(str, items)) == sorted(map(str, dataset.rglob("*.png")))
+    get_x = NoisySpectrogram(str(source))
+    for item in items:
+        assert np.array_equal(get_x(item), np.asarray(Image.open(item).convert("RGB")))
@@ -0,0 +1,63 @@
+import torch
+from torch import nn
+from fastai.vision.all import Callback, CancelBatchException, CrossEntropyLossFlat, DataLoader, DataLoaders, Learner
+from components.performance import BF16Autocast, PersistentWorkers
+
+
+class _CancelEveryOtherBatch(Callback):
+    order = 11
+
+    def __init__(self) -> None:
+        self.autocast = []
+
+    def after_pred(self):
+        self.autocast.append(torch.is_autocast_cpu_enabled())
+        if self.iter % 2:
+            raise CancelBatchException()
+
+
+def test_bf16_autocast_is_left_after_cancelled_batches():
+    items = list(zip(torch.rand(32, 4), torch.randint(0, 2, (32,))))
+    dls = DataLoaders(DataLoader(items, bs=8), DataLoader(items[:8], bs=8))
+    model = nn.Sequential(nn.Linear(4, 2))
+    outputs = []
+    model.register_forward_hook(lambda module, args, output: outputs.append(output.dtype))
+    cancel = _CancelEveryOtherBatch()
+    learn = Learner(dls, model, loss_func=CrossEntropyLossFlat(), cbs=[BF16Autocast(), cancel])
+
+    learn.fit(1)
+
+    assert set(outputs) == {torch.bfloat16}
+    assert cancel.autocast and not any(cancel.autocast)
+    assert not torch.is_autocast_cpu_enabled()
+    assert "forward" not in vars(model)  # exported as a regular model
+
+
+class _WorkerPids(Callback):
+    def __init__(self) -> None:
+        self.pids, self.samples = [], []
+
+    def before_epoch(self):
+        self.samples.append([])
+
+    def after_batch(self):
+        if self.training:
+            self.samples[-1] += self.y.tolist()
+
+    def after_train(self):
+        self.pids.append([worker.pid for worker in self.dls.train._workers._workers])
+
+
+def test_persistent_workers_live_for_the_whole_fit():
+    # Fails when the PyTorch internals PersistentWorkers relies on change: see the pin in requirements.txt
+    items = [(torch.rand(4), i) for i in range(32)]
+    dls = DataLoaders(DataLoader(items, bs=8, num_workers=2, shuffle=True), DataLoader(items[:8], bs=8))
+    record = _WorkerPids()
+    learn = Learner(dls, nn.Linear(4, 32), loss_func=CrossEntropyLossFlat(), cbs=[PersistentWorkers(), record])
+
+    learn.fit(2)
+
+    assert record.pids[0] == record.pids[1]
+    assert [sorted(samples) for samples in record.samples] == [list(range(32))] * 2
+    assert record.samples[0] != record.samples[1]  # each epoch is shuffled again
+    assert type(dls.train) is DataLoader
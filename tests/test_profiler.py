@@ -0,0 +1,35 @@
+import pandas as pd
+import torch
+from torch import nn
+from fastai.vision.all import DataLoader, DataLoaders, Learner, CrossEntropyLossFlat, params
+from components.profiler import ProfilerCallback
+from components.reports import PROFILE_FILE, profile_summary
+
+
+def _learner(tmp_path):
+    items = list(zip(torch.rand(32, 4), torch.randint(0, 2, (32,))))
+    dls = DataLoaders(DataLoader(items, bs=8, shuffle=True), DataLoader(items[:8], bs=8))
+    model = nn.Sequential(nn.Linear(4, 8), nn.Linear(8, 2))
+    return Learner(dls, model, loss_func=CrossEntropyLossFlat(), path=tmp_path, splitter=lambda m: [params(m[0]), params(m[1])])
+
+
+def _phases(learn, fname):
+    summary = profile_summary(pd.read_csv(learn.path / fname))
+    return list(summary["phase"].drop_duplicates())
+
+
+def test_profile_records_the_phase_of_each_fit(tmp_path):
+    learn = _learner(tmp_path)
+    profiler = ProfilerCallback()
+    with learn.no_bar():
+        learn.freeze()
+        learn.fit(1, cbs=profiler)
+        learn.unfreeze()
+        learn.fit(1, cbs=profiler)
+    assert _phases(learn, PROFILE_FILE) == ["frozen", "unfrozen"]
+
+    # The feature cache trains the frozen phase without the profiler: the first profiled fit is the unfrozen one
+    profiler = ProfilerCallback("unfrozen_only.csv")
+    with learn.no_bar():
+        learn.fit(1, cbs=profiler)
+    assert _phases(learn, "unfrozen_only.csv") == ["unfrozen"]
@@ -0,0 +1,19 @@
+import pytest
+import torch
+from components import runtime
+
+
+def test_quantized_engine_is_chosen_once(monkeypatch):
+    default = torch.backends.quantized.engine
+    other = next(engine for engine in ("qnnpack", "fbgemm", "x86") if engine != default and engine in torch.backends.quantized.supported_engines)
+    monkeypatch.setattr(runtime, "_engine_set", False)
+    try:
+        runtime.use_quantized_engine(default)
+        runtime.use_quantized_engine(other)
+        assert torch.backends.quantized.engine == other
+        runtime.use_quantized_engine(other)
+        with pytest.raises(RuntimeError):
+            runtime.use_quantized_engine(default)
+        assert torch.backends.quantized.engine == other
+    finally:
+        torch.backends.quantized.engine = default
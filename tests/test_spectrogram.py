@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from components.spectrogram import SPEC_CONFIG, image_from_bytes, mel_image, spectrogram_parity
+
+
+def test_parity_with_generate_single_spec(clip):
+    pytest.importorskip("components.VoCoderRecognition.lib.melspectrogram_custom", reason="VoCoderRecognition submodule not checked out")
+    assert spectrogram_parity(clip) == 0.0
+
+
+def test_rendered_with_specshow_default_colormap(clip):
+    from matplotlib import colormaps
+
+    with open(clip, "rb") as f:
+        image = image_from_bytes(f.read())
+    palette = (colormaps["magma"](np.linspace(0, 1, 256))[:, :3] * 255).astype(np.int16)
+    pixels = image.reshape(-1, 3).astype(np.int16)[::97]
+    nearest = np.abs(pixels[:, None, :] - palette[None, :, :]).sum(-1).min(1)
+    assert nearest.max() <= 6  # every pixel is (up to antialiasing) a magma color
+
+
+def test_short_audio_discarded():
+    samples = (SPEC_CONFIG["crop_width"] - 2) * SPEC_CONFIG["hop_length"]
+    assert mel_image(np.zeros(samples, dtype=np.float32)) is None
+
+
+def test_noise_reproducible_with_rng():
+    audio = np.sin(np.arange(SPEC_CONFIG["sr"] * 2) / 10).astype(np.float32)
+    first = mel_image(audio, 0.1, np.random.default_rng(3))
+    assert np.array_equal(first, mel_image(audio, 0.1, np.random.default_rng(3)))
+    assert not np.array_equal(first, mel_image(audio, 0.1, np.random.default_rng(4)))
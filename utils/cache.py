@@ -0,0 +1,267 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Memory budget (in MB) for the learners kept alive between reruns and sessions.
+LEARNER_CACHE_MB = int(os.environ.get("LEARNER_CACHE_MB", 2048))
+# Disk budget (in MB) and time to live (in hours) of cached predictions.
+PREDICTION_CACHE_MB = int(os.environ.get("PREDICTION_CACHE_MB", 512))
+PREDICTION_CACHE_TTL_HOURS = float(os.environ.get("PREDICTION_CACHE_TTL_HOURS", 24 * 7))
+PREDICTION_CACHE_DIR = "database/.cache/predictions"
+
+
+def path_key(path) -> str:
+    """
+    Cache key for a model stored on disk. Path + mtime + size is enough to
+    notice a retrained model being exported over an old one.
+    """
+    stat = os.stat(path)
+    return f"path:{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def bytes_key(data: bytes) -> str:
+    """Cache key for an uploaded model, based on its content."""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def learner_nbytes(learner) -> int:
+    """Approximate memory held by a learner: its parameters and buffers."""
+    if hasattr(learner, "nbytes"):  # InferenceModel: frozen TorchScript keeps its weights as constants
+        return learner.nbytes
+    tensors = list(learner.model.parameters()) + list(learner.model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class LearnerCache:
+    """
+    Process-wide LRU cache of fastai learners.
+
+    Streamlit re-imports nothing between reruns, so a module level instance is
+    shared by every session of the server. Entries are evicted, least recently
+    used first, once the estimated size of the cached learners exceeds `max_bytes`.
+    """
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (learner, nbytes)
+        self._lock = threading.Lock()
+        # key -> lock, so a model is only unpickled once. A lock is dropped as soon as
+        # no thread loading or running that model holds it anymore.
+        self._key_locks = weakref.WeakValueDictionary()
+
+    def get(self, key: str, loader):
+        """Returns the learner cached under `key`, calling `loader()` on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            key_lock = self._key_locks.setdefault(key, threading.RLock())
+
+        with key_lock:
+            # Another session may have loaded it while we were waiting
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+                self.misses += 1
+
+            learner = loader()
+            nbytes = learner_nbytes(learner)
+
+            with self._lock:
+                if nbytes <= self.max_bytes:
+                    self._entries[key] = (learner, nbytes)
+                    self.current_bytes += nbytes
+                    self.__evict()
+            return learner
+
+    @contextmanager
+    def lock(self, key: str):
+        """
+        Serializes inference on a shared learner. fastai stores the current
+        batch and predictions on the learner itself, so two sessions must not
+        run `predict`/`get_preds` on the same instance at the same time.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.RLock())
+        with key_lock:
+            yield
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_mb": self.current_bytes / 2**20,
+                "budget_mb": self.max_bytes / 2**20,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __evict(self) -> None:
+        # Caller holds self._lock
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+
+learner_cache = LearnerCache(LEARNER_CACHE_MB * 2**20)
+
+
+def load_learner_cached(source):
+    """
+    Loads a fastai learner through the shared cache.
+    `source` is either a path to a model.pkl or the bytes of an uploaded one.
+    Returns the cache key together with the learner.
+    """
+    from fastai.vision.all import load_learner
+
+    if isinstance(source, (bytes, bytearray)):
+        key = bytes_key(source)
+        return key, learner_cache.get(key, lambda: load_learner(io.BytesIO(source)))
+
+    key = path_key(source)
+    return key, learner_cache.get(key, lambda: load_learner(source))
+
+
+def load_model_cached(path, variant="fp32"):
+    """
+    Loads the model.pkl at `path` through the shared cache, using the fastai-free
+    runtime (components/runtime.py) when model.pt/model.json were exported next to it.
+    `variant` picks one of the networks built by components/optimize.py.
+    Returns the cache key together with the learner or InferenceModel.
+    """
+    from components.runtime import InferenceModel, SCRIPT_FILE, has_runtime, read_meta
+
+    model_dir = os.path.dirname(path)
+    if not has_runtime(model_dir):
+        return load_learner_cached(path)
+    file = SCRIPT_FILE if variant == "fp32" else read_meta(model_dir)["variants"][variant]["file"]
+    key = f"runtime:{variant}:" + path_key(os.path.join(model_dir, file))
+    return key, learner_cache.get(key, lambda: InferenceModel(model_dir, variant))
+
+
+class PredictionCache:
+    """
+    Persistent cache of spectrogram images and class probabilities.
+
+    Entries are keyed by (audio content, model, preprocessing version) and stored
+    as one .npz file each. A file's mtime is refreshed on every hit, so it works
+    both for the TTL and as the LRU order used when the disk budget is exceeded.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int, ttl_seconds: float) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._current_bytes = None  # computed lazily from the folder on first write
+
+    @staticmethod
+    def key(audio: bytes, model_key: str, preprocessing_version) -> str:
+        digest = hashlib.sha256()
+        digest.update(hashlib.sha256(audio).digest())
+        digest.update(model_key.encode())
+        digest.update(str(preprocessing_version).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """Returns (image, probs) or None on a miss or an expired entry."""
+        import numpy as np
+
+        path = self.__path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl_seconds:
+                self.__remove(path)
+                raise FileNotFoundError(path)
+            with np.load(path) as entry:
+                image, probs = entry["image"], entry["probs"]
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return (None if image.size == 0 else image), probs
+
+    def put(self, key: str, image, probs) -> None:
+        import numpy as np
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.__path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, image=np.zeros(0, np.uint8) if image is None else image, probs=np.asarray(probs, dtype=np.float32))
+
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)  # the entry is being overwritten
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)  # readers never see a half written entry
+            if self._current_bytes is None:
+                self._current_bytes = sum(e.stat().st_size for e in os.scandir(self.cache_dir) if e.name.endswith(".npz"))
+            else:
+                self._current_bytes += os.path.getsize(path) - replaced
+            if self._current_bytes > self.max_bytes:
+                self.__evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def __remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+            if self._current_bytes is not None:
+                self._current_bytes -= size
+
+    def __evict(self) -> None:
+        # Caller holds self._lock. Drops expired entries, then the least recently used ones.
+        entries = sorted(
+            (e for e in os.scandir(self.cache_dir) if e.name.endswith(".npz")),
+            key=lambda e: e.stat().st_mtime
+        )
+        now = time.time()
+        total = sum(e.stat().st_size for e in entries)
+        for entry in entries:
+            if total <= self.max_bytes and now - entry.stat().st_mtime <= self.ttl_seconds:
+                break
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            total -= entry.stat().st_size  # DirEntry caches its stat, still valid after removal
+            self.evictions += 1
+        self._current_bytes = total
+
+
+prediction_cache = PredictionCache(PREDICTION_CACHE_DIR, PREDICTION_CACHE_MB * 2**20, PREDICTION_CACHE_TTL_HOURS * 3600)
@@ -1,11 +1,200 @@
+"""
+Configuration files shared by every session of the server: config.yaml (users
+and cookie settings of streamlit-authenticator) and env.sh (datasets).
+
+Each file is parsed once and kept in memory. Reruns only check, at most every
+CHECK_SECONDS, whether the file changed on disk, and parse it again if so.
+"""
+import copy
 import os
 import re
+import threading
+import time
+import yaml
+
+CONFIG_PATH = "config.yaml"
+ENV_SH_PATH = "components/VoCoderRecognition/scripts/env.sh"
+CHECK_SECONDS = 2.0
+
+
+class CachedFile:
+    """Parsed content of a file (`parse(path)`), parsed again when its modification time or size change."""
+    def __init__(self, path, parse, check_seconds=CHECK_SECONDS) -> None:
+        self.path = path
+        self.parse = parse
+        self.check_seconds = check_seconds
+        self._lock = threading.RLock()
+        self._signature = False  # never read
+        self._value = None
+        self._checked = 0.0
+
+    def get(self):
+        if self._signature is not False and time.monotonic() - self._checked < self.check_seconds:
+            return self._value
+        with self._lock:
+            signature = self._stat()
+            if signature != self._signature:
+                self._value = self.parse(self.path)
+                self._signature = signature
+            self._checked = time.monotonic()
+            return self._value
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
+def _read_config(path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    # streamlit-authenticator lowercases the usernames of the credentials it's given
+    users = config["credentials"].get("usernames") or {}
+    config["credentials"]["usernames"] = {username.lower(): user for username, user in users.items()}
+    return config
+
+
+_DELETED = object()
+
+
+class SessionCredentials(dict):
+    """Credentials given to the authenticator of one session, with the users of config.yaml they were copied from."""
+    def __init__(self, credentials) -> None:
+        super().__init__(copy.deepcopy(credentials))
+        self.base = copy.deepcopy(credentials.get("usernames") or {})
+
+
+def _changed_fields(base, users) -> dict:
+    """
+    What a session changed since `base`: {username: {field: value}}, with
+    _DELETED for the removed fields, or _DELETED instead of the fields for a
+    removed user.
+    """
+    changes = {}
+    for username in base.keys() | users.keys():
+        old, new = base.get(username), users.get(username)
+        if old == new:
+            continue
+        if new is None:
+            changes[username] = _DELETED
+            continue
+        old = old or {}
+        changes[username] = {field: new.get(field, _DELETED) for field in old.keys() | new.keys()
+                             if old.get(field, _DELETED) != new.get(field, _DELETED)}
+    return changes
+
+
+def _apply_changes(saved, changes) -> None:
+    for username, fields in changes.items():
+        if fields is _DELETED:
+            saved.pop(username, None)
+            continue
+        user = saved.setdefault(username, {})
+        for field, value in fields.items():
+            if value is _DELETED:
+                user.pop(field, None)
+            else:
+                user[field] = copy.deepcopy(value)
+
 
-def load_env_from_sh(file_path='components/VoCoderRecognition/scripts/env.sh'):
+class CredentialsStore(CachedFile):
+    """
+    config.yaml for streamlit-authenticator. Pages build `stauth.Authenticate`
+    from `credentials()` and `settings()` instead of the file path, so reruns
+    don't read the file, and then call `save_credentials` to write back what the
+    widgets changed (registrations, password resets, login state).
+    """
+    def __init__(self, path=CONFIG_PATH) -> None:
+        super().__init__(path, _read_config)
+
+    def settings(self) -> dict:
+        """Arguments of `stauth.Authenticate` other than the credentials: the cookie and the api_key, if any."""
+        config = self.get()
+        cookie = config["cookie"]
+        settings = {"cookie_name": cookie["name"], "cookie_key": cookie["key"], "cookie_expiry_days": cookie["expiry_days"]}
+        if config.get("api_key"):
+            settings["api_key"] = config["api_key"]
+        return settings
+
+    def pre_authorized(self):
+        """
+        Emails allowed to register (`pre-authorized` section), None when anyone
+        can. The authenticator only reads them from config.yaml when given its path.
+        """
+        emails = (self.get().get("pre-authorized") or {}).get("emails")
+        return list(emails) if emails is not None else None
+
+    def credentials(self) -> SessionCredentials:
+        """A copy of the credentials, that the authenticator of one session may modify."""
+        return SessionCredentials(self.get()["credentials"])
+
+    def save_credentials(self, credentials) -> bool:
+        """
+        Writes to config.yaml the fields that the session changed in `credentials`
+        since it got them from `credentials()`, leaving everything else as it is
+        on disk, so sessions saving at the same time (or with an older copy) don't
+        undo each other's changes. Returns True when the file was written.
+        """
+        users = credentials.get("usernames") or {}
+        base = getattr(credentials, "base", None)
+        changes = _changed_fields(self.__users() if base is None else base, users)
+        if not changes:
+            return False
+
+        self.__update(lambda config: _apply_changes(config["credentials"]["usernames"], changes))
+        if base is not None:
+            credentials.base = copy.deepcopy(users)
+        return True
+
+    def remove_pre_authorized(self, email) -> bool:
+        """Removes the email of a user who just registered from the `pre-authorized` section."""
+        if email not in (self.pre_authorized() or []):
+            return False
+
+        def remove(config):
+            emails = config["pre-authorized"]["emails"]
+            if email in emails:
+                emails.remove(email)
+
+        self.__update(remove)
+        return True
+
+    def __update(self, change) -> None:
+        """Applies `change` to the config as it is on disk and writes it, under the lock and with an atomic replace."""
+        with self._lock:
+            self._checked = 0.0  # pick up changes made by other processes first
+            config = copy.deepcopy(self.get())
+            change(config)
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                yaml.dump(config, f, default_flow_style=False, allow_unicode=True)
+            os.replace(tmp_path, self.path)
+            self._value, self._signature, self._checked = config, self._stat(), time.monotonic()
+
+    def __users(self) -> dict:
+        return self.get()["credentials"].get("usernames") or {}
+
+
+credentials_store = CredentialsStore()
+_env_files = {}  # path -> CachedFile
+_env_lock = threading.Lock()
+
+
+def load_env_from_sh(file_path=ENV_SH_PATH):
     """
     Loads specific environment variables (SPEAKERS, NOISE_LEVEL_LIST)
-    from a given .sh file.
+    from a given .sh file. The file is only parsed again when it changes.
     """
+    with _env_lock:
+        if file_path not in _env_files:
+            _env_files[file_path] = CachedFile(file_path, _parse_env_sh)
+    return _env_files[file_path].get().values()
+
+
+def _parse_env_sh(file_path) -> dict:
     env_vars = {}
     if not os.path.exists(file_path):
         print(f"Warning: env.sh file not found at {file_path}. Using default empty lists.")
@@ -35,4 +224,4 @@ def load_env_from_sh(file_path='components/VoCoderRecognition/scripts/env.sh'):
         env_vars["NOISE_LEVEL_LIST"] = []
         print(f"Warning: NOISE_LEVEL_LIST not found in {file_path}. Using an empty list.")
 
-    return env_vars.values()
\ No newline at end of file
+    return env_vars
@@ -0,0 +1,67 @@
+"""
+Background warm-up of the Streamlit server, enabled with PREWARM=1.
+
+Pages import torch, fastai and librosa only when they need them, so the first
+visit to the Training or Evaluation page pays for those imports, and the first
+spectrogram for librosa's lazy initialization. `start_prewarm` does that work in
+a daemon thread as soon as app.py runs, and starts the fork server of the
+background trainings with the training modules already imported.
+"""
+import importlib
+import os
+import threading
+import time
+
+PREWARM = os.environ.get("PREWARM", "0") == "1"
+PREWARM_MODULES = [
+    "torch",
+    "fastai.vision.all",
+    "components.training",
+    "components.runtime",
+    "librosa",
+]
+
+prewarm_times = {}  # module (or step) -> seconds
+prewarm_done = threading.Event()
+_lock = threading.Lock()
+_thread = None
+
+
+def start_prewarm(modules=PREWARM_MODULES) -> None:
+    """Starts the warm-up once per process."""
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_prewarm, args=(modules,), name="prewarm", daemon=True)
+        _thread.start()
+
+
+def _timed(name, step) -> None:
+    start = time.perf_counter()
+    try:
+        step()
+    except Exception as e:
+        print(f"⚠️ Prewarm: {name} failed: {str(e)}", flush=True)
+    prewarm_times[name] = time.perf_counter() - start
+
+
+def _first_spectrogram() -> None:
+    import numpy as np
+    from components.spectrogram import SPEC_CONFIG, mel_image
+
+    t = np.arange(SPEC_CONFIG["sr"]) / SPEC_CONFIG["sr"]
+    mel_image(np.sin(2 * np.pi * 220 * t).astype(np.float32))
+
+
+def _prewarm(modules) -> None:
+    from components.jobs import job_queue
+
+    start = time.perf_counter()
+    _timed("training jobs fork server", job_queue.prewarm)
+    for module in modules:
+        _timed(module, lambda: importlib.import_module(module))
+    _timed("first spectrogram", _first_spectrogram)
+    prewarm_done.set()
+    print(f"✅ Prewarm done in {time.perf_counter() - start:.1f} s: " +
+          ", ".join(f"{name} {seconds:.2f} s" for name, seconds in prewarm_times.items()), flush=True)